@@ -0,0 +1,86 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# ASSIGNMENT: globally optimal assignment of raw observations to candidates (Hungarian method)
+#     the cost of each pair is capped at the maximum cost, and pairs that reach it count as unassigned
+#     plain Python, the matrices are small (a few observations against tens of candidates)
+
+
+# solve the assignment problem for a cost matrix with at most as many rows as columns, returns a column index for each row
+def Hungarian(costs):
+
+    n = len(costs)
+    m = len(costs[0])
+    infinity = float("inf")
+
+    # potentials, the row assigned to each column and the augmenting path (1-based, column 0 is the starting point)
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+
+    for i in range(1,n + 1):
+
+        # add row i and find the shortest augmenting path
+        p[0] = i
+        j0 = 0
+        minv = [infinity] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = infinity
+            j1 = 0
+            for j in range(1,m + 1):
+                if not used[j]:
+                    cur = costs[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(0,m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # flip the path
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+
+    result = [0] * n
+    for j in range(1,m + 1):
+        if p[j] != 0:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+# assign rows (observations) to columns (candidates) with minimal total cost, returns (row,column) pairs that cost less than max_cost
+def SolveAssignment(costs,max_cost):
+
+    if (len(costs) == 0) or (len(costs[0]) == 0):
+        return []
+
+    # cap the costs, so leaving a row unassigned is never worse than a far away match
+    capped = [[min(cost,max_cost) for cost in row] for row in costs]
+
+    # the Hungarian method needs at least as many columns as rows
+    if len(capped) <= len(capped[0]):
+        pairs = [(i,j) for i,j in enumerate(Hungarian(capped))]
+    else:
+        transposed = [list(column) for column in zip(*capped)]
+        pairs = [(i,j) for j,i in enumerate(Hungarian(transposed))]
+
+    return [(i,j) for (i,j) in pairs if costs[i][j] < max_cost]
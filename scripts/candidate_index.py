@@ -0,0 +1,85 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# CANDIDATE INDEX: uniform grid over the predicted positions of the candidates, to fuse raw observations without scanning them all
+#     the grid is rebuilt once per observation time, from the candidates extrapolated to that time
+#     the cell size follows the fuse distance, so a lookup only visits the 27 cells around the observation
+#     for saliency, the grid is built over the direction vectors, which lie on the unit sphere, so the cells act as angular buckets
+
+import math
+
+
+class GridIndex(object):
+
+
+    def __init__(self):
+
+        self.cell_size = 1.0 # size of a grid cell
+        self.cells = {} # (id,x,y,z) items by grid cell
+        self.ts = None # time the predicted positions are for, or None if the index needs rebuilding
+
+
+    # empty the index for a new observation time
+    def Clear(self,cell_size,ts):
+
+        if cell_size > 0.0:
+            self.cell_size = cell_size
+        self.cells = {}
+        self.ts = ts
+
+
+    # check if the index is valid for an observation time
+    def IsBuiltFor(self,ts):
+
+        return (self.ts is not None) and (self.ts == ts)
+
+
+    # mark the index for rebuilding (after the candidates were pruned)
+    def Invalidate(self):
+
+        self.ts = None
+
+
+    # get grid cell of a position
+    def Key(self,x,y,z):
+
+        return (int(math.floor(x / self.cell_size)),int(math.floor(y / self.cell_size)),int(math.floor(z / self.cell_size)))
+
+
+    # add a candidate at its predicted position
+    def Insert(self,item_id,x,y,z):
+
+        key = self.Key(x,y,z)
+        if key not in self.cells:
+            self.cells[key] = []
+        self.cells[key].append((item_id,x,y,z))
+
+
+    # find the candidate closest to a position, but closer than max_dist, returns (id,distance), or (None,max_dist) if there is none
+    def FindNearest(self,x,y,z,max_dist):
+
+        closest_id = None
+        closest_dist = max_dist
+        if max_dist <= 0.0:
+            return closest_id,closest_dist
+
+        reach = int(math.ceil(max_dist / self.cell_size))
+        kx,ky,kz = self.Key(x,y,z)
+        for cx in range(kx - reach,kx + reach + 1):
+            for cy in range(ky - reach,ky + reach + 1):
+                for cz in range(kz - reach,kz + reach + 1):
+                    key = (cx,cy,cz)
+                    if key not in self.cells:
+                        continue
+                    for (item_id,px,py,pz) in self.cells[key]:
+                        dx = x - px
+                        dy = y - py
+                        dz = z - pz
+                        d = math.sqrt(dx * dx + dy * dy + dz * dz)
+                        if d < closest_dist:
+                            closest_id = item_id
+                            closest_dist = d
+
+        return closest_id,closest_dist
@@ -0,0 +1,291 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# CANDIDATE TABLE: the numeric histories and regression sums of all candidates of one modality, in columnar NumPy arrays
+#     each candidate is a row, and its history is a compact ring of observations (time in seconds, then values)
+#     all rows have the same capacity, which doubles whenever a row is full, so no observation is ever dropped before it's
+#     pruned, and the results don't depend on the capacity
+#     the linear regression sums of each row are updated as observations come and go, relative to a per-row time origin
+#     confidence and prediction work on a list of rows at once, so a vision tick is a few array operations instead of a loop
+#     over the candidates
+#     each ring is in time order, so pruning a row is a binary search on its times, and only touches the removed observations
+#     a heap of the oldest observation time of each row tells which rows have expired observations at all, so pruning the
+#     table only touches those rows
+#     when the origin of a row gets too old, the sums of that row are rebuilt to keep them accurate
+#     the predictors are views on one row of a table
+
+import heapq
+import numpy
+
+
+# initial number of observations per row, the table doubles it whenever a row runs out
+HISTORY_CAPACITY = 64
+
+# initial number of rows, the table doubles whenever it runs out
+TABLE_ROWS = 16
+
+# age of a row's time origin after which its sums are rebuilt (sec.)
+REBASE_TIME = 60.0
+
+# fraction of the sum of squared times below which the spread in time is considered 0
+DEGENERATE_FRACTION = 1e-9
+
+
+class CandidateTable(object):
+
+
+    def __init__(self,columns,capacity=HISTORY_CAPACITY,rows=TABLE_ROWS):
+
+        self.columns = columns # number of values per observation
+        self.capacity = capacity # number of observations per row
+        self.rows = 0 # number of allocated rows
+        self.free = [] # rows that are not in use
+        self.keys = [] # candidate ID of each row
+        self.expiry = [] # heap of (time of the oldest observation,row), with outdated entries for rows that changed since
+
+        self.history = numpy.zeros((0,capacity,columns + 1)) # time and values of each observation of each row
+        self.start = numpy.zeros(0,dtype=numpy.int64) # index of the oldest observation of each row
+        self.count = numpy.zeros(0,dtype=numpy.int64) # number of observations of each row
+
+        self.origin = numpy.zeros(0) # time origin of each row
+        self.sum_s = numpy.zeros(0) # sums of times
+        self.sum_ss = numpy.zeros(0) # sums of times squared
+        self.sum_f = numpy.zeros((0,columns)) # sums of values
+        self.sum_fs = numpy.zeros((0,columns)) # sums of values times time
+
+        self.Grow(rows)
+
+
+    # make room for more rows
+    def Grow(self,rows):
+
+        extra = rows - self.rows
+        self.history = numpy.concatenate((self.history,numpy.zeros((extra,self.capacity,self.columns + 1))))
+        self.start = numpy.concatenate((self.start,numpy.zeros(extra,dtype=numpy.int64)))
+        self.count = numpy.concatenate((self.count,numpy.zeros(extra,dtype=numpy.int64)))
+        self.origin = numpy.concatenate((self.origin,numpy.zeros(extra)))
+        self.sum_s = numpy.concatenate((self.sum_s,numpy.zeros(extra)))
+        self.sum_ss = numpy.concatenate((self.sum_ss,numpy.zeros(extra)))
+        self.sum_f = numpy.concatenate((self.sum_f,numpy.zeros((extra,self.columns))))
+        self.sum_fs = numpy.concatenate((self.sum_fs,numpy.zeros((extra,self.columns))))
+        self.keys.extend([None] * extra)
+
+        # hand out the lowest rows first
+        self.free.extend(range(rows - 1,self.rows - 1,-1))
+        self.rows = rows
+
+
+    # get an empty row for a new candidate
+    def Allocate(self,key=None):
+
+        if len(self.free) == 0:
+            self.Grow(2 * self.rows)
+        row = self.free.pop()
+        self.keys[row] = key
+        self.start[row] = 0
+        self.Clear(row)
+        return row
+
+
+    # give back the row of a candidate that is removed
+    def Free(self,row):
+
+        self.keys[row] = None
+        self.Clear(row)
+        self.free.append(row)
+
+
+    # move a row to another table (for instance to switch between regression and Kalman filtering), returns the new row
+    def MoveRow(self,row,table):
+
+        new_row = table.Allocate(self.keys[row])
+        for sample in self.Samples(row):
+            table.Append(new_row,sample[0],sample[1:])
+        self.Free(row)
+        return new_row
+
+
+    # forget all observations of a row
+    def Clear(self,row):
+
+        self.count[row] = 0
+        self.origin[row] = 0.0
+        self.sum_s[row] = 0.0
+        self.sum_ss[row] = 0.0
+        self.sum_f[row] = 0.0
+        self.sum_fs[row] = 0.0
+
+
+    # number of observations of one row, or of an array of rows
+    def Count(self,rows):
+
+        return self.count[rows]
+
+
+    # get the observations of a row as an array, oldest first
+    def Samples(self,row):
+
+        indices = (self.start[row] + numpy.arange(0,self.count[row])) % self.capacity
+        return self.history[row,indices]
+
+
+    # add (sign = 1.0) or remove (sign = -1.0) an observation to the sums of a row
+    def Accumulate(self,row,sample,sign):
+
+        s = sample[0] - self.origin[row]
+        self.sum_s[row] += sign * s
+        self.sum_ss[row] += sign * s * s
+        self.sum_f[row] += sign * sample[1:]
+        self.sum_fs[row] += sign * s * sample[1:]
+
+
+    # rebuild the sums of a row, with the oldest observation as origin
+    def Rebase(self,row):
+
+        samples = self.Samples(row)
+        s = samples[:,0] - samples[0,0]
+        self.origin[row] = samples[0,0]
+        self.sum_s[row] = numpy.sum(s)
+        self.sum_ss[row] = numpy.sum(s * s)
+        self.sum_f[row] = numpy.sum(samples[:,1:],axis=0)
+        self.sum_fs[row] = numpy.dot(s,samples[:,1:])
+
+
+    # make room for more observations per row, the rings are unrolled so each row starts at index 0
+    def GrowCapacity(self,capacity):
+
+        indices = (self.start[:,numpy.newaxis] + numpy.arange(0,self.capacity)[numpy.newaxis,:]) % self.capacity
+        history = numpy.zeros((self.rows,capacity,self.columns + 1))
+        history[:,0:self.capacity] = self.history[numpy.arange(0,self.rows)[:,numpy.newaxis],indices]
+        self.history = history
+        self.start[:] = 0
+        self.capacity = capacity
+
+
+    # add an observation to a row
+    def Append(self,row,t,values):
+
+        if self.count[row] == self.capacity:
+            self.GrowCapacity(2 * self.capacity)
+
+        if self.count[row] == 0:
+            self.Clear(row)
+            self.origin[row] = t
+            heapq.heappush(self.expiry,(t,row))
+
+        sample = self.history[row,(self.start[row] + self.count[row]) % self.capacity]
+        sample[0] = t
+        sample[1:] = values
+        self.count[row] += 1
+        self.Accumulate(row,sample,1.0)
+
+
+    # remove the observations from before a time from a row, returns the number of removed observations
+    def PruneRow(self,row,t):
+
+        count = self.count[row]
+        if count == 0:
+            return 0
+
+        # the ring is in time order, so search the part up to the end of the array, and then the part that wrapped around
+        start = self.start[row]
+        end = start + count
+        n = numpy.searchsorted(self.history[row,start:min(end,self.capacity),0],t)
+        if (n == min(end,self.capacity) - start) and (end > self.capacity):
+            n += numpy.searchsorted(self.history[row,0:end - self.capacity,0],t)
+        if n == 0:
+            return 0
+
+        samples = self.history[row,(start + numpy.arange(0,n)) % self.capacity]
+        self.start[row] = (start + n) % self.capacity
+        self.count[row] -= n
+
+        # clear the row if it's empty now, or take the old observations out of the sums
+        if self.count[row] == 0:
+            self.Clear(row)
+        else:
+            self.Forget(row,samples)
+            heapq.heappush(self.expiry,(self.history[row,self.start[row],0],row))
+
+        return int(n)
+
+
+    # take pruned observations out of the sums of a row, or rebuild the sums if the origin got too old
+    def Forget(self,row,samples):
+
+        if self.history[row,self.start[row],0] - self.origin[row] > REBASE_TIME:
+            self.Rebase(row)
+            return
+
+        s = samples[:,0] - self.origin[row]
+        self.sum_s[row] -= numpy.sum(s)
+        self.sum_ss[row] -= numpy.dot(s,s)
+        self.sum_f[row] -= numpy.sum(samples[:,1:],axis=0)
+        self.sum_fs[row] -= numpy.dot(s,samples[:,1:])
+
+
+    # remove the observations from before a time from all given rows, returns the number of removed observations of each row
+    def PruneBefore(self,rows,t):
+
+        return numpy.array([self.PruneRow(row,t) for row in rows],dtype=numpy.int64)
+
+
+    # remove the observations from before a time from the whole table, returns the rows that lost observations, and how many
+    def Expire(self,t):
+
+        rows = []
+        removed = []
+        while (len(self.expiry) > 0) and (self.expiry[0][0] < t):
+            oldest,row = heapq.heappop(self.expiry)
+
+            # outdated entries (the row was pruned, dropped an observation or was freed since) find nothing to remove
+            n = self.PruneRow(row,t)
+            if n > 0:
+                rows.append(row)
+                removed.append(n)
+
+        return rows,removed
+
+
+    # confidence of each given row: the sum of one value over the last full_points observations, divided by full_points
+    # (a row never has more observations than the capacity, so looking further back than that only finds nothing)
+    def Confidence(self,rows,column,full_points):
+
+        rows = numpy.asarray(rows,dtype=numpy.int64)
+
+        back = numpy.arange(0,min(full_points,self.capacity))
+        indices = (self.start[rows,numpy.newaxis] + self.count[rows,numpy.newaxis] - 1 - back[numpy.newaxis,:]) % self.capacity
+        values = self.history[rows[:,numpy.newaxis],indices,1 + column]
+        values = numpy.where(back[numpy.newaxis,:] < self.count[rows,numpy.newaxis],values,0.0)
+
+        return numpy.sum(values,axis=1) / float(full_points)
+
+
+    # values of each given row at a time, returns the values and which rows were actually regressed
+    # (without regression, or with less than 2 different times, this is the latest observation)
+    def Predict(self,rows,t,regress):
+
+        rows = numpy.asarray(rows,dtype=numpy.int64)
+
+        latest = self.history[rows,(self.start[rows] + self.count[rows] - 1) % self.capacity,1:]
+        if not regress:
+            return latest,numpy.zeros(len(rows),dtype=bool)
+
+        # the denominator doesn't depend on the time origin, and is only 0 if all times are the same (allowing for the
+        # rounding errors of removed observations)
+        n = self.count[rows].astype(numpy.float64)
+        sum_s = self.sum_s[rows]
+        sum_ss = self.sum_ss[rows]
+        den = n * sum_ss - sum_s * sum_s
+        regressed = (n >= 2.0) & (den > DEGENERATE_FRACTION * n * sum_ss)
+
+        # linear regression from the running sums
+        n = numpy.maximum(n,1.0)
+        den = numpy.where(regressed,den,1.0)
+        mean_s = sum_s / n
+        slope = (n[:,numpy.newaxis] * self.sum_fs[rows] - sum_s[:,numpy.newaxis] * self.sum_f[rows]) / den[:,numpy.newaxis]
+        values = self.sum_f[rows] / n[:,numpy.newaxis] + slope * (t - self.origin[rows] - mean_s)[:,numpy.newaxis]
+
+        return numpy.where(regressed[:,numpy.newaxis],values,latest),regressed
@@ -0,0 +1,181 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# COMPOSED VISION: run the whole vision chain of one camera in one process
+#     VisionPipeline, DetectFacesHaar, DetectHands, DetectSaliencyIttiKoch and FaceAnalysisOpenBiometrics run side by
+#     side, with the same topics and parameters as the separate nodes
+#     the topics between them (raw faces, thumbnails, hands, saliency vectors, face requests and responses, and the
+#     predicted face regions) are passed through in-process queues by reference, so nothing is serialized
+#     each of those subscribers gets its own queue and thread, like it would in rospy, and a full queue drops the oldest
+#     message; the queues have the queue sizes of the subscribers
+#     the in-process topics are still published on ROS when a tool subscribes to them
+#     all other topics (camera frames, candidates, statistics, markers, ...) are ordinary ROS topics, so the three
+#     detectors also share one camera subscription
+
+# the node should be called 'vision_pipeline', and replaces the 'detect_faces', 'detect_hands', 'detect_saliency',
+# 'face_analysis' and 'vision_pipeline' nodes of its camera
+
+from __future__ import with_statement
+import rospy
+import traceback
+from collections import deque
+from threading import Lock,Thread,Condition
+from local_bus import LocalBus,LocalPublisher,LocalSubscriber
+from vision_pipeline import VisionPipeline
+from detect_faces_haar import DetectFacesHaar
+from detect_hands import DetectHands
+from detect_saliency_ittikoch import DetectSaliencyIttiKoch
+from face_analysis_openbr import FaceAnalysisOpenBiometrics
+
+
+# topics in the local namespace that are passed in-process
+LOCAL_TOPICS = ["raw_face","raw_face_thumb","raw_hand","raw_saliency","face_request","face_response","face_regions"]
+
+# the real rospy publisher and subscriber
+RealPublisher = rospy.Publisher
+RealSubscriber = rospy.Subscriber
+
+
+# queue and thread that deliver the messages of one in-process subscriber
+class Delivery(object):
+
+
+    def __init__(self,callback,queue_size):
+
+        self.callback = callback
+        self.arrived = Condition(Lock())
+        self.queue = deque(maxlen=queue_size) # waiting messages, the oldest is dropped when full
+        self.thread = Thread(target=self.Run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    # (publisher) queue a message
+    def __call__(self,msg):
+
+        with self.arrived:
+            self.queue.append(msg)
+            self.arrived.notify()
+
+
+    # (delivery thread) call the subscriber for each message, a failing callback is logged and delivery goes on
+    def Run(self):
+
+        while True:
+            with self.arrived:
+                while len(self.queue) == 0:
+                    self.arrived.wait(1.0)
+                msg = self.queue.popleft()
+            try:
+                self.callback(msg)
+            except Exception:
+                rospy.logerr("bad callback: {}\n{}".format(self.callback,traceback.format_exc()))
+
+
+# local bus with real ROS names, that delivers on the subscribers' threads
+class ComposedBus(LocalBus):
+
+
+    def __init__(self,topics):
+
+        LocalBus.__init__(self)
+        self.lock = Lock()
+        self.topics = set(topics) # absolute names of the in-process topics
+
+
+    def Resolve(self,name):
+
+        return rospy.names.resolve_name(name)
+
+
+    def Publish(self,topic,msg):
+
+        with self.lock:
+            self.published[topic] = self.published.get(topic,0) + 1
+        for deliver in self.subscribers.get(topic,[]):
+            deliver(msg)
+
+
+# publisher that passes in-process topics by reference, and only serializes them when a tool listens
+class ComposedPublisher(object):
+
+
+    def __init__(self,bus,name,data_class,*args,**kwargs):
+
+        self.real = RealPublisher(name,data_class,*args,**kwargs)
+        self.local = None
+        if bus.Resolve(name) in bus.topics:
+            self.local = LocalPublisher(bus,name,data_class)
+
+
+    def publish(self,msg):
+
+        if self.local is None:
+            self.real.publish(msg)
+            return
+        self.local.publish(msg)
+        if self.real.get_num_connections() > 0:
+            self.real.publish(msg)
+
+
+    def get_num_connections(self):
+
+        if self.local is None:
+            return self.real.get_num_connections()
+        return self.local.get_num_connections() + self.real.get_num_connections()
+
+
+    def unregister(self):
+
+        self.real.unregister()
+
+
+# subscriber that gets in-process topics from the bus, and everything else from ROS
+class ComposedSubscriber(object):
+
+
+    def __init__(self,bus,name,data_class,callback=None,*args,**kwargs):
+
+        self.real = None
+        self.local = None
+        if bus.Resolve(name) in bus.topics:
+            self.local = LocalSubscriber(bus,name,data_class,Delivery(callback,kwargs.get("queue_size")))
+        else:
+            self.real = RealSubscriber(name,data_class,callback,*args,**kwargs)
+
+
+    def unregister(self):
+
+        if self.local is not None:
+            self.local.unregister()
+        else:
+            self.real.unregister()
+
+
+class ComposedVision(object):
+
+
+    # constructor
+    def __init__(self):
+
+        # route the topics between the nodes through the bus
+        namespace = rospy.get_namespace()
+        self.bus = ComposedBus([namespace + topic for topic in LOCAL_TOPICS])
+        rospy.Publisher = lambda *args,**kwargs: ComposedPublisher(self.bus,*args,**kwargs)
+        rospy.Subscriber = lambda *args,**kwargs: ComposedSubscriber(self.bus,*args,**kwargs)
+
+        # start the vision pipeline first, it has the parameter server the others connect to
+        self.pipeline = VisionPipeline()
+        self.detect_faces = DetectFacesHaar(namespace)
+        self.detect_hands = DetectHands()
+        self.detect_saliency = DetectSaliencyIttiKoch(namespace)
+        self.face_analysis = FaceAnalysisOpenBiometrics()
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('vision_pipeline')
+    node = ComposedVision()
+    rospy.spin()
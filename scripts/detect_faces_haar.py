@@ -7,7 +7,19 @@
 
 # FACE DETECTION: analyze camera frame and output all found faces at a configurable rate
 #     the camera is a ROS USB camera node under 'camera' in the local namespace
+#     alternatively, the unrotated work image comes from the 'preprocess_frames' node via 'face_image' in the local namespace
+#     or, with shared memory transport, the frame is mapped from the ring that 'preprocess_frames' announces via 'frame_slot'
 #     the raw faces are published to 'raw_face' in the local namespace
+#     face thumbnails are cut out of the full-size frame (unless only the work image is available)
+#     with asynchronous thumbnails, the raw faces are published without thumbnail, and the thumbnails are made by a small
+#     worker pool and follow on 'raw_face_thumb' in the local namespace
+#     in tracking mode, the predicted faces from 'face_regions' in the local namespace are searched at face detection rate,
+#     and the whole image only at face discovery rate
+#     with the rate governor, the face detection rate follows the detection cost and the movement of the predicted faces,
+#     and its decisions are published to 'governor' in the local namespace
+#     in event-driven mode, detection runs when a new frame arrives, but not faster than the face detection rate
+#     the raw faces carry the capture time of their camera frame, and the latency percentiles of receiving, decoding
+#     and detecting a frame and publishing its faces are published to 'latency' in the local namespace
 #     parameter updates are gathered from the 'vision_pipeline' parameter server
 
 # HAAR: faces are detected using OpenCV Haar cascades
@@ -21,80 +33,239 @@ import numpy
 import time
 import cv2
 import math
+import traceback
 import dynamic_reconfigure.client
 from sensor_msgs.msg import Image
-from r2_perception.msg import Face,Float32XYZ
-from cv_bridge import CvBridge
-from threading import Lock
-
-
-# create OpenCV-ROS bridge object
-opencv_bridge = CvBridge()
+from r2_perception.msg import Face,Float32XYZ,FrameSlot,DetectorStats,FaceRegions,GovernorDecision,FaceThumb,LatencyReport
+from frame_preprocessor import FramePreprocessor,opencv_bridge
+from frame_ring import FrameRing
+from frame_handoff import FrameHandoff
+from rate_governor import RateGovernor
+from latency_stats import LatencyStats,CaptureTime
+from multiprocessing.pool import ThreadPool
+from threading import Lock,Thread,local
 
 
 # Generate unique serial number for the raw faces 
 serial_number = 0
+serial_lock = Lock()
 
 def GenerateFaceID():
     global serial_number
-    result = serial_number
-    serial_number += 1
+    with serial_lock:
+        result = serial_number
+        serial_number += 1
     return result
 
 
+# Haar cascades of the detector host's pool workers, one per worker thread
+worker_cascades = local()
+
+def GetWorkerCascade(filename):
+    if getattr(worker_cascades,"filename",None) != filename:
+        worker_cascades.filename = filename
+        worker_cascades.cascade = cv2.CascadeClassifier(filename)
+    return worker_cascades.cascade
+
+
+# resize a face crop to a thumbnail and convert it from OpenCV to ROS
+def EncodeThumb(crop,width,height):
+
+    return opencv_bridge.cv2_to_imgmsg(cv2.resize(crop,(width,height)),encoding="8UC3")
+
+
+# convert a normalized face rectangle (center and size in -1..1 coordinates) to a pixel rectangle
+def RegionToRect(region,width,height):
+
+    w = 0.5 * region.size.x * float(width)
+    h = 0.5 * region.size.y * float(height)
+    x = 0.5 * (region.origin.x + 1.0) * float(width) - 0.5 * w
+    y = 0.5 * (region.origin.y + 1.0) * float(height) - 0.5 * h
+    return (int(x),int(y),int(w),int(h))
+
+
+# latency stages of the face detector
+LATENCY_STAGES = ["receive","decode","detect","publish"]
+
+
+# activity of predicted faces that are present but don't move (keeps enough face detections for full confidence)
+PRESENT_FACE_ACTIVITY = 0.5
+
+
+# scene activity from the predicted faces: faces appearing or disappearing is fully active, otherwise it depends on how far they moved
+def GetRegionActivity(regions,last_regions,move_distance):
+
+    if len(regions) != len(last_regions):
+        return 1.0
+    if len(regions) == 0:
+        return 0.0
+    move = 0.0
+    for region,last_region in zip(regions,last_regions):
+        move = max(move,abs(region.origin.x - last_region.origin.x),abs(region.origin.y - last_region.origin.y))
+    if move >= move_distance:
+        return 1.0
+    return max(PRESENT_FACE_ACTIVITY,move / move_distance)
+
+
+# detect faces only in padded regions around predicted face rectangles
+def DetectFacesInRects(cascade,image,rects,padding,scale_factor,min_size):
+
+    height = image.shape[0]
+    width = image.shape[1]
+    faces = []
+    for (rx,ry,rw,rh) in rects:
+
+        # pad the region and clip it to the image
+        px = int(padding * float(rw))
+        py = int(padding * float(rh))
+        x0 = max(rx - px,0)
+        y0 = max(ry - py,0)
+        x1 = min(rx + rw + px,width)
+        y1 = min(ry + rh + py,height)
+        if (x1 - x0 < min_size[0]) or (y1 - y0 < min_size[1]):
+            continue
+
+        # detect faces in the region
+        found = cascade.detectMultiScale(image[y0:y1,x0:x1],scaleFactor=scale_factor,minSize=min_size,flags=cv2.cv.CV_HAAR_SCALE_IMAGE)
+        for (x,y,w,h) in found:
+
+            # regions can overlap, so skip faces that were already found in another region
+            cx = x0 + x + w / 2
+            cy = y0 + y + h / 2
+            duplicate = False
+            for (fx,fy,fw,fh) in faces:
+                if (cx >= fx) and (cx < fx + fw) and (cy >= fy) and (cy < fy + fh):
+                    duplicate = True
+                    break
+            if not duplicate:
+                faces.append((x0 + x,y0 + y,w,h))
+
+    return faces
+
+
 class DetectFacesHaar(object):
 
 
     # constructor
-    def __init__(self):
+    def __init__(self,namespace=None,pool=None):
 
         # create lock
         self.lock = Lock()
 
+        # get camera namespace (the local namespace, unless running in a detector host)
+        if namespace is None:
+            namespace = rospy.get_namespace()
+        self.namespace = namespace
+
+        # when running in a detector host, detection is done by the host's worker pool
+        self.pool = pool
+        self.pending = False
+
         # start possible debug window
         cv2.startWindowThread()
 
-        # initialize current frame and timestamp
-        self.cur_frame = Image()
-        self.cur_ts = 0.0
+        # create frame handoff between subscriber and timer
+        self.handoff = FrameHandoff()
 
         # get pipeline name
-        self.name = rospy.get_namespace().split('/')[-2]
+        self.name = self.namespace.split('/')[-2]
 
         # get fixed parameters
         self.thumb_width = rospy.get_param("/thumb_width")
         self.thumb_height = rospy.get_param("/thumb_height")
+        self.async_thumbs_flag = rospy.get_param("/async_thumbs_flag",False)
+        self.thumb_workers = rospy.get_param("/thumb_workers",1)
+        if self.async_thumbs_flag:
+            self.thumb_pool = ThreadPool(self.thumb_workers)
 
         self.haar_cascade_filename = rospy.get_param("/haar_cascade_filename")
-        self.face_cascade = cv2.CascadeClassifier(self.haar_cascade_filename)
+        if self.pool is None:
+            self.face_cascade = cv2.CascadeClassifier(self.haar_cascade_filename)
+
+        self.preprocess_frames_flag = rospy.get_param("/preprocess_frames_flag",False)
+        self.detector_stats_period = rospy.get_param("/detector_stats_period",1.0)
+        self.shm_transport_flag = rospy.get_param("/shm_transport_flag",False)
+        self.event_driven_flag = rospy.get_param("/event_driven_flag",False)
+        if self.shm_transport_flag:
+            self.frame_ring = FrameRing(self.namespace)
+
+        self.latency_report_period = rospy.get_param("/latency_report_period",1.0)
+        self.latency_window = rospy.get_param("/latency_window",1000)
+        self.latency_dump_flag = rospy.get_param("/latency_dump_flag",False)
+        self.latency_dump_dir = rospy.get_param("/latency_dump_dir","/tmp")
+        self.latency = LatencyStats("detect_faces",LATENCY_STAGES,self.latency_window)
 
         # get dynamic parameters
-        self.debug_face_detect_flag = rospy.get_param("debug_face_detect_flag")
+        self.debug_face_detect_flag = rospy.get_param(self.namespace + "debug_face_detect_flag")
         if self.debug_face_detect_flag:
             cv2.namedWindow(self.name + " faces")
 
-        self.face_height = rospy.get_param("face_height")
+        self.face_height = rospy.get_param(self.namespace + "face_height")
+
+        self.fovy = rospy.get_param(self.namespace + "fovy")
+        self.aspect = rospy.get_param(self.namespace + "aspect")
+        self.rotate = rospy.get_param(self.namespace + "rotate")
+        self.preprocessor = FramePreprocessor(self.rotate)
+
+        self.face_detect_rate = rospy.get_param(self.namespace + "face_detect_rate")
+        self.face_detect_min_rate = rospy.get_param(self.namespace + "face_detect_min_rate")
 
-        self.fovy = rospy.get_param("fovy")
-        self.aspect = rospy.get_param("aspect")
-        self.rotate = rospy.get_param("rotate")
+        self.governor_flag = rospy.get_param(self.namespace + "governor_flag")
+        self.governor_load = rospy.get_param(self.namespace + "governor_load")
+        self.governor_hold_time = rospy.get_param(self.namespace + "governor_hold_time")
+        self.governor_move_distance = rospy.get_param(self.namespace + "governor_move_distance")
+        self.governor = RateGovernor(self.face_detect_min_rate,self.face_detect_rate,self.governor_load,self.governor_hold_time)
 
-        self.face_detect_rate = rospy.get_param("face_detect_rate")
-        self.timer = rospy.Timer(rospy.Duration(1.0 / self.face_detect_rate),self.HandleTimer)
+        self.timer_rate = self.GetTimerRate()
+        self.timer = None
+        if not self.event_driven_flag:
+            self.timer = rospy.Timer(rospy.Duration(1.0 / self.timer_rate),self.HandleTimer)
 
-        self.face_detect_work_width = rospy.get_param("face_detect_work_width")
-        self.face_detect_work_height = rospy.get_param("face_detect_work_height")
+        self.face_detect_work_width = rospy.get_param(self.namespace + "face_detect_work_width")
+        self.face_detect_work_height = rospy.get_param(self.namespace + "face_detect_work_height")
 
-        self.haar_scale_factor = rospy.get_param("haar_scale_factor")
-        self.haar_min_width = rospy.get_param("haar_min_width")
-        self.haar_min_height = rospy.get_param("haar_min_height")
+        self.haar_scale_factor = rospy.get_param(self.namespace + "haar_scale_factor")
+        self.haar_min_width = rospy.get_param(self.namespace + "haar_min_width")
+        self.haar_min_height = rospy.get_param(self.namespace + "haar_min_height")
+
+        self.face_tracking_flag = rospy.get_param(self.namespace + "face_tracking_flag")
+        self.face_discovery_rate = rospy.get_param(self.namespace + "face_discovery_rate")
+        self.face_track_padding = rospy.get_param(self.namespace + "face_track_padding")
+
+        # initialize predicted face regions, the ones at the previous detection and time of the last full image search
+        self.face_regions = []
+        self.last_face_regions = []
+        self.last_discovery_ts = 0.0
 
         # start dynamic reconfigure client from vision_pipeline
-        self.dynparam = dynamic_reconfigure.client.Client("vision_pipeline",timeout=30,config_callback=self.HandleConfig)
+        self.dynparam = dynamic_reconfigure.client.Client(self.namespace + "vision_pipeline",timeout=30,config_callback=self.HandleConfig)
 
         # start subscriber and publisher
-        self.image_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleImage)
-        self.face_pub = rospy.Publisher("raw_face",Face,queue_size=5)
+        if self.shm_transport_flag:
+            self.image_sub = rospy.Subscriber(self.namespace + "frame_slot",FrameSlot,self.HandleImage)
+        elif self.preprocess_frames_flag:
+            self.image_sub = rospy.Subscriber(self.namespace + "face_image",Image,self.HandleImage)
+        else:
+            self.image_sub = rospy.Subscriber(self.namespace + "camera/image_raw",Image,self.HandleImage)
+        self.face_pub = rospy.Publisher(self.namespace + "raw_face",Face,queue_size=5)
+        if self.async_thumbs_flag:
+            self.face_thumb_pub = rospy.Publisher(self.namespace + "raw_face_thumb",FaceThumb,queue_size=5)
+        self.governor_pub = rospy.Publisher(self.namespace + "governor",GovernorDecision,queue_size=5)
+        self.face_regions_sub = rospy.Subscriber(self.namespace + "face_regions",FaceRegions,self.HandleFaceRegions)
+
+        # start publishing detector statistics
+        self.stats_pub = rospy.Publisher(self.namespace + "detector_stats",DetectorStats,queue_size=5)
+        self.stats_timer = rospy.Timer(rospy.Duration(self.detector_stats_period),self.HandleStatsTimer)
+
+        # start publishing latency percentiles
+        self.latency_pub = rospy.Publisher(self.namespace + "latency",LatencyReport,queue_size=5)
+        self.latency_timer = rospy.Timer(rospy.Duration(self.latency_report_period),self.HandleLatencyTimer)
+
+        # in event-driven mode, detect when new frames arrive instead of at face detection rate
+        if self.event_driven_flag:
+            self.event_thread = Thread(target=self.RunEvents)
+            self.event_thread.daemon = True
+            self.event_thread.start()
 
 
     # when a dynamic reconfigure update occurs
@@ -114,11 +285,21 @@ class DetectFacesHaar(object):
         self.aspect = data.aspect
         self.rotate = data.rotate
 
-        new_face_detect_rate = data.face_detect_rate
-        if new_face_detect_rate != self.face_detect_rate:
-            self.face_detect_rate = new_face_detect_rate
-            self.timer.shutdown()
-            self.timer = rospy.Timer(rospy.Duration(1.0 / self.face_detect_rate),self.HandleTimer)            
+        self.face_detect_rate = data.face_detect_rate
+        self.face_detect_min_rate = data.face_detect_min_rate
+
+        # the governor and the timer are also changed by Govern on the detection thread
+        with self.lock:
+
+            self.governor_flag = data.governor_flag
+            self.governor_load = data.governor_load
+            self.governor_hold_time = data.governor_hold_time
+            self.governor_move_distance = data.governor_move_distance
+            self.governor.SetBounds(self.face_detect_min_rate,self.face_detect_rate,self.governor_load,self.governor_hold_time)
+
+            new_timer_rate = self.GetTimerRate()
+            if new_timer_rate != self.timer_rate:
+                self.RestartTimer(new_timer_rate)
 
         self.face_detect_work_width = data.face_detect_work_width
         self.face_detect_work_height = data.face_detect_work_height
@@ -127,63 +308,246 @@ class DetectFacesHaar(object):
         self.haar_min_width = data.haar_min_width
         self.haar_min_height = data.haar_min_height
 
+        self.face_tracking_flag = data.face_tracking_flag
+        self.face_discovery_rate = data.face_discovery_rate
+        self.face_track_padding = data.face_track_padding
+
+
+    # the face detection rate, either fixed or from the rate governor
+    def GetTimerRate(self):
+
+        if self.governor_flag:
+            return self.governor.rate
+        return self.face_detect_rate
+
+
+    # restart the face detection timer at a new rate
+    def RestartTimer(self,rate):
+
+        self.timer_rate = rate
+
+        # in event-driven mode, the rate only sets the minimum interval between detections
+        if self.event_driven_flag:
+            return
+
+        self.timer.shutdown()
+        self.timer = rospy.Timer(rospy.Duration(1.0 / self.timer_rate),self.HandleTimer)
+
+
+    # let the rate governor account for a detection and follow its decision
+    def Govern(self,cost,activity,cur_ts):
+
+        # if the frame wasn't used, or there is no governor, exit
+        if (activity is None) or not self.governor_flag:
+            return
+
+        with self.lock:
+
+            self.governor.Measure(cost,activity,cur_ts.to_sec())
+            if not self.governor.Update():
+                return
+
+            msg = GovernorDecision()
+            msg.detector = "faces"
+            msg.ts = cur_ts
+            self.governor.FillDecision(msg)
+            self.governor_pub.publish(msg)
+
+            self.RestartTimer(self.governor.rate)
+
 
     # when a new camera image arrives
     def HandleImage(self,data):
 
-        with self.lock:
+        # hand over the image and timestamp to the timer
+        self.handoff.Put(data,rospy.get_rostime())
+
+
+    # when new predicted face regions arrive
+    def HandleFaceRegions(self,data):
+
+        # just keep the newest ones
+        self.face_regions = data.rects
 
-            # copy the image and update the timestamp
-            self.cur_image = data
-            self.cur_ts = rospy.get_rostime()
+
+    # at detector statistics rate
+    def HandleStatsTimer(self,event):
+
+        msg = DetectorStats()
+        msg.detector = "faces"
+        msg.ts = rospy.get_rostime()
+        self.handoff.FillStats(msg)
+        self.stats_pub.publish(msg)
+
+
+    # at latency report rate
+    def HandleLatencyTimer(self,event):
+
+        msg = LatencyReport()
+        msg.ts = rospy.get_rostime()
+        self.latency.FillReport(msg)
+        self.latency_pub.publish(msg)
+        if self.latency_dump_flag:
+            self.latency.Dump(msg,self.latency_dump_dir + "/" + self.name + "_detect_faces.csv")
 
 
     # at face detection rate
     def HandleTimer(self,data):
 
+        # with a worker pool, never queue more than one detection per camera (the frame stays for the next tick)
+        if (self.pool is not None) and self.pending:
+            return
+
+        # take the newest frame, but only if it wasn't processed yet (the frame lock is only held to swap it out)
+        cur_image,cur_ts = self.handoff.Take()
+
+        # if no new image is available, exit
+        if cur_image is None:
+            return
+
+        # with a worker pool, detect there
+        if self.pool is not None:
+            self.pending = True
+            self.pool.apply_async(self.DetectPending,(cur_image,cur_ts))
+            return
+
+        start = time.time()
+        activity = self.Detect(cur_image,cur_ts)
+        self.Govern(time.time() - start,activity,cur_ts)
+
+
+    # (event thread) detect faces when a new frame arrives, but not faster than the face detection rate
+    def RunEvents(self):
+
+        last_time = 0.0
+        while not rospy.is_shutdown():
+
+            # wait for a new frame
+            if not self.handoff.Wait(1.0):
+                continue
+
+            # keep the minimum interval between detections
+            delay = last_time + 1.0 / self.timer_rate - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+            last_time = time.time()
+
+            self.HandleTimer(None)
+
+
+    # (pool worker) detect faces in a frame and allow the next detection to be queued
+    def DetectPending(self,cur_image,cur_ts):
+
+        try:
+            start = time.time()
+            activity = self.Detect(cur_image,cur_ts)
+            self.Govern(time.time() - start,activity,cur_ts)
+        except Exception:
+            # the pool would drop the exception silently
+            rospy.logerr("detection failed:\n{}".format(traceback.format_exc()))
+        finally:
+            self.pending = False
+
+
+    # (thumb worker) make the thumbnail of a raw face and send it after the face
+    def SendThumb(self,face_id,ts,crop):
+
+        msg = FaceThumb()
+        msg.face_id = face_id
+        msg.ts = ts
+        msg.thumb = EncodeThumb(crop,self.thumb_width,self.thumb_height)
+        self.face_thumb_pub.publish(msg)
+
+
+    # cut a face out of the full-size frame, or out of the work image if that's all there is
+    def CropFace(self,image,x,y,w,h):
+
+        if self.preprocess_frames_flag and not self.shm_transport_flag:
+            return image[y:y+h,x:x+w]
+        return self.preprocessor.CropWorkRect(x,y,w,h,image.shape[1],image.shape[0])
+
+
+    # detect faces in a frame, returns the scene activity, or None if the frame was not available anymore
+    def Detect(self,cur_image,cur_ts):
+
+        # time from capture until the frame arrived
+        capture_ts = CaptureTime(cur_image,cur_ts)
+        self.latency.Add("receive",(cur_ts - capture_ts).to_sec())
+
+        # run the detection itself without blocking the subscriber (this lock only keeps overlapping detections apart)
         with self.lock:
 
-            # if no image is available, exit
-            if self.cur_ts == 0.0:
-                return
+            # get the Haar cascade (a pool worker has its own)
+            if self.pool is None:
+                face_cascade = self.face_cascade
+            else:
+                face_cascade = GetWorkerCascade(self.haar_cascade_filename)
 
             # calculate distance to camera plane
             cpd = 1.0 / math.tan(self.fovy)
 
-            # cache working size (change according to rotation)
-            width = self.face_detect_work_width
-            height = self.face_detect_work_height
+            # convert image from ROS to OpenCV, rescale and unrotate (the shared work image already is)
+            start = time.time()
+            if self.shm_transport_flag:
 
-            # convert image from ROS to OpenCV, unrotate and rescale
-            image = cv2.resize(opencv_bridge.imgmsg_to_cv2(self.cur_image,"bgr8"),(width,height),interpolation=cv2.INTER_LINEAR)
-            if self.rotate == 90:
-                width = self.face_detect_work_height
-                height = self.face_detect_work_width
-                cpd /= self.aspect
-                image = cv2.transpose(image)
-            elif self.rotate == -90:
-                width = self.face_detect_work_height
-                height = self.face_detect_work_width
+                # map the frame from the ring and rescale it
+                frame = self.frame_ring.View(cur_image)
+                if frame is None:
+                    return None
+                self.preprocessor.SetRotate(self.rotate)
+                self.preprocessor.SetImage(frame)
+                image = self.preprocessor.GetWorkImage(self.face_detect_work_width,self.face_detect_work_height)
+
+                # if the frame got overwritten while rescaling, exit
+                if not self.frame_ring.IsCurrent(cur_image):
+                    return None
+
+            elif self.preprocess_frames_flag:
+                image = opencv_bridge.imgmsg_to_cv2(cur_image,"bgr8")
+            else:
+                self.preprocessor.SetRotate(self.rotate)
+                self.preprocessor.SetFrame(cur_image)
+                image = self.preprocessor.GetWorkImage(self.face_detect_work_width,self.face_detect_work_height)
+            self.latency.Add("decode",time.time() - start)
+
+            # get working size (changed according to rotation)
+            width = image.shape[1]
+            height = image.shape[0]
+            if (self.rotate == 90) or (self.rotate == -90):
                 cpd /= self.aspect
-                image = cv2.transpose(image)
-                image = cv2.flip(image,1)
-            elif self.rotate == 180:
-                image = cv2.flip(image,1)
-                image = cv2.flip(image,-1)
 
-            # detect all faces in the image
-            faces = self.face_cascade.detectMultiScale(image,scaleFactor=self.haar_scale_factor,minSize=(self.haar_min_width,self.haar_min_height),flags=cv2.cv.CV_HAAR_SCALE_IMAGE)
+            # when tracking, only search around the predicted faces, except at face discovery rate
+            start = time.time()
+            if self.face_tracking_flag and (cur_ts.to_sec() - self.last_discovery_ts < 1.0 / self.face_discovery_rate):
+                rects = [RegionToRect(region,width,height) for region in self.face_regions]
+                faces = DetectFacesInRects(face_cascade,image,rects,self.face_track_padding,self.haar_scale_factor,(self.haar_min_width,self.haar_min_height))
+
+            else:
+
+                # detect all faces in the image
+                self.last_discovery_ts = cur_ts.to_sec()
+                faces = face_cascade.detectMultiScale(image,scaleFactor=self.haar_scale_factor,minSize=(self.haar_min_width,self.haar_min_height),flags=cv2.cv.CV_HAAR_SCALE_IMAGE)
+            self.latency.Add("detect",time.time() - start)
+
+            # measure scene activity from the movement of the predicted faces since the previous detection
+            face_regions = self.face_regions
+            activity = GetRegionActivity(face_regions,self.last_face_regions,self.governor_move_distance)
+            self.last_face_regions = face_regions
 
             # if there are no faces detected, exit
             if len(faces) == 0:
-                return
+                return activity
 
-            # iterate over all found faces
-            for (x,y,w,h) in faces:
+            # skip faces that actually don't exist, and cut out the others
+            faces = [(x,y,w,h) for (x,y,w,h) in faces if (w > 0) and (h > 0)]
+            crops = [self.CropFace(image,x,y,w,h) for (x,y,w,h) in faces]
 
-                # if the face actually doesn't exist, continue with next face
-                if (w <= 0) or (h <= 0):
-                    continue
+            # if the frame got overwritten while cutting out the faces, exit
+            if self.shm_transport_flag and not self.frame_ring.IsCurrent(cur_image):
+                return activity
+
+            # iterate over all found faces
+            for (x,y,w,h),crop in zip(faces,crops):
 
                 # calculate distance of the face to the camera
                 cx = float(self.face_height) * cpd * float(height) / float(h)
@@ -199,7 +563,8 @@ class DetectFacesHaar(object):
                 # prepare raw face message
                 msg = Face()
                 msg.face_id = GenerateFaceID()
-                msg.ts = self.cur_ts
+                msg.ts = cur_ts
+                msg.capture_ts = capture_ts
                 msg.rect.origin.x = -fy
                 msg.rect.origin.y = -fz
                 msg.rect.size.x = 2.0 * float(w) / float(width)
@@ -213,14 +578,19 @@ class DetectFacesHaar(object):
                 msg.expressions = []
                 msg.landmarks = []
 
-                # cut out face thumbnail and resize
-                cvthumb = cv2.resize(image[y:y+h,x:x+w],(self.thumb_width,self.thumb_height))
+                # publish the raw face right away and let the thumbnail follow
+                if self.async_thumbs_flag:
+                    self.face_pub.publish(msg)
+                    self.thumb_pool.apply_async(self.SendThumb,(msg.face_id,cur_ts,crop))
+
+                # or make the thumbnail first and publish the raw face with it
+                else:
+                    msg.thumb = EncodeThumb(crop,self.thumb_width,self.thumb_height)
+                    self.face_pub.publish(msg)
 
-                # convert thumbnail from OpenCV to ROS
-                msg.thumb = opencv_bridge.cv2_to_imgmsg(cvthumb,encoding="8UC3")
+                self.latency.AddSince("publish",capture_ts)
 
-                # and publish the raw face
-                self.face_pub.publish(msg)
+            return activity
 
 
 if __name__ == '__main__':
@@ -7,7 +7,11 @@
 
 # HAND DETECTION: analyze camera frame and output all found hands at a configurable rate
 #     the camera is a ROS USB camera node under 'camera' in the local namespace
+#     alternatively, the unrotated work image comes from the 'preprocess_frames' node via 'hand_image' in the local namespace
+#     (as long as the detection itself is a template, that topic isn't subscribed to)
+#     or, with shared memory transport, the frame is mapped from the ring that 'preprocess_frames' announces via 'frame_slot'
 #     the raw hands are published to 'raw_hand' in the local namespace
+#     in event-driven mode, hands are detected when a new frame arrives, but not faster than the hand detection rate
 #     parameter updates are gathered from the 'vision_pipeline' parameter server
 
 # the node should be called 'detect_hands'
@@ -20,9 +24,11 @@ import time
 import cv2
 import dynamic_reconfigure.client
 from sensor_msgs.msg import Image
-from r2_perception.msg import Hand
+from r2_perception.msg import Hand,FrameSlot,DetectorStats
+from frame_ring import FrameRing
 from cv_bridge import CvBridge
-from threading import Lock
+from frame_handoff import FrameHandoff
+from threading import Lock,Thread
 
 
 # create OpenCV-ROS bridge object
@@ -50,14 +56,21 @@ class DetectHands(object):
         # start possible debug window
         cv2.startWindowThread()
 
-        # initialize current frame and timestamp
-        self.cur_image = Image()
-        self.cur_ts = 0.0
+        # create frame handoff between subscriber and timer
+        self.handoff = FrameHandoff()
 
         # get pipeline name
         self.name = rospy.get_namespace().split('/')[-2]
 
-        # get parameters
+        # get fixed parameters
+        self.preprocess_frames_flag = rospy.get_param("/preprocess_frames_flag",False)
+        self.detector_stats_period = rospy.get_param("/detector_stats_period",1.0)
+        self.shm_transport_flag = rospy.get_param("/shm_transport_flag",False)
+        self.event_driven_flag = rospy.get_param("/event_driven_flag",False)
+        if self.shm_transport_flag:
+            self.frame_ring = FrameRing(rospy.get_namespace())
+
+        # get dynamic parameters
         self.debug_hand_detect_flag = rospy.get_param("debug_hand_detect_flag")
         if self.debug_hand_detect_flag:
             cv2.namedWindow(self.name + " hands")
@@ -67,7 +80,9 @@ class DetectHands(object):
         self.rotate = rospy.get_param("rotate")
 
         self.hand_detect_rate = rospy.get_param("hand_detect_rate")
-        self.timer = rospy.Timer(rospy.Duration(1.0 / self.hand_detect_rate),self.HandleTimer)
+        self.timer = None
+        if not self.event_driven_flag:
+            self.timer = rospy.Timer(rospy.Duration(1.0 / self.hand_detect_rate),self.HandleTimer)
 
         self.hand_detect_work_width = rospy.get_param("hand_detect_work_width")
         self.hand_detect_work_height = rospy.get_param("hand_detect_work_height")
@@ -76,9 +91,25 @@ class DetectHands(object):
         self.dynparam = dynamic_reconfigure.client.Client("vision_pipeline",timeout=30,config_callback=self.HandleConfig)        
 
         # start subscriber and publisher
-        self.image_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleImage)
+        # (with frame preprocessing, 'hand_image' is not subscribed to until the hands are actually detected, so
+        # preprocess_frames doesn't build a hand work image for nothing)
+        self.image_sub = None
+        if self.shm_transport_flag:
+            self.image_sub = rospy.Subscriber("frame_slot",FrameSlot,self.HandleImage)
+        elif not self.preprocess_frames_flag:
+            self.image_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleImage)
         self.hand_pub = rospy.Publisher("raw_hand",Hand,queue_size=5)
 
+        # start publishing detector statistics
+        self.stats_pub = rospy.Publisher("detector_stats",DetectorStats,queue_size=5)
+        self.stats_timer = rospy.Timer(rospy.Duration(self.detector_stats_period),self.HandleStatsTimer)
+
+        # in event-driven mode, detect when new frames arrive instead of at hand detection rate
+        if self.event_driven_flag:
+            self.event_thread = Thread(target=self.RunEvents)
+            self.event_thread.daemon = True
+            self.event_thread.start()
+
 
     # when a dynamic reconfigure update occurs
     def HandleConfig(self,data):
@@ -98,8 +129,9 @@ class DetectHands(object):
         new_hand_detect_rate = data.hand_detect_rate
         if new_hand_detect_rate != self.hand_detect_rate:
             self.hand_detect_rate = new_hand_detect_rate
-            self.timer.shutdown()
-            self.timer = rospy.Timer(rospy.Duration(1.0 / self.hand_detect_rate),self.HandleTimer)            
+            if not self.event_driven_flag:
+                self.timer.shutdown()
+                self.timer = rospy.Timer(rospy.Duration(1.0 / self.hand_detect_rate),self.HandleTimer)
 
         self.hand_detect_work_width = data.hand_detect_work_width
         self.hand_detect_work_height = data.hand_detect_work_height
@@ -108,27 +140,58 @@ class DetectHands(object):
     # when a camera image arrives
     def HandleImage(self,data):
 
-        with self.lock:
+        # hand over the image and timestamp to the timer
+        self.handoff.Put(data,rospy.get_rostime())
+
+
+    # at detector statistics rate
+    def HandleStatsTimer(self,event):
+
+        msg = DetectorStats()
+        msg.detector = "hands"
+        msg.ts = rospy.get_rostime()
+        self.handoff.FillStats(msg)
+        self.stats_pub.publish(msg)
+
 
-            # copy the image and update the timestamp
-            self.cur_image = data
-            self.cur_ts = rospy.get_rostime()
+    # (event thread) detect hands when a new frame arrives, but not faster than the hand detection rate
+    def RunEvents(self):
 
+        last_time = 0.0
+        while not rospy.is_shutdown():
 
-    # at face detection rate
+            # wait for a new frame
+            if not self.handoff.Wait(1.0):
+                continue
+
+            # keep the minimum interval between detections
+            delay = last_time + 1.0 / self.hand_detect_rate - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+            last_time = time.time()
+
+            self.HandleTimer(None)
+
+
+    # at hand detection rate
     def HandleTimer(self,event):
 
-        with self.lock:
+        # take the newest frame, but only if it wasn't processed yet (the frame lock is only held to swap it out)
+        cur_image,cur_ts = self.handoff.Take()
+
+        # if no new image is available, exit
+        if cur_image is None:
+            return
 
-            # if no image is available, exit
-            if self.cur_ts == 0.0:
-                return
+        # run the detection itself without blocking the subscriber (this lock only keeps overlapping timers apart)
+        with self.lock:
 
-            # TODO: detect all the hands
+            # TODO: get the frame (with shared memory transport: self.frame_ring.View(cur_image)) and detect all the hands
 
             # TODO: if there are no hands detected, exit
 
             # TODO: publish all the hands
+            ()
 
 
 if __name__ == '__main__':
@@ -7,7 +7,12 @@
 
 # SALIENT POINT DETECTION: analyze camera frame and output all found salient points at a configurable rate
 #     the camera is a ROS USB camera node under 'camera' in the local namespace
+#     alternatively, the unrotated work image comes from the 'preprocess_frames' node via 'saliency_image' in the local namespace
+#     or, with shared memory transport, the frames are mapped from the ring that 'preprocess_frames' announces via 'frame_slot'
 #     the raw salient points are published to 'raw_saliency' in the local namespace
+#     with the rate governor, the saliency detection rate follows the detection cost and the motion energy in the frame,
+#     and its decisions are published to 'governor' in the local namespace
+#     in event-driven mode, detection runs when a new frame arrives, but not faster than the saliency detection rate
 #     parameter updates are gathered from the 'vision_pipeline' parameter server
 
 # ITTI & KOCH: the algorithm is roughly based to the work of Itti & Koch in the early 2000s
@@ -25,24 +30,26 @@ import numpy
 import time
 import cv2
 import math
+import traceback
 import dynamic_reconfigure.client
 from sensor_msgs.msg import Image
-from r2_perception.msg import Saliency,Float32XYZ
-from cv_bridge import CvBridge
-from threading import Lock
-
-
-# create OpenCV-ROS bridge object
-opencv_bridge = CvBridge()
+from r2_perception.msg import Saliency,Float32XYZ,FrameSlot,DetectorStats,GovernorDecision
+from frame_preprocessor import UnrotateImage,opencv_bridge
+from frame_ring import FrameRing
+from frame_handoff import FrameHandoff
+from rate_governor import RateGovernor
+from threading import Lock,Thread
 
 
 # Generate unique serial number for the raw salient points
 serial_number = 0
+serial_lock = Lock()
 
 def GenerateSaliencyID():
     global serial_number
-    result = serial_number
-    serial_number += 1
+    with serial_lock:
+        result = serial_number
+        serial_number += 1
     return result
 
 
@@ -52,58 +59,130 @@ def cv2normalize(image):
     cv2.normalize(cv2.absdiff(image,0.0),dest,0.0,1.0,cv2.NORM_MINMAX)
     return dest
 
+
+# find successively brightest points in a feature map, erasing the neighborhood of each point after it was found
+def FindBrightestPoints(image,num_points,eraser_radius):
+
+    height = image.shape[0]
+    width = image.shape[1]
+    scratch = image.copy()
+    points = []
+    for i in range(0,num_points):
+
+        # the first brightest pixel in row-major order, only if it's brighter than 0
+        point = Float32XYZ()
+        index = numpy.argmax(scratch)
+        value = scratch.flat[index]
+        if value > point.z:
+            y,x = divmod(index,width)
+            point.x = float(x) / float(width)
+            point.y = float(y) / float(height)
+            point.z = value
+        points.append(point)
+
+        # erase it (at the location as it is converted back from the point)
+        cv2.circle(scratch,(int(point.x * float(width)),int(point.y * float(height))),eraser_radius,0,-1)
+
+    return points
+
   
 class DetectSaliencyIttiKoch(object):
 
 
     # constructor
-    def __init__(self):
+    def __init__(self,namespace=None,pool=None):
 
         # create lock
         self.lock = Lock()
 
+        # get camera namespace (the local namespace, unless running in a detector host)
+        if namespace is None:
+            namespace = rospy.get_namespace()
+        self.namespace = namespace
+
+        # when running in a detector host, detection is done by the host's worker pool
+        self.pool = pool
+        self.pending = False
+
         # start possible debug window
         cv2.startWindowThread()
 
-        # initialize current and last frame and timestamps
-        self.cur_image = Image()
-        self.last_image = Image()
-        self.cur_ts = 0.0
-        self.last_ts = 0.0
+        # create frame handoff between subscriber and timer
+        self.handoff = FrameHandoff()
 
-        # get pipeline name
-        self.name = rospy.get_namespace().split('/')[-2]
+        # initialize feature maps of the previous frame
+        self.last_y_image = None
+        self.last_y_lowpass_image = None
+        self.last_maps_key = None
 
-        # get parameters
-        self.debug_saliency_detect_flag = rospy.get_param("debug_saliency_detect_flag")
+        # get pipeline name
+        self.name = self.namespace.split('/')[-2]
+
+        # get fixed parameters
+        self.preprocess_frames_flag = rospy.get_param("/preprocess_frames_flag",False)
+        self.detector_stats_period = rospy.get_param("/detector_stats_period",1.0)
+        self.shm_transport_flag = rospy.get_param("/shm_transport_flag",False)
+        self.event_driven_flag = rospy.get_param("/event_driven_flag",False)
+        if self.shm_transport_flag:
+            self.frame_ring = FrameRing(self.namespace)
+
+        # get dynamic parameters
+        self.debug_saliency_detect_flag = rospy.get_param(self.namespace + "debug_saliency_detect_flag")
         if self.debug_saliency_detect_flag:
             cv2.namedWindow(self.name + " saliency")
 
-        self.fovy = rospy.get_param("fovy")
-        self.aspect = rospy.get_param("aspect")
-        self.rotate = rospy.get_param("rotate")
+        self.fovy = rospy.get_param(self.namespace + "fovy")
+        self.aspect = rospy.get_param(self.namespace + "aspect")
+        self.rotate = rospy.get_param(self.namespace + "rotate")
+
+        self.saliency_detect_rate = rospy.get_param(self.namespace + "saliency_detect_rate")
+        self.saliency_detect_min_rate = rospy.get_param(self.namespace + "saliency_detect_min_rate")
 
-        self.saliency_detect_rate = rospy.get_param("saliency_detect_rate")
-        self.timer = rospy.Timer(rospy.Duration(1.0 / self.saliency_detect_rate),self.HandleTimer)
+        self.governor_flag = rospy.get_param(self.namespace + "governor_flag")
+        self.governor_load = rospy.get_param(self.namespace + "governor_load")
+        self.governor_hold_time = rospy.get_param(self.namespace + "governor_hold_time")
+        self.governor_motion_energy = rospy.get_param(self.namespace + "governor_motion_energy")
+        self.governor = RateGovernor(self.saliency_detect_min_rate,self.saliency_detect_rate,self.governor_load,self.governor_hold_time)
 
-        self.saliency_detect_work_width = rospy.get_param("saliency_detect_work_width")
-        self.saliency_detect_work_height = rospy.get_param("saliency_detect_work_height")
+        self.timer_rate = self.GetTimerRate()
+        self.timer = None
+        if not self.event_driven_flag:
+            self.timer = rospy.Timer(rospy.Duration(1.0 / self.timer_rate),self.HandleTimer)
 
-        self.ittikoch_reduced_width = rospy.get_param("ittikoch_reduced_width")
-        self.ittikoch_reduced_height = rospy.get_param("ittikoch_reduced_height")
-        self.ittikoch_gaussian_size = rospy.get_param("ittikoch_gaussian_size")
-        self.ittikoch_motion_factor = rospy.get_param("ittikoch_motion_factor") # 0.5
-        self.ittikoch_color_factor = rospy.get_param("ittikoch_color_factor") # 0.2
-        self.ittikoch_contrast_factor = rospy.get_param("ittikoch_contrast_factor") # 0.1
-        self.ittikoch_num_points = rospy.get_param("ittikoch_num_points")
-        self.ittikoch_eraser_radius = rospy.get_param("ittikoch_eraser_radius")
+        self.saliency_detect_work_width = rospy.get_param(self.namespace + "saliency_detect_work_width")
+        self.saliency_detect_work_height = rospy.get_param(self.namespace + "saliency_detect_work_height")
+
+        self.ittikoch_reduced_width = rospy.get_param(self.namespace + "ittikoch_reduced_width")
+        self.ittikoch_reduced_height = rospy.get_param(self.namespace + "ittikoch_reduced_height")
+        self.ittikoch_gaussian_size = rospy.get_param(self.namespace + "ittikoch_gaussian_size")
+        self.ittikoch_motion_factor = rospy.get_param(self.namespace + "ittikoch_motion_factor") # 0.5
+        self.ittikoch_color_factor = rospy.get_param(self.namespace + "ittikoch_color_factor") # 0.2
+        self.ittikoch_contrast_factor = rospy.get_param(self.namespace + "ittikoch_contrast_factor") # 0.1
+        self.ittikoch_num_points = rospy.get_param(self.namespace + "ittikoch_num_points")
+        self.ittikoch_eraser_radius = rospy.get_param(self.namespace + "ittikoch_eraser_radius")
 
         # start dynamic reconfigure client from vision_pipeline
-        self.dynparam = dynamic_reconfigure.client.Client("vision_pipeline",timeout=30,config_callback=self.HandleConfig)        
+        self.dynparam = dynamic_reconfigure.client.Client(self.namespace + "vision_pipeline",timeout=30,config_callback=self.HandleConfig)        
 
         # start subscriber and publisher
-        self.image_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleImage)
-        self.saliency_pub = rospy.Publisher("raw_saliency",Saliency,queue_size=5)
+        if self.shm_transport_flag:
+            self.image_sub = rospy.Subscriber(self.namespace + "frame_slot",FrameSlot,self.HandleImage)
+        elif self.preprocess_frames_flag:
+            self.image_sub = rospy.Subscriber(self.namespace + "saliency_image",Image,self.HandleImage)
+        else:
+            self.image_sub = rospy.Subscriber(self.namespace + "camera/image_raw",Image,self.HandleImage)
+        self.saliency_pub = rospy.Publisher(self.namespace + "raw_saliency",Saliency,queue_size=5)
+        self.governor_pub = rospy.Publisher(self.namespace + "governor",GovernorDecision,queue_size=5)
+
+        # start publishing detector statistics
+        self.stats_pub = rospy.Publisher(self.namespace + "detector_stats",DetectorStats,queue_size=5)
+        self.stats_timer = rospy.Timer(rospy.Duration(self.detector_stats_period),self.HandleStatsTimer)
+
+        # in event-driven mode, detect when new frames arrive instead of at saliency detection rate
+        if self.event_driven_flag:
+            self.event_thread = Thread(target=self.RunEvents)
+            self.event_thread.daemon = True
+            self.event_thread.start()
 
 
     def HandleConfig(self,data):
@@ -120,11 +199,21 @@ class DetectSaliencyIttiKoch(object):
         self.aspect = data.aspect
         self.rotate = data.rotate
 
-        new_saliency_detect_rate = data.saliency_detect_rate
-        if new_saliency_detect_rate != self.saliency_detect_rate:
-            self.saliency_detect_rate = new_saliency_detect_rate
-            self.timer.shutdown()
-            self.timer = rospy.Timer(rospy.Duration(1.0 / self.saliency_detect_rate),self.HandleTimer)
+        self.saliency_detect_rate = data.saliency_detect_rate
+        self.saliency_detect_min_rate = data.saliency_detect_min_rate
+
+        # the governor and the timer are also changed by Govern on the detection thread
+        with self.lock:
+
+            self.governor_flag = data.governor_flag
+            self.governor_load = data.governor_load
+            self.governor_hold_time = data.governor_hold_time
+            self.governor_motion_energy = data.governor_motion_energy
+            self.governor.SetBounds(self.saliency_detect_min_rate,self.saliency_detect_rate,self.governor_load,self.governor_hold_time)
+
+            new_timer_rate = self.GetTimerRate()
+            if new_timer_rate != self.timer_rate:
+                self.RestartTimer(new_timer_rate)
 
         self.saliency_detect_work_width = data.saliency_detect_work_width
         self.saliency_detect_work_height = data.saliency_detect_work_height
@@ -139,82 +228,198 @@ class DetectSaliencyIttiKoch(object):
         self.ittikoch_eraser_radius = data.ittikoch_eraser_radius
 
 
+    # the saliency detection rate, either fixed or from the rate governor
+    def GetTimerRate(self):
+
+        if self.governor_flag:
+            return self.governor.rate
+        return self.saliency_detect_rate
+
+
+    # restart the saliency detection timer at a new rate
+    def RestartTimer(self,rate):
+
+        self.timer_rate = rate
+
+        # in event-driven mode, the rate only sets the minimum interval between detections
+        if self.event_driven_flag:
+            return
+
+        self.timer.shutdown()
+        self.timer = rospy.Timer(rospy.Duration(1.0 / self.timer_rate),self.HandleTimer)
+
+
+    # let the rate governor account for a detection and follow its decision
+    def Govern(self,cost,activity,cur_ts):
+
+        # if the frame wasn't used, or there is no governor, exit
+        if (activity is None) or not self.governor_flag:
+            return
+
+        with self.lock:
+
+            self.governor.Measure(cost,activity,cur_ts.to_sec())
+            if not self.governor.Update():
+                return
+
+            msg = GovernorDecision()
+            msg.detector = "saliency"
+            msg.ts = cur_ts
+            self.governor.FillDecision(msg)
+            self.governor_pub.publish(msg)
+
+            self.RestartTimer(self.governor.rate)
+
+
     # when an new camera image arrives
     def HandleImage(self,data):
 
-        with self.lock:
+        # hand over the image and timestamp to the timer
+        self.handoff.Put(data,rospy.get_rostime())
+
 
-            # copy the images and update the timestamps
-            self.last_image = self.cur_image
-            self.last_ts = self.cur_ts
+    # at detector statistics rate
+    def HandleStatsTimer(self,event):
 
-            self.cur_image = data
-            self.cur_ts = rospy.get_rostime()
+        msg = DetectorStats()
+        msg.detector = "saliency"
+        msg.ts = rospy.get_rostime()
+        self.handoff.FillStats(msg)
+        self.stats_pub.publish(msg)
 
 
     # at saliency detection rate
     def HandleTimer(self,data):
 
-        with self.lock:
+        # with a worker pool, never queue more than one detection per camera (the frame stays for the next tick)
+        if (self.pool is not None) and self.pending:
+            return
 
-            # if no images available, exit
-            if (self.cur_ts == 0.0) or (self.last_ts == 0):
-                return
+        # take the newest frame, but only if it wasn't processed yet (the frame lock is only held to swap it out)
+        cur_image,cur_ts = self.handoff.Take()
+
+        # if no new image is available, exit
+        if cur_image is None:
+            return
+
+        # with a worker pool, detect there
+        if self.pool is not None:
+            self.pending = True
+            self.pool.apply_async(self.DetectPending,(cur_image,cur_ts))
+            return
+
+        start = time.time()
+        activity = self.Detect(cur_image,cur_ts)
+        self.Govern(time.time() - start,activity,cur_ts)
+
+
+    # (event thread) detect salient points when a new frame arrives, but not faster than the saliency detection rate
+    def RunEvents(self):
+
+        last_time = 0.0
+        while not rospy.is_shutdown():
+
+            # wait for a new frame
+            if not self.handoff.Wait(1.0):
+                continue
+
+            # keep the minimum interval between detections
+            delay = last_time + 1.0 / self.timer_rate - time.time()
+            if delay > 0.0:
+                time.sleep(delay)
+            last_time = time.time()
+
+            self.HandleTimer(None)
+
+
+    # (pool worker) detect salient points in a frame and allow the next detection to be queued
+    def DetectPending(self,cur_image,cur_ts):
+
+        try:
+            start = time.time()
+            activity = self.Detect(cur_image,cur_ts)
+            self.Govern(time.time() - start,activity,cur_ts)
+        except Exception:
+            # the pool would drop the exception silently
+            rospy.logerr("detection failed:\n{}".format(traceback.format_exc()))
+        finally:
+            self.pending = False
+
+
+    # detect salient points in a frame, returns the scene activity, or None if there was nothing to compare the frame with
+    def Detect(self,cur_image,cur_ts):
+
+        # run the detection itself without blocking the subscriber (this lock only keeps overlapping detections apart)
+        with self.lock:
 
             # calculate distance to camera plane
             cpd = 1.0 / math.tan(self.fovy)
 
-            # cache feature map size (change according to rotation)
-            wwidth = self.saliency_detect_work_width
-            wheight = self.saliency_detect_work_height
+            # convert image from ROS to OpenCV, rescale and unrotate (the shared work image already is)
+            if self.shm_transport_flag:
+
+                # map the frame from the ring and rescale it
+                cur_frame = self.frame_ring.View(cur_image)
+                if cur_frame is None:
+                    return None
+                size = (self.saliency_detect_work_width,self.saliency_detect_work_height)
+                bgr_cur_image = UnrotateImage(cv2.resize(cur_frame,size,interpolation=cv2.INTER_LINEAR),self.rotate)
+
+                # if the frame got overwritten while rescaling, exit
+                if not self.frame_ring.IsCurrent(cur_image):
+                    return None
+
+            elif self.preprocess_frames_flag:
+                bgr_cur_image = opencv_bridge.imgmsg_to_cv2(cur_image,"bgr8")
+            else:
+                size = (self.saliency_detect_work_width,self.saliency_detect_work_height)
+                bgr_cur_image = UnrotateImage(cv2.resize(opencv_bridge.imgmsg_to_cv2(cur_image,"bgr8"),size,interpolation=cv2.INTER_LINEAR),self.rotate)
+
+            # get feature map sizes (changed according to rotation)
+            wwidth = bgr_cur_image.shape[1]
+            wheight = bgr_cur_image.shape[0]
             rwidth = self.ittikoch_reduced_width
             rheight = self.ittikoch_reduced_height
-
-            # convert images from ROS to OpenCV, unrotate and rescale
-            bgr_cur_image = cv2.resize(opencv_bridge.imgmsg_to_cv2(self.cur_image),(wwidth,wheight),interpolation=cv2.INTER_LINEAR)
-            bgr_last_image = cv2.resize(opencv_bridge.imgmsg_to_cv2(self.last_image),(wwidth,wheight),interpolation=cv2.INTER_LINEAR)
-            if self.rotate == 90:
-                wwidth = self.saliency_detect_work_height
-                wheight = self.saliency_detect_work_width
-                rwidth = self.ittikoch_reduced_height
-                rheight = self.ittikoch_reduced_width
-                cpd /= self.aspect
-                bgr_cur_image = cv2.transpose(bgr_cur_image)
-                bgr_last_image = cv2.transpose(bgr_last_image)
-            elif self.rotate == -90:
-                wwidth = self.saliency_detect_work_height
-                wheight = self.saliency_detect_work_width
+            if (self.rotate == 90) or (self.rotate == -90):
                 rwidth = self.ittikoch_reduced_height
                 rheight = self.ittikoch_reduced_width
                 cpd /= self.aspect
-                bgr_cur_image = cv2.transpose(bgr_cur_image)
-                bgr_cur_image = cv2.flip(bgr_cur_image,1)
-                bgr_last_image = cv2.transpose(bgr_last_image)
-                bgr_last_image = cv2.flip(bgr_last_image,1)
-            elif self.rotate == 180:
-                bgr_cur_image = cv2.flip(bgr_cur_image,1)
-                bgr_cur_image = cv2.flip(bgr_cur_image,-1)
-                bgr_last_image = cv2.flip(bgr_last_image,1)
-                bgr_last_image = cv2.flip(bgr_last_image,-1)
 
             # also, convert from BGR to YUV (which is more natural for vision tasks)
             yuv_cur_image = cv2.cvtColor(bgr_cur_image,cv2.COLOR_BGR2YUV)
             yuv_cur_image = yuv_cur_image.astype("float32")
-            yuv_last_image = cv2.cvtColor(bgr_last_image,cv2.COLOR_BGR2YUV)
-            yuv_last_image = yuv_last_image.astype("float32")
-
-            # generate motion map from difference between last frame and current frame
-            dyuv_image = cv2.subtract(yuv_cur_image,yuv_last_image)
 
             # split intensity and color maps
-            y_image,u_image,v_image = cv2.split(yuv_cur_image) 
-            dy_image,du_image,dv_image = cv2.split(dyuv_image)
+            y_image,u_image,v_image = cv2.split(yuv_cur_image)
 
             # use Gaussian blur to create low-pass filtered versions of each map
             y_lowpass_image = cv2.GaussianBlur(y_image,(self.ittikoch_gaussian_size,self.ittikoch_gaussian_size),0) # intensity
             u_lowpass_image = cv2.GaussianBlur(u_image,(self.ittikoch_gaussian_size,self.ittikoch_gaussian_size),0) # red-green
             v_lowpass_image = cv2.GaussianBlur(v_image,(self.ittikoch_gaussian_size,self.ittikoch_gaussian_size),0) # blue-yellow
-            dy_lowpass_image = cv2.GaussianBlur(dy_image,(self.ittikoch_gaussian_size,self.ittikoch_gaussian_size),0) # motion
+
+            # keep the intensity maps for the next tick (only intensity is needed for motion), but only use the
+            # previous ones if they were made the same way
+            maps_key = (y_image.shape,self.rotate,self.ittikoch_gaussian_size)
+            last_y_image = self.last_y_image
+            last_y_lowpass_image = self.last_y_lowpass_image
+            last_maps_key = self.last_maps_key
+            self.last_y_image = y_image
+            self.last_y_lowpass_image = y_lowpass_image
+            self.last_maps_key = maps_key
+            if (last_y_image is None) or (last_maps_key != maps_key):
+                return None
+
+            # generate motion map from difference between previous frame and current frame; since the blur is linear,
+            # the low-pass motion map is the difference between the low-pass intensity maps
+            dy_image = y_image - last_y_image
+            dy_lowpass_image = y_lowpass_image - last_y_lowpass_image # motion
+
+            # measure scene activity from the average low-pass intensity change (which ignores most of the sensor noise)
+            motion_energy = float(numpy.mean(numpy.abs(dy_lowpass_image)))
+            if motion_energy >= self.governor_motion_energy:
+                activity = 1.0
+            else:
+                activity = motion_energy / self.governor_motion_energy
 
             # emulate high-pass filtering (high-frequency content is the 'most interesting') by
             # subtracting low-pass images from unfiltered images
@@ -238,19 +443,7 @@ class DetectSaliencyIttiKoch(object):
 
             # find successively brightest points in a much lower resolution result
             reduced = cv2.resize(total,(rwidth,rheight),interpolation=cv2.INTER_LINEAR)
-            scratch = reduced.copy()
-            points = []
-            for i in range(0,self.ittikoch_num_points):
-                brightest_v = 0.0
-                point = Float32XYZ()
-                for y in range(0,rheight):
-                    for x in range(0,rwidth):
-                        if scratch[y,x] > point.z:
-                            point.x = float(x) / float(rwidth)
-                            point.y = float(y) / float(rheight)
-                            point.z = scratch[y,x]
-                points.append(point)
-                cv2.circle(scratch,(int(point.x * float(rwidth)),int(point.y * float(rheight))),self.ittikoch_eraser_radius,0,-1)
+            points = FindBrightestPoints(reduced,self.ittikoch_num_points,self.ittikoch_eraser_radius)
 
             # convert to messages and send off
             for point in points:
@@ -274,7 +467,7 @@ class DetectSaliencyIttiKoch(object):
                 # prepare saliency message
                 msg = Saliency()
                 msg.saliency_id = GenerateSaliencyID()
-                msg.ts = self.cur_ts
+                msg.ts = cur_ts
                 msg.direction.x = fx
                 msg.direction.y = fy
                 msg.direction.z = fz
@@ -288,6 +481,8 @@ class DetectSaliencyIttiKoch(object):
             if self.debug_saliency_detect_flag:
                 cv2.imshow(self.name + " saliency",cv2.resize(reduced,(wwidth,wheight),interpolation=cv2.INTER_LINEAR))
 
+            return activity
+
 
 if __name__ == '__main__':
 
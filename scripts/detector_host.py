@@ -0,0 +1,47 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# DETECTOR HOST: run face and saliency detection for several cameras in one process
+#     the cameras are the namespaces listed in '~cameras', relative to the local namespace (for instance 'lefteye', 'wideangle')
+#     each camera gets its own DetectFacesHaar and DetectSaliencyIttiKoch, with the same topics and parameters as the separate nodes
+#     each detector's timer still runs at the rates from the camera's 'vision_pipeline' parameter server
+#     the detections themselves run on a worker pool of '~workers' threads, each with its own Haar cascade
+#     at most one detection per camera and detector is waiting in the pool, ticks that would queue more are skipped
+
+# the node should be called 'detector_host', and replaces the 'detect_faces' and 'detect_saliency' nodes of the cameras it serves
+
+import rospy
+from multiprocessing.pool import ThreadPool
+from detect_faces_haar import DetectFacesHaar
+from detect_saliency_ittikoch import DetectSaliencyIttiKoch
+
+
+class DetectorHost(object):
+
+
+    # constructor
+    def __init__(self):
+
+        # get parameters
+        self.cameras = rospy.get_param("~cameras")
+        self.workers = rospy.get_param("~workers",2)
+
+        # start worker pool (OpenCV releases the GIL, so threads can run detections in parallel)
+        self.pool = ThreadPool(self.workers)
+        rospy.on_shutdown(self.pool.terminate)
+
+        # start detectors for all cameras
+        self.detectors = []
+        for camera in self.cameras:
+            namespace = rospy.get_namespace() + camera + "/"
+            self.detectors.append(DetectFacesHaar(namespace,self.pool))
+            self.detectors.append(DetectSaliencyIttiKoch(namespace,self.pool))
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('detector_host')
+    node = DetectorHost()
+    rospy.spin()
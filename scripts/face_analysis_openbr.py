@@ -3,15 +3,30 @@
 # R2 Perception - Hanson Robotics Unified Perception System, v1.0
 # by Desmond Germans
 
+# FACE ANALYSIS: estimate age and gender of new candidate faces
+#     face requests with their thumbnails come in on 'face_request' in the local namespace, and are queued in memory
+#     a pool of long-lived workers takes the queued requests in batches, and analyzes each batch at once
+#     the responses are published to 'face_response' in the local namespace as soon as their batch is done
+#     the queue is bounded: when it's full, new requests are dropped
+#     the number of queued, analyzed and dropped requests, batches and estimator failures are published to
+#     'face_analysis_stats' in the local namespace
+#     the estimator is OpenBiometrics, or a local stand-in for testing without it
+#     parameter updates are gathered from the 'vision_pipeline' parameter server
+
+# the node should be called 'face_analysis'
+
+from __future__ import with_statement
 import os
 import rospy
 import time
-import cv2
-import csv
+import Queue
+import traceback
 import dynamic_reconfigure.client
 from sensor_msgs.msg import Image
-from r2_perception.msg import FaceRequest,FaceResponse
+from r2_perception.msg import FaceRequest,FaceResponse,FaceAnalysisStats
 from cv_bridge import CvBridge
+from face_estimators import OpenBREstimator,DummyEstimator
+from threading import Thread,Lock
 
 
 # create OpenCV-ROS bridge object
@@ -24,78 +39,135 @@ class FaceAnalysisOpenBiometrics(object):
     # constructor
     def __init__(self):
 
+        # create lock
+        self.lock = Lock()
+
         # get fixed parameters
         self.face_analysis_temp_dir = rospy.get_param("/face_analysis_temp_dir")
         if not os.path.exists(self.face_analysis_temp_dir):
             os.makedirs(self.face_analysis_temp_dir)
         self.thumbs_ext = rospy.get_param("/thumbs_ext")
 
+        self.face_analysis_estimator = rospy.get_param("/face_analysis_estimator","openbr")
+        self.face_analysis_workers = rospy.get_param("/face_analysis_workers",1)
+        self.face_analysis_queue_size = rospy.get_param("/face_analysis_queue_size",20)
+        self.face_analysis_batch_size = rospy.get_param("/face_analysis_batch_size",8)
+        self.face_analysis_stats_period = rospy.get_param("/face_analysis_stats_period",1.0)
+
+        # create estimator
+        if self.face_analysis_estimator == "dummy":
+            self.estimator = DummyEstimator()
+        else:
+            self.estimator = OpenBREstimator(self.face_analysis_temp_dir,self.thumbs_ext)
+
+        # clear request queue and counters
+        self.queue = Queue.Queue(self.face_analysis_queue_size) # requests waiting to be analyzed
+        self.analyzed = 0 # total number of requests answered
+        self.dropped = 0 # total number of requests dropped because the queue was full
+        self.batches = 0 # total number of batches analyzed
+        self.failures = 0 # total number of batches the estimator failed on
+
         # start dynamic reconfigure client from vision_pipeline
         self.dynparam = dynamic_reconfigure.client.Client("vision_pipeline",timeout=30,config_callback=self.HandleConfig)
 
-        # start subscriber and publisher
-        self.request_sub = rospy.Subscriber("face_request",FaceRequest,self.HandleFaceRequest)
+        # start publisher, workers and subscriber
         self.response_pub = rospy.Publisher("face_response",FaceResponse,queue_size=5)
 
+        self.workers = []
+        for i in range(0,self.face_analysis_workers):
+            worker = Thread(target=self.Run)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+        self.request_sub = rospy.Subscriber("face_request",FaceRequest,self.HandleFaceRequest)
+
+        # start publishing statistics
+        self.stats_pub = rospy.Publisher("face_analysis_stats",FaceAnalysisStats,queue_size=5)
+        self.stats_timer = rospy.Timer(rospy.Duration(self.face_analysis_stats_period),self.HandleStatsTimer)
+
 
     # when a dynamic reconfigure update occurs
     def HandleConfig(self,data):
         ()
 
 
+    # at statistics rate
+    def HandleStatsTimer(self,event):
+
+        msg = FaceAnalysisStats()
+        msg.ts = rospy.get_rostime()
+        with self.lock:
+            msg.requests_queued = self.queue.qsize()
+            msg.requests_analyzed = self.analyzed
+            msg.requests_dropped = self.dropped
+            msg.batches = self.batches
+            msg.estimator_failures = self.failures
+        self.stats_pub.publish(msg)
+
+
     # when a face request comes in
     def HandleFaceRequest(self,data):
 
-        # create filename for face image
-        filename_base = str(data.camera_id)
-        image_path = self.face_analysis_temp_dir + "/" + filename_base + "." + self.thumbs_ext
-        csv_path = self.face_analysis_temp_dir + "/" + filename_base + ".csv"
-
-        # save thumbnail for OpenBiometrics
-        image = opencv_bridge.imgmsg_to_cv2(data.thumb)
-        cv2.imwrite(image_path,image)
-
-        # run OpenBiometrics commandline for age estimation
-        os.system("br -algorithm AgeEstimation -enroll " + image_path + " " + csv_path);
-
-        # interpret csv result
-        age = 0.0
-        age_confidence = 0.0
-        with open(csv_path,"rb") as file:
-            reader = csv.reader(file)
-            line = reader.next()
-            line = reader.next()
-            age = float(line[1])
-            age_confidence = 1.0  # for now...
-
-        # run OpenBiometrics commandline for gender estimation
-        os.system("br -algorithm GenderEstimation -enroll " + image_path + " " + csv_path);
-
-        # interpret csv result
-        gender = 1
-        gender_confidence = 0.0
-        with open(csv_path,"rb") as file:
-            reader = csv.reader(file)
-            line = reader.next()
-            line = reader.next()
-            if line[10] == "Female":
-                gender = 2
-            gender_confidence = 1.0  # for now...
-
-        # and send message
-        msg = FaceResponse()
-        msg.session_id = data.session_id
-        msg.camera_id = data.camera_id
-        msg.cface_id = data.cface_id
-        msg.face_id = data.face_id
-        msg.ts = data.ts
-        msg.age = age
-        msg.age_confidence = age_confidence
-        msg.gender = gender
-        msg.gender_confidence = gender_confidence
-        msg.identity = 0
-        msg.identity_confidence = 0.0
-        self.response_pub.publish(msg)
+        # queue it for the workers, or drop it if too many are waiting
+        try:
+            self.queue.put_nowait(data)
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+
+    # (worker) wait for a request, and take whatever else is waiting with it, up to the batch size
+    def TakeBatch(self):
+
+        batch = [self.queue.get()]
+        while len(batch) < self.face_analysis_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                break
+        return batch
+
+
+    # (worker) analyze batches of requests as they come in
+    def Run(self):
+
+        while True:
+
+            batch = self.TakeBatch()
+
+            # estimate age and gender (without results, the response has zero confidences)
+            try:
+                thumbs = [opencv_bridge.imgmsg_to_cv2(data.thumb) for data in batch]
+                results = self.estimator.Estimate(thumbs)
+            except Exception:
+                rospy.logerr("face analysis failed:\n{}".format(traceback.format_exc()))
+                with self.lock:
+                    self.failures += 1
+                results = [(0.0,0.0,1,0.0)] * len(batch)
+
+            # and send messages
+            for data,(age,age_confidence,gender,gender_confidence) in zip(batch,results):
+                msg = FaceResponse()
+                msg.session_id = data.session_id
+                msg.camera_id = data.camera_id
+                msg.cface_id = data.cface_id
+                msg.face_id = data.face_id
+                msg.ts = data.ts
+                msg.age = age
+                msg.age_confidence = age_confidence
+                msg.gender = gender
+                msg.gender_confidence = gender_confidence
+                msg.identity = 0
+                msg.identity_confidence = 0.0
+                self.response_pub.publish(msg)
+
+            with self.lock:
+                self.analyzed += len(batch)
+                self.batches += 1
+
+            for data in batch:
+                self.queue.task_done()
 
 
 if __name__ == '__main__':
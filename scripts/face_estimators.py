@@ -0,0 +1,106 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# FACE ESTIMATORS: age and gender estimation for batches of face thumbnails
+#     Estimate() takes a list of OpenCV thumbnails and returns one (age,age_confidence,gender,gender_confidence) per
+#     thumbnail, with zero confidences for the faces that could not be analyzed
+#     OpenBREstimator runs the OpenBiometrics command line once per algorithm for a whole batch, so the models are
+#     loaded once per batch instead of twice per face; each batch gets its own temporary directory with uniquely named
+#     thumbnails and results, so concurrent batches never overwrite each other's files
+#     DummyEstimator is a stand-in that needs no OpenBiometrics, it derives a stable estimate from the thumbnail itself
+
+import os
+import csv
+import shutil
+import tempfile
+import subprocess
+import numpy
+import cv2
+
+
+# confidence of the estimates of the stand-in estimator
+DUMMY_CONFIDENCE = 0.5
+
+
+class OpenBREstimator(object):
+
+
+    def __init__(self,temp_dir,ext):
+
+        self.temp_dir = temp_dir # directory for the batch directories
+        self.ext = ext # thumbnail file extension
+
+
+    # run an OpenBiometrics algorithm on all thumbnails in a directory, returns the result rows by thumbnail filename
+    def Run(self,algorithm,faces_dir,csv_path):
+
+        subprocess.call(["br","-algorithm",algorithm,"-enroll",faces_dir,csv_path])
+        rows = {}
+        if not os.path.exists(csv_path):
+            return rows
+        with open(csv_path,"rb") as file:
+            reader = csv.reader(file)
+            reader.next()
+            for line in reader:
+                rows[os.path.basename(line[0])] = line
+        return rows
+
+
+    def Estimate(self,thumbs):
+
+        batch_dir = tempfile.mkdtemp(prefix="face_analysis_",dir=self.temp_dir)
+        try:
+
+            # save thumbnails for OpenBiometrics
+            faces_dir = os.path.join(batch_dir,"faces")
+            os.makedirs(faces_dir)
+            filenames = []
+            for i in range(0,len(thumbs)):
+                filename = "%04d.%s" % (i,self.ext)
+                cv2.imwrite(os.path.join(faces_dir,filename),thumbs[i])
+                filenames.append(filename)
+
+            # estimate age and gender of the whole batch
+            ages = self.Run("AgeEstimation",faces_dir,os.path.join(batch_dir,"age.csv"))
+            genders = self.Run("GenderEstimation",faces_dir,os.path.join(batch_dir,"gender.csv"))
+
+            # interpret csv results
+            results = []
+            for filename in filenames:
+                age = 0.0
+                age_confidence = 0.0
+                gender = 1
+                gender_confidence = 0.0
+                try:
+                    if filename in ages:
+                        age = float(ages[filename][1])
+                        age_confidence = 1.0  # for now...
+                    if filename in genders:
+                        if genders[filename][10] == "Female":
+                            gender = 2
+                        gender_confidence = 1.0  # for now...
+                except (ValueError,IndexError):
+                    pass
+                results.append((age,age_confidence,gender,gender_confidence))
+            return results
+
+        finally:
+            shutil.rmtree(batch_dir,True)
+
+
+class DummyEstimator(object):
+
+
+    def Estimate(self,thumbs):
+
+        results = []
+        for thumb in thumbs:
+            b,g,r = numpy.mean(thumb.reshape(-1,thumb.shape[-1]),axis=0)[0:3]
+            age = 20.0 + 40.0 * (b + g + r) / (3.0 * 255.0)
+            gender = 1
+            if r > b:
+                gender = 2
+            results.append((age,DUMMY_CONFIDENCE,gender,DUMMY_CONFIDENCE))
+        return results
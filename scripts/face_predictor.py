@@ -12,14 +12,35 @@ from dynamic_reconfigure.server import Server
 from r2_perception.cfg import vision_pipelineConfig as VisionConfig
 from math import sqrt
 from r2_perception.msg import Face,Hand,Saliency
+from candidate_table import CandidateTable,HISTORY_CAPACITY
+
+
+# number of face values that are kept and extrapolated, and where the rect, position, confidence, smile and frown are
+FACE_VALUES = 10
+FACE_RECT = 0
+FACE_POSITION = 4
+FACE_CONFIDENCE = 7
+FACE_SMILE = 8
+FACE_FROWN = 9
+
+def FaceValues(face):
+    # expression strings cannot be extrapolated
+    # landmarks might be useful here
+    # thumb needs no extrapolation
+    return (face.rect.origin.x,face.rect.origin.y,face.rect.size.x,face.rect.size.y,face.position.x,face.position.y,face.position.z,face.confidence,face.smile,face.frown)
 
 
 class FacePredictor(object):
 
 
-    def __init__(self):
+    # the candidate face is a row in a table of faces, a standalone predictor gets its own table
+    def __init__(self,table=None,key=None,capacity=HISTORY_CAPACITY):
 
-        self.faces = [] # list of detected Faces
+        if table is None:
+            table = CandidateTable(FACE_VALUES,capacity,1)
+        self.table = table # table with the times, values and regression sums of the detected faces
+        self.row = table.Allocate(key) # row of this candidate face in the table, which knows its candidate ID
+        self.latest = None # latest detected Face, the only one that keeps its thumbnail, expressions and landmarks
         self.age = 0.0 # estimated age
         self.age_confidence = 0.0 # confidence in age
         self.gender = 0 # estimated gender
@@ -28,112 +49,70 @@ class FacePredictor(object):
         self.identity_confidence = 0.0 # confidence in identity
 
 
+    # give the row back to the table when the candidate face is removed
+    def Release(self):
+
+        self.table.Free(self.row)
+
+
+    # move the history to another table
+    def Move(self,table):
+
+        self.row = self.table.MoveRow(self.row,table)
+        self.table = table
+
+
+    # number of detected faces in the history
+    def Count(self):
+
+        return int(self.table.Count(self.row))
+
+
+    # latest detected face
+    def Latest(self):
+
+        return self.latest
+
+
     def Extrapolate(self,ts):
 
-        n = len(self.faces)
-        if n < 2:
-            return self.faces[0]
-
-        # prepare for linear regression
-        sumf = Face()
-        sumt = 0.0
-        sumtt = 0.0
-        sumft = Face()
-
-        # iterate over last max_n faces only
-        for face in self.faces:
-
-            # time delta
-            t = (ts - face.ts).to_sec()
-
-            # face
-            sumf.rect.origin.x += face.rect.origin.x
-            sumf.rect.origin.y += face.rect.origin.y
-            sumf.rect.size.x += face.rect.size.x
-            sumf.rect.size.y += face.rect.size.y
-            sumf.position.x += face.position.x
-            sumf.position.y += face.position.y
-            sumf.position.z += face.position.z
-            sumf.confidence += face.confidence
-            sumf.smile += face.smile
-            sumf.frown += face.frown
-            # expression strings cannot be extrapolated
-            # landmarks might be useful here
-            # thumb needs no extrapolation
-
-            # time
-            sumt += t
-
-            # time * time
-            sumtt += t * t
-
-            # face * time
-            sumft.rect.origin.x += face.rect.origin.x * t
-            sumft.rect.origin.y += face.rect.origin.y * t
-            sumft.rect.size.x += face.rect.size.x * t
-            sumft.rect.size.y += face.rect.size.y * t
-            sumft.position.x += face.position.x * t
-            sumft.position.y += face.position.y * t
-            sumft.position.z += face.position.z * t
-            sumft.confidence += face.confidence * t
-            sumft.smile += face.smile * t
-            sumft.frown += face.frown * t
-
-        # face slope
-        slpf = Face()
-        den = float(n) * sumtt - sumt * sumt
-        if den == 0.0:
-            return self.faces[0]
-
-        slpf.rect.origin.x = (n * sumft.rect.origin.x - sumt * sumf.rect.origin.x) / den
-        slpf.rect.origin.y = (n * sumft.rect.origin.y - sumt * sumf.rect.origin.y) / den
-        slpf.rect.size.x = (n * sumft.rect.size.x - sumt * sumf.rect.size.x) / den
-        slpf.rect.size.y = (n * sumft.rect.size.y - sumt * sumf.rect.size.y) / den
-        slpf.position.x = (n * sumft.position.x - sumt * sumf.position.x) / den
-        slpf.position.y = (n * sumft.position.y - sumt * sumf.position.y) / den
-        slpf.position.z = (n * sumft.position.z - sumt * sumf.position.z) / den
-        slpf.confidence = (n * sumft.confidence - sumt * sumf.confidence) / den
-        slpf.smile = (n * sumft.smile - sumt * sumf.smile) / den
-        slpf.frown = (n * sumft.frown - sumt * sumf.frown) / den
+        # linear regression from the running sums
+        values,regressed = self.table.Predict([self.row],ts.to_sec(),True)
+        if not regressed[0]:
+            return self.latest
+        values = values[0]
 
         # result
         result = Face()
         result.ts = ts
+        result.capture_ts = self.latest.capture_ts
         result.face_id = 0
-        result.rect.origin.x = (sumf.rect.origin.x - slpf.rect.origin.x * sumt) / float(n)
-        result.rect.origin.y = (sumf.rect.origin.y - slpf.rect.origin.y * sumt) / float(n)
-        result.rect.size.x = (sumf.rect.size.x - slpf.rect.size.x * sumt) / float(n)
-        result.rect.size.y = (sumf.rect.size.y - slpf.rect.size.y * sumt) / float(n)
-        result.position.x = (sumf.position.x - slpf.position.x * sumt) / float(n)
-        result.position.y = (sumf.position.y - slpf.position.y * sumt) / float(n)
-        result.position.z = (sumf.position.z - slpf.position.z * sumt) / float(n)
-        result.confidence = (sumf.confidence - slpf.confidence * sumt) / float(n)
-        result.smile = (sumf.smile - slpf.smile * sumt) / float(n)
-        result.frown = (sumf.frown - slpf.frown * sumt) / float(n)
+        result.rect.origin.x = values[0]
+        result.rect.origin.y = values[1]
+        result.rect.size.x = values[2]
+        result.rect.size.y = values[3]
+        result.position.x = values[4]
+        result.position.y = values[5]
+        result.position.z = values[6]
+        result.confidence = values[7]
+        result.smile = values[8]
+        result.frown = values[9]
 
         return result
 
 
     def PruneBefore(self,ts):
 
-        new_faces = [face for face in self.faces if face.ts.to_sec() >= ts.to_sec()]
-        self.faces = new_faces
+        self.table.PruneBefore([self.row],ts.to_sec())
 
 
     def Append(self,face):
 
-        self.faces.append(face)
+        self.latest = face
+        self.table.Append(self.row,face.ts.to_sec(),FaceValues(face))
 
 
     def CalculateConfidence(self,full_points):
 
-        # calculate confidence
-        n = len(self.faces)
-        if n > full_points:
-            n = full_points
-        total = 0.0
-        for face in self.faces[-n:]:
-            total += face.confidence
-        total /= float(full_points)
-
-        return total
+        # calculate confidence (only over the last full_points faces, so this doesn't depend on the history length)
+        return float(self.table.Confidence([self.row],FACE_CONFIDENCE,full_points)[0])
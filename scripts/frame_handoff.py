@@ -0,0 +1,119 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# FRAME HANDOFF: double-buffered frame slot between the camera subscriber and the detection timer
+#     the subscriber puts each new frame in the back slot, the timer takes the newest frame from the front
+#     the lock is only held to swap references, so detection runs without blocking the subscriber
+#     frames that are replaced before the timer took them are dropped and counted
+#     each frame is numbered, and a frame is only taken once, so the timer never processes the same frame twice
+#     timer ticks that find no new frame are counted as skipped duplicates
+#     in event-driven mode, the detector waits for new frames instead of running a timer
+
+from __future__ import with_statement
+import time
+from threading import Lock,Condition
+
+
+class FrameHandoff(object):
+
+
+    def __init__(self):
+
+        self.lock = Lock()
+        self.arrived = Condition(self.lock)
+
+        self.cur = None # newest frame
+        self.cur_ts = 0.0
+        self.seq = 0 # sequence number of the newest frame
+        self.taken_seq = 0 # sequence number of the last frame taken
+
+        self.received = 0 # total number of frames put
+        self.taken = 0 # total number of frames taken
+        self.dropped = 0 # total number of frames replaced before they were taken
+        self.duplicates = 0 # total number of takes that found no new frame
+
+        self.lock_total = 0.0 # total time the lock was held since last stats (sec.)
+        self.lock_max = 0.0 # longest time the lock was held since last stats (sec.)
+        self.lock_count = 0 # number of times the lock was held since last stats
+
+
+    # account for the time the lock was held
+    def Account(self,start):
+
+        held = time.time() - start
+        self.lock_total += held
+        self.lock_count += 1
+        if held > self.lock_max:
+            self.lock_max = held
+
+
+    # (subscriber) put a new frame
+    def Put(self,frame,ts):
+
+        with self.lock:
+
+            start = time.time()
+
+            # the previous frame was never taken
+            if self.seq != self.taken_seq:
+                self.dropped += 1
+
+            self.cur = frame
+            self.cur_ts = ts
+            self.seq += 1
+            self.received += 1
+            self.arrived.notify_all()
+
+            self.Account(start)
+
+
+    # (timer) take the newest frame if it wasn't taken before, returns (frame,ts), or (None,0.0) if there is no new frame
+    def Take(self):
+
+        with self.lock:
+
+            start = time.time()
+
+            if self.seq == self.taken_seq:
+                if self.seq != 0:
+                    self.duplicates += 1
+                result = (None,0.0)
+            else:
+                self.taken_seq = self.seq
+                self.taken += 1
+                result = (self.cur,self.cur_ts)
+
+            self.Account(start)
+
+        return result
+
+
+    # (event-driven) wait until there is a frame that wasn't taken yet, returns False on timeout
+    def Wait(self,timeout):
+
+        with self.lock:
+
+            if self.seq == self.taken_seq:
+                self.arrived.wait(timeout)
+            return self.seq != self.taken_seq
+
+
+    # fill out the frame handoff fields of a DetectorStats message and restart the lock measurements
+    def FillStats(self,msg):
+
+        with self.lock:
+
+            msg.frames_received = self.received
+            msg.frames_taken = self.taken
+            msg.frames_dropped = self.dropped
+            msg.duplicates_skipped = self.duplicates
+            msg.lock_hold_mean = 0.0
+            if self.lock_count > 0:
+                msg.lock_hold_mean = self.lock_total / float(self.lock_count)
+            msg.lock_hold_max = self.lock_max
+
+            self.lock_total = 0.0
+            self.lock_max = 0.0
+            self.lock_count = 0
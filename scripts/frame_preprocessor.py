@@ -0,0 +1,135 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# FRAME PREPROCESSING: convert a camera frame once and share the results between all detectors
+#     the frame is converted from ROS to OpenCV only once
+#     work-size images are rescaled and unrotated once per distinct work size and cached
+#     a small Gaussian pyramid can be built on top of each work-size image
+#     rectangles found on a work image can be cut out of the full-size frame, without unrotating the whole frame
+
+import cv2
+from cv_bridge import CvBridge
+
+
+# create OpenCV-ROS bridge object
+opencv_bridge = CvBridge()
+
+
+# unrotate an OpenCV image according to the camera rotation
+def UnrotateImage(image,rotate):
+
+    if rotate == 90:
+        return cv2.transpose(image)
+    elif rotate == -90:
+        return cv2.flip(cv2.transpose(image),1)
+    elif rotate == 180:
+        # the detectors always flipped horizontally and then both ways, which comes down to a vertical flip
+        return cv2.flip(image,0)
+    return image
+
+
+class FramePreprocessor(object):
+
+
+    def __init__(self,rotate=0):
+
+        self.rotate = rotate # camera rotation (-90,0,90,180)
+        self.image = None # converted camera frame, still rotated
+        self.unrotated_image = None # unrotated full-size frame, built when needed
+        self.work_images = {} # unrotated work-size images by work size
+        self.pyramids = {} # pyramids by work size and number of levels
+
+
+    # convert a new camera frame from ROS to OpenCV
+    def SetFrame(self,data):
+
+        self.SetImage(opencv_bridge.imgmsg_to_cv2(data,"bgr8"))
+
+
+    # use a new (already converted) OpenCV frame
+    def SetImage(self,image):
+
+        self.image = image
+        self.unrotated_image = None
+        self.work_images = {}
+        self.pyramids = {}
+
+
+    # change the rotation, this invalidates the derived images
+    def SetRotate(self,rotate):
+
+        if rotate != self.rotate:
+            self.rotate = rotate
+            self.unrotated_image = None
+            self.work_images = {}
+            self.pyramids = {}
+
+
+    # get the unrotated full-size frame
+    def GetUnrotatedImage(self):
+
+        if self.image is None:
+            return None
+
+        if self.unrotated_image is None:
+            self.unrotated_image = UnrotateImage(self.image,self.rotate)
+        return self.unrotated_image
+
+
+    # get the unrotated work image for a work size as configured in vision_pipeline.cfg
+    def GetWorkImage(self,width,height):
+
+        if self.image is None:
+            return None
+
+        # rescale before unrotating, so the work sizes mean the same as they always did
+        if (width,height) not in self.work_images:
+            image = cv2.resize(self.image,(width,height),interpolation=cv2.INTER_LINEAR)
+            self.work_images[(width,height)] = UnrotateImage(image,self.rotate)
+        return self.work_images[(width,height)]
+
+
+    # cut a rectangle of the unrotated work image out of the full-size frame instead, returns the unrotated crop
+    def CropWorkRect(self,x,y,w,h,width,height):
+
+        if self.image is None:
+            return None
+
+        # normalized rectangle on the unrotated work image
+        x0 = float(x) / float(width)
+        y0 = float(y) / float(height)
+        x1 = float(x + w) / float(width)
+        y1 = float(y + h) / float(height)
+
+        # the same rectangle on the (rotated) frame
+        if self.rotate == 90:
+            x0,y0,x1,y1 = y0,x0,y1,x1
+        elif self.rotate == -90:
+            x0,y0,x1,y1 = y0,1.0 - x1,y1,1.0 - x0
+        elif self.rotate == 180:
+            y0,y1 = 1.0 - y1,1.0 - y0
+
+        # cut it out and only unrotate the crop
+        frame_height = self.image.shape[0]
+        frame_width = self.image.shape[1]
+        fx0 = int(round(x0 * float(frame_width)))
+        fy0 = int(round(y0 * float(frame_height)))
+        fx1 = max(int(round(x1 * float(frame_width))),fx0 + 1)
+        fy1 = max(int(round(y1 * float(frame_height))),fy0 + 1)
+        return UnrotateImage(self.image[fy0:fy1,fx0:fx1].copy(),self.rotate)
+
+
+    # get the work image and successively halved versions of it
+    def GetPyramid(self,width,height,levels):
+
+        if self.image is None:
+            return []
+
+        if (width,height,levels) not in self.pyramids:
+            pyramid = [self.GetWorkImage(width,height)]
+            for i in range(1,levels):
+                pyramid.append(cv2.pyrDown(pyramid[-1]))
+            self.pyramids[(width,height,levels)] = pyramid
+        return self.pyramids[(width,height,levels)]
@@ -0,0 +1,134 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# FRAME RING: memory-mapped ring buffer of camera frames, shared between processes on the same host
+#     one writer (preprocess_frames) copies each frame into the next slot and publishes a small FrameSlot descriptor
+#     readers (the detectors) map the slot as a NumPy view, without copying the frame
+#     each slot has a begin and end sequence number, so readers can tell if a slot was (partially) overwritten
+
+import os
+import time
+import numpy
+
+
+# where the ring buffers live (tmpfs, so the frames never touch a disk)
+SHM_DIR = "/dev/shm"
+
+# ring header: ring ID, number of slots, frame height, frame width, frame channels
+RING_HEADER_SIZE = 5
+
+# slot header: begin sequence number, end sequence number
+SLOT_HEADER_SIZE = 2
+
+
+class FrameRing(object):
+
+
+    def __init__(self,name):
+
+        self.path = SHM_DIR + "/r2_perception_" + name.strip("/").replace("/","_") + ".ring"
+        self.ring_id = 0 # ID of the currently mapped ring, changes whenever the writer recreates the ring
+        self.slots = 0 # number of slots
+        self.shape = None # shape of one frame
+        self.header = None # mapped ring and slot headers
+        self.data = None # mapped frames
+        self.seq = 0 # last written sequence number (writer only)
+
+
+    # map the headers and frames of a ring file
+    def Map(self,mode):
+
+        header = numpy.memmap(self.path,dtype=numpy.int64,mode=mode,shape=(RING_HEADER_SIZE,))
+        self.ring_id = int(header[0])
+        self.slots = int(header[1])
+        self.shape = (int(header[2]),int(header[3]),int(header[4]))
+        self.header = numpy.memmap(self.path,dtype=numpy.int64,mode=mode,shape=(RING_HEADER_SIZE + self.slots * SLOT_HEADER_SIZE,))
+        offset = (RING_HEADER_SIZE + self.slots * SLOT_HEADER_SIZE) * 8
+        self.data = numpy.memmap(self.path,dtype=numpy.uint8,mode=mode,offset=offset,shape=(self.slots,) + self.shape)
+
+
+    # (writer) create a new ring for frames of a specific shape
+    def Create(self,slots,shape):
+
+        # build the new ring next to the old one and swap it in, so readers that still map the old one don't break
+        temp_path = self.path + ".new"
+        offset = (RING_HEADER_SIZE + slots * SLOT_HEADER_SIZE) * 8
+        with open(temp_path,"wb") as file:
+            file.truncate(offset + slots * shape[0] * shape[1] * shape[2])
+        header = numpy.memmap(temp_path,dtype=numpy.int64,mode="r+",shape=(RING_HEADER_SIZE,))
+        header[0] = (int(time.time() * 1000.0) + os.getpid()) & 0xFFFFFFFF
+        header[1] = slots
+        header[2] = shape[0]
+        header[3] = shape[1]
+        header[4] = shape[2]
+        header.flush()
+        del header
+        os.rename(temp_path,self.path)
+
+        self.Map("r+")
+        self.seq = 0
+
+
+    # (writer) copy a frame into the next slot, returns slot index and sequence number
+    def Write(self,image,slots):
+
+        # make sure the ring fits the frame
+        if image.ndim == 2:
+            image = image.reshape(image.shape + (1,))
+        if (self.data is None) or (self.shape != image.shape) or (self.slots != slots):
+            self.Create(slots,image.shape)
+
+        self.seq += 1
+        slot = self.seq % self.slots
+        base = RING_HEADER_SIZE + slot * SLOT_HEADER_SIZE
+
+        # mark the slot as being written, copy the frame and mark it as done
+        self.header[base] = self.seq
+        self.data[slot] = image
+        self.header[base + 1] = self.seq
+
+        return slot,self.seq
+
+
+    # (writer) remove the ring file
+    def Remove(self):
+
+        self.header = None
+        self.data = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+    # (reader) get a frame from a FrameSlot descriptor as a NumPy view, or None if it's not available anymore
+    def View(self,desc):
+
+        # (re)map the ring if the writer created a new one
+        if (self.data is None) or (desc.ring_id != self.ring_id):
+            if not os.path.exists(self.path):
+                return None
+            self.Map("r")
+            if desc.ring_id != self.ring_id:
+                return None
+
+        if desc.slot >= self.slots:
+            return None
+
+        # the frame has to be completely written and not yet overwritten
+        base = RING_HEADER_SIZE + desc.slot * SLOT_HEADER_SIZE
+        if (self.header[base] != desc.seq) or (self.header[base + 1] != desc.seq):
+            return None
+
+        image = self.data[desc.slot]
+        if image.shape[2] == 1:
+            image = image.reshape(image.shape[:2])
+        return image
+
+
+    # (reader) check that a frame obtained with View was not overwritten in the meantime
+    def IsCurrent(self,desc):
+
+        if (self.header is None) or (desc.ring_id != self.ring_id) or (desc.slot >= self.slots):
+            return False
+        return self.header[RING_HEADER_SIZE + desc.slot * SLOT_HEADER_SIZE] == desc.seq
@@ -7,8 +7,14 @@ from __future__ import with_statement
 import os
 import rospy
 import time
-from r2_perception.msg import CandidateFace,CandidateHand,CandidateSaliency,EstablishedFace,EstablishedHand,EstablishedSaliency
+from math import sqrt
+from r2_perception.msg import CandidateFace,CandidateHand,CandidateSaliency,EstablishedFace,EstablishedHand,EstablishedSaliency,LatencyReport
 from threading import Lock
+from latency_stats import LatencyStats
+
+
+# latency stages of fusion (faces only)
+LATENCY_STAGES = ["receive","fuse","publish"]
 
 
 class FaceLink(object):
@@ -26,6 +32,7 @@ class Fusion(object):
 
         # prepare observations
         self.cfaces = {}
+        self.updated_cfaces = set() # (camera_id,cface_id) of the candidate faces that arrived since the last tick
         self.chands = {}
         self.csaliencies = {}
 
@@ -40,8 +47,16 @@ class Fusion(object):
 
         #self.visualize = rospy.get_param("/visualize")
 
+        self.latency_report_period = rospy.get_param("/latency_report_period",1.0)
+        self.latency_window = rospy.get_param("/latency_window",1000)
+        self.latency_dump_flag = rospy.get_param("/latency_dump_flag",False)
+        self.latency_dump_dir = rospy.get_param("/latency_dump_dir","/tmp")
+        self.latency = LatencyStats("fusion",LATENCY_STAGES,self.latency_window)
+
         # get dynamic parameters (TODO: dynamic reconfigure for fusion too)
         self.fusion_rate = rospy.get_param("fusion_rate")
+        self.face_fuse_distance = rospy.get_param("face_fuse_distance")
+        self.face_keep_time = rospy.get_param("face_keep_time")
         self.timer = rospy.Timer(rospy.Duration(1.0 / self.fusion_rate),self.HandleTimer)
 
         self.cface_subs = []
@@ -66,15 +81,25 @@ class Fusion(object):
         self.ehand_pub = rospy.Publisher("hand",EstablishedHand,queue_size=5)
         self.esaliency_pub = rospy.Publisher("saliency",EstablishedSaliency,queue_size=5)
 
+        # start publishing latency percentiles
+        self.latency_pub = rospy.Publisher("latency",LatencyReport,queue_size=5)
+        self.latency_timer = rospy.Timer(rospy.Duration(self.latency_report_period),self.HandleLatencyTimer)
+
 
     def HandleCandidateFace(self,data):
 
+        # if capture time is missing, take the candidate time
+        if data.capture_ts.is_zero():
+            data.capture_ts = data.ts
+        self.latency.AddSince("receive",data.capture_ts)
+
         with self.lock:
 
             # for now, just take the most recent candidate face
             if data.camera_id not in self.cfaces:
                 self.cfaces[data.camera_id] = {}
             self.cfaces[data.camera_id][data.cface_id] = data
+            self.updated_cfaces.add((data.camera_id,data.cface_id))
 
 
     def HandleCandidateHand(self,data):
@@ -97,13 +122,33 @@ class Fusion(object):
             self.csaliencies[data.camera_id][data.csaliency_id] = data
 
 
+    # at latency report rate
+    def HandleLatencyTimer(self,event):
+
+        msg = LatencyReport()
+        msg.ts = rospy.get_rostime()
+        self.latency.FillReport(msg)
+        self.latency_pub.publish(msg)
+        if self.latency_dump_flag:
+            self.latency.Dump(msg,self.latency_dump_dir + "/fusion.csv")
+
+
     def HandleTimer(self,data):
 
         with self.lock:
 
             ts = data.current_expected
+            start = time.time()
 
-            # prepare established observations
+            # forget the candidate faces that haven't been updated for a while
+            prune_before_time = ts - rospy.Duration.from_sec(self.face_keep_time)
+            for camera_id in self.cfaces:
+                for cface_id in list(self.cfaces[camera_id].keys()):
+                    if self.cfaces[camera_id][cface_id].ts < prune_before_time:
+                        del self.cfaces[camera_id][cface_id]
+                        self.updated_cfaces.discard((camera_id,cface_id))
+
+            # prepare established observations (faces with whether any of their candidates was updated since the last tick)
             efaces = []
             ehands = []
             esaliencies = []
@@ -112,28 +157,22 @@ class Fusion(object):
             facegroups = []
 
             # iterate over all pipeline pairs without duplications
-            for camera_id1 in self.faces:
+            for camera_id1 in self.cfaces:
                 for camera_id2 in self.cfaces:
                     if camera_id1 < camera_id2:  # the IDs are numeric hashes based on the unique pipeline name
 
-                        print "camera_id1 {} and camera_id2 {}:".format(camera_id1,camera_id2)
-
                         # iterate over all combinations of faces
                         for cface_id1 in self.cfaces[camera_id1]:
                             for cface_id2 in self.cfaces[camera_id2]:
 
-                                print "    cface_id1 {} and cface_id2 {}:".format(cface_id1,cface_id2)
-
                                 # calculate distance
                                 dx = self.cfaces[camera_id1][cface_id1].position.x - self.cfaces[camera_id2][cface_id2].position.x
                                 dy = self.cfaces[camera_id1][cface_id1].position.y - self.cfaces[camera_id2][cface_id2].position.y
                                 dz = self.cfaces[camera_id1][cface_id1].position.z - self.cfaces[camera_id2][cface_id2].position.z
                                 distance = sqrt(dx * dx + dy * dy + dz * dz)
 
-                                print "        distance {} m".format(distance)
-
                                 # if close enough,
-                                if distance < face_fuse_distance:
+                                if distance < self.face_fuse_distance:
 
                                     # find existing face group that has camera_id1:face_id1
                                     found = -1
@@ -142,7 +181,7 @@ class Fusion(object):
                                             if (facegroups[i][k].camera_id == camera_id1) and (facegroups[i][k].cface_id == cface_id1):
                                                 found = i
                                                 break
-                                        if found:
+                                        if found != -1:
                                             break
 
                                     # prepare link
@@ -151,11 +190,9 @@ class Fusion(object):
                                     link2.cface_id = cface_id2
 
                                     if found != -1:
-                                        print "            close enough, add link to existing group"
                                         # add link to existing group
                                         facegroups[found].append(link2)
                                     else:
-                                        print "            close enough, create new group for link"
                                         # create new group with these links
                                         group = []
                                         link1 = FaceLink()
@@ -171,13 +208,14 @@ class Fusion(object):
                 eface = EstablishedFace()
                 eface.session_id = self.session_id
                 eface.ts = ts
+                eface.capture_ts = min([self.cfaces[link.camera_id][link.cface_id].capture_ts for link in group])
                 eface.position.x = 0.0
                 eface.position.y = 0.0
                 eface.position.z = 0.0
                 eface.confidence = 0.0
                 eface.smile = 0.0
                 eface.frown = 0.0
-                eface.expressions = ""
+                eface.expressions = []
                 eface.age = 0.0
                 eface.age_confidence = 0.0
                 eface.gender = 0
@@ -185,18 +223,15 @@ class Fusion(object):
                 eface.identity = 0
                 eface.identity_confidence = 0
 
-                print "converting group to established face:"
-
                 n = len(group)
                 for link in group:
-                    print "    camera_id {}, cface_id {}, position {},{},{}".format(camera_id,cface_id,self.cfaces[link.camera_id][link.cface_id].position.x,self.cfaces[link.camera_id][link.cface_id].position.y,self.cfaces[link.camera_id][link.cface_id].position.z)
                     eface.position.x += self.cfaces[link.camera_id][link.cface_id].position.x
                     eface.position.y += self.cfaces[link.camera_id][link.cface_id].position.y
                     eface.position.z += self.cfaces[link.camera_id][link.cface_id].position.z
                     eface.confidence += self.cfaces[link.camera_id][link.cface_id].confidence
                     eface.smile += self.cfaces[link.camera_id][link.cface_id].smile
                     eface.frown += self.cfaces[link.camera_id][link.cface_id].frown
-                    eface.expressions += self.cfaces[link.camera_id][link.cface_id].expressions
+                    eface.expressions += [expression.data for expression in self.cfaces[link.camera_id][link.cface_id].expressions]
                     eface.age += self.cfaces[link.camera_id][link.cface_id].age
                     eface.age_confidence += self.cfaces[link.camera_id][link.cface_id].age_confidence
 
@@ -211,7 +246,7 @@ class Fusion(object):
                 # TODO: gender is the most likely of any of the group
                 # TODO: identity is the most likely of any of the group
 
-                efaces.append(eface)
+                efaces.append((eface,any([(link.camera_id,link.cface_id) in self.updated_cfaces for link in group])))
 
             # create established face for all faces not referenced in any group
             for camera_id in self.cfaces:
@@ -230,26 +265,24 @@ class Fusion(object):
                     # and convert to established face if not found
                     if not found:
 
-                        print "converting single candidate face to established face:"
-                        print "    camera_id {}, cface_id {}, position {},{},{}".format(camera_id,cface_id,self.cfaces[camera_id][cface_id].position.x,self.cfaces[camera_id][cface_id].position.y,self.cfaces[camera_id][cface_id].position.z)
-
                         eface = EstablishedFace()
                         eface.session_id = self.session_id
                         eface.ts = ts
+                        eface.capture_ts = self.cfaces[camera_id][cface_id].capture_ts
                         eface.position.x = self.cfaces[camera_id][cface_id].position.x
                         eface.position.y = self.cfaces[camera_id][cface_id].position.y
                         eface.position.z = self.cfaces[camera_id][cface_id].position.z
                         eface.confidence = self.cfaces[camera_id][cface_id].confidence
                         eface.smile = self.cfaces[camera_id][cface_id].smile
                         eface.frown = self.cfaces[camera_id][cface_id].frown
-                        eface.expressions = self.cfaces[camera_id][cface_id].expressions
+                        eface.expressions = [expression.data for expression in self.cfaces[camera_id][cface_id].expressions]
                         eface.age = self.cfaces[camera_id][cface_id].age
                         eface.age_confidence = self.cfaces[camera_id][cface_id].age_confidence
                         eface.gender = self.cfaces[camera_id][cface_id].gender
                         eface.gender_confidence = self.cfaces[camera_id][cface_id].gender_confidence
                         eface.identity = self.cfaces[camera_id][cface_id].identity
                         eface.identity_confidence = self.cfaces[camera_id][cface_id].identity_confidence
-                        efaces.append(eface)
+                        efaces.append((eface,(camera_id,cface_id) in self.updated_cfaces))
 
 
             # fuse candidate hands between pipelines
@@ -276,33 +309,30 @@ class Fusion(object):
 
             # fuse sounds and saliency
 
-            # output all established stuff
-            for eface in efaces:
+            self.latency.Add("fuse",time.time() - start)
+
+            # output all established stuff, the latency only counts for faces with new candidates
+            for eface,updated in efaces:
                 self.eface_pub.publish(eface)
+                if updated:
+                    self.latency.AddSince("publish",eface.capture_ts)
+            self.updated_cfaces.clear()
 
             # TODO: send markers to RViz
             #if self.visualize:
             #    ()
 
-            #prune_before_time = ts - self.face_keep_time
-
-            # clean out old faces from self.cfaces
-            for camera_id in self.cfaces:
-                for cface_id in self.cfaces[camera_id]:
-                    ()
-                    #if self.cfaces[camera_id][cface_id].ts.to_sec() < prune_before_time:
-
             # clean out old hands from self.chands
             for camera_id in self.chands:
                 for chand_id in self.chands[camera_id]:
                     ()
-                    #if self.chands[camera_id][chand_id].ts.to_sec() < prune_before_time:
+                    #if self.chands[camera_id][chand_id].ts < prune_before_time:
 
             # clean out old saliencies from self.csaliencies
             for camera_id in self.csaliencies:
                 for csaliency_id in self.csaliencies[camera_id]:
                     ()
-                    #if self.csaliencies[camera_id][csaliency_id].ts.to_sec() < prune_before_time:
+                    #if self.csaliencies[camera_id][csaliency_id].ts < prune_before_time:
 
 
 if __name__ == '__main__':
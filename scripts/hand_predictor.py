@@ -12,103 +12,112 @@ from dynamic_reconfigure.server import Server
 from r2_perception.cfg import vision_pipelineConfig as VisionConfig
 from math import sqrt
 from r2_perception.msg import Face,Hand,Saliency
+from candidate_table import CandidateTable,HISTORY_CAPACITY
+from collections import deque
+
+
+# number of hand values that are kept and extrapolated, and where the position and confidence are
+HAND_VALUES = 4
+HAND_POSITION = 0
+HAND_CONFIDENCE = 3
+
+def HandValues(hand):
+    return (hand.position.x,hand.position.y,hand.position.z,hand.confidence)
 
 
 class HandPredictor(object):
 
 
-    def __init__(self):
+    # the candidate hand is a row in a table of hands, a standalone predictor gets its own table
+    def __init__(self,table=None,key=None,capacity=HISTORY_CAPACITY):
+
+        if table is None:
+            table = CandidateTable(HAND_VALUES,capacity,1)
+        self.table = table # table with the times, values and regression sums of the detected hands
+        self.row = table.Allocate(key) # row of this candidate hand in the table, which knows its candidate ID
+        self.latest = None # latest detected Hand
+        self.hand_gestures = deque() # gestures of each hand in the history
+        self.gesture_counts = {} # number of hands showing each gesture
+        self.gestures = [] # gestures in the order they were first seen
+
+
+    # give the row back to the table when the candidate hand is removed
+    def Release(self):
+
+        self.table.Free(self.row)
+
+
+    # move the history to another table
+    def Move(self,table):
+
+        self.row = self.table.MoveRow(self.row,table)
+        self.table = table
+
 
-        self.hands = [] # list of detected Hands
+    # number of detected hands in the history
+    def Count(self):
+
+        return int(self.table.Count(self.row))
+
+
+    # latest detected hand
+    def Latest(self):
+
+        return self.latest
 
 
     def Extrapolate(self,ts):
 
-        n = len(self.hands)
-        if n < 2:
-            return self.hands[0]
-
-        # prepare for linear regression
-        sumh = Hand()
-        sumt = 0.0
-        sumtt = 0.0
-        sumht = Hand()
-        gestures = []
-
-        # iterate over last max_n hands only
-        for hand in self.hands:
-
-            # time delta
-            t = (ts - hand.ts).to_sec()
-
-            # hand
-            sumh.position.x += hand.position.x
-            sumh.position.y += hand.position.y
-            sumh.position.z += hand.position.z
-            sumh.confidence += hand.confidence
-
-            # time
-            sumt += t
-
-            # time * time
-            sumtt += t * t
-
-            # hand * time
-            sumht.position.x += hand.position.x * t
-            sumht.position.y += hand.position.y * t
-            sumht.position.z += hand.position.z * t
-            sumht.confidence += hand.confidence * t
-
-            # gestures
-            for gesture in hand.gestures:
-                if gesture not in gestures:
-                    gestures.append(gesture)
-
-        # hand slope
-        slph = Hand()
-        den = float(n) * sumtt - sumt * sumt
-        if den == 0.0:
-            return self.hands[0]
-
-        slph.position.x = (n * sumht.position.x - sumt * sumh.position.x) / den
-        slph.position.y = (n * sumht.position.y - sumt * sumh.position.y) / den
-        slph.position.z = (n * sumht.position.z - sumt * sumh.position.z) / den
-        slph.confidence = (n * sumht.confidence - sumt * sumh.confidence) / den
+        # linear regression from the running sums
+        values,regressed = self.table.Predict([self.row],ts.to_sec(),True)
+        if not regressed[0]:
+            return self.latest
+        values = values[0]
 
         # result
         result = Hand()
         result.ts = ts
         result.hand_id = 0
-        result.position.x = (sumh.position.x - slph.position.x * sumt) / float(n)
-        result.position.y = (sumh.position.y - slph.position.y * sumt) / float(n)
-        result.position.z = (sumh.position.z - slph.position.z * sumt) / float(n)
-        result.confidence = (sumh.confidence - slph.confidence * sumt) / float(n)
-        result.gestures = gestures
+        result.position.x = values[0]
+        result.position.y = values[1]
+        result.position.z = values[2]
+        result.confidence = values[3]
+        result.gestures = list(self.gestures)
 
         return result
 
 
-    def PruneBefore(self,ts):
+    # forget the gestures of the oldest n hands
+    def ForgetGestures(self,n):
 
-        new_hands = [hand for hand in self.hands if hand.ts.to_sec() >= ts.to_sec()]
-        self.hands = new_hands
+        for i in range(0,n):
+            for gesture in self.hand_gestures.popleft():
+                self.gesture_counts[gesture] -= 1
+                if self.gesture_counts[gesture] == 0:
+                    del self.gesture_counts[gesture]
+                    self.gestures.remove(gesture)
 
 
+    def PruneBefore(self,ts):
+
+        removed = self.table.PruneBefore([self.row],ts.to_sec())
+        self.ForgetGestures(int(removed[0]))
+
 
     def Append(self,hand):
 
-        self.hands.append(hand)
+        self.latest = hand
+        self.table.Append(self.row,hand.ts.to_sec(),HandValues(hand))
 
+        self.hand_gestures.append(list(hand.gestures))
+        for gesture in hand.gestures:
+            if gesture not in self.gesture_counts:
+                self.gesture_counts[gesture] = 0
+                self.gestures.append(gesture)
+            self.gesture_counts[gesture] += 1
 
-    def CalculateConfidence(self,full_points):
 
-        # calculate confidence
-        n = len(self.hands)
-        if n > full_points:
-            n = full_points
-        total = 0.0
-        for hand in self.hands[-n:]:
-            total += hand.confidence
-        total /= float(full_points)
+    def CalculateConfidence(self,full_points):
 
-        return total
+        # calculate confidence (only over the last full_points hands, so this doesn't depend on the history length)
+        return float(self.table.Confidence([self.row],HAND_CONFIDENCE,full_points)[0])
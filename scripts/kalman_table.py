@@ -0,0 +1,129 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# KALMAN TABLE: candidate table that predicts with a constant-velocity Kalman filter instead of linear regression
+#     each value of each row has its own filter state (value and velocity) and covariance, updated with every observation
+#     updating and predicting cost the same no matter how long the history is, and the filter doesn't need the history
+#     the history ring is still kept for the confidence and the keep time, but there are no regression sums to maintain
+#     the process noise is the variance of the (white noise) acceleration per second, the measurement noise is the variance
+#     of an observed value
+
+import numpy
+from candidate_table import CandidateTable,HISTORY_CAPACITY,TABLE_ROWS
+
+
+# default noise (value units squared per second cubed, and value units squared)
+PROCESS_NOISE = 1.0
+MEASUREMENT_NOISE = 0.01
+
+# variance of the velocity before the second observation
+INITIAL_VELOCITY_VARIANCE = 100.0
+
+
+class KalmanTable(CandidateTable):
+
+
+    def __init__(self,columns,capacity=HISTORY_CAPACITY,rows=TABLE_ROWS):
+
+        self.process_noise = PROCESS_NOISE
+        self.measurement_noise = MEASUREMENT_NOISE
+
+        self.state = numpy.zeros((0,columns,2)) # value and velocity of each value of each row
+        self.covariance = numpy.zeros((0,columns,3)) # value variance, covariance and velocity variance of each value of each row
+        self.last_t = numpy.zeros(0) # time of the last update of each row
+        self.updates = numpy.zeros(0,dtype=numpy.int64) # number of updates of each row
+
+        CandidateTable.__init__(self,columns,capacity,rows)
+
+
+    def SetNoise(self,process_noise,measurement_noise):
+
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+
+    def Grow(self,rows):
+
+        extra = rows - self.rows
+        self.state = numpy.concatenate((self.state,numpy.zeros((extra,self.columns,2))))
+        self.covariance = numpy.concatenate((self.covariance,numpy.zeros((extra,self.columns,3))))
+        self.last_t = numpy.concatenate((self.last_t,numpy.zeros(extra)))
+        self.updates = numpy.concatenate((self.updates,numpy.zeros(extra,dtype=numpy.int64)))
+        CandidateTable.Grow(self,rows)
+
+
+    def Clear(self,row):
+
+        CandidateTable.Clear(self,row)
+        self.updates[row] = 0
+
+
+    # there are no regression sums
+    def Accumulate(self,row,sample,sign):
+
+        pass
+
+
+    def Forget(self,row,samples):
+
+        pass
+
+
+    def Append(self,row,t,values):
+
+        CandidateTable.Append(self,row,t,values)
+
+        z = numpy.asarray(values,dtype=numpy.float64)
+        state = self.state[row]
+        covariance = self.covariance[row]
+
+        if self.updates[row] == 0:
+
+            # start at the first observation, with unknown velocity
+            state[:,0] = z
+            state[:,1] = 0.0
+            covariance[:,0] = self.measurement_noise
+            covariance[:,1] = 0.0
+            covariance[:,2] = INITIAL_VELOCITY_VARIANCE
+
+        else:
+
+            # predict to this time
+            dt = max(t - self.last_t[row],0.0)
+            q = self.process_noise
+            p00 = covariance[:,0] + 2.0 * dt * covariance[:,1] + dt * dt * covariance[:,2] + q * dt * dt * dt / 3.0
+            p01 = covariance[:,1] + dt * covariance[:,2] + q * dt * dt / 2.0
+            p11 = covariance[:,2] + q * dt
+            predicted = state[:,0] + dt * state[:,1]
+
+            # correct with the observation
+            k0 = p00 / (p00 + self.measurement_noise)
+            k1 = p01 / (p00 + self.measurement_noise)
+            innovation = z - predicted
+            state[:,0] = predicted + k0 * innovation
+            state[:,1] += k1 * innovation
+            covariance[:,0] = (1.0 - k0) * p00
+            covariance[:,1] = (1.0 - k0) * p01
+            covariance[:,2] = p11 - k1 * p01
+
+        self.last_t[row] = t
+        self.updates[row] += 1
+
+
+    # values of each given row at a time, returns the values and which rows were actually filtered
+    # (without filtering, or before the second observation, this is the latest observation)
+    def Predict(self,rows,t,regress):
+
+        rows = numpy.asarray(rows,dtype=numpy.int64)
+
+        latest,filtered = CandidateTable.Predict(self,rows,t,False)
+        if not regress:
+            return latest,filtered
+
+        filtered = self.updates[rows] >= 2
+        dt = t - self.last_t[rows]
+        values = self.state[rows,:,0] + dt[:,numpy.newaxis] * self.state[rows,:,1]
+
+        return numpy.where(filtered[:,numpy.newaxis],values,latest),filtered
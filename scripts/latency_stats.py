@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# LATENCY STATS: rolling per-stage latency percentiles of one node
+#     each stage keeps its most recent samples, so the percentiles follow what the node is doing now
+#     a stage is either the time a piece of work took (decode, detect, associate, transform, fuse), or the time since
+#     capture at some point in the node (the capture time is the camera frame stamp, carried along in the faces):
+#     'receive' when the input arrives, and 'publish' when the output leaves
+#     the percentiles are reported as LatencyReport messages, and can be appended to a CSV file as well
+
+from __future__ import with_statement
+import os
+import numpy
+import rospy
+from collections import deque
+from threading import Lock
+
+
+# default number of samples per stage that the percentiles are taken over
+LATENCY_WINDOW = 1000
+
+# percentiles in a report
+PERCENTILES = [50.0,95.0,99.0]
+
+
+# capture time of a camera frame (Image or FrameSlot), or the receive time if the camera doesn't stamp its frames
+def CaptureTime(frame,ts):
+
+    if hasattr(frame,"header"):
+        capture_ts = frame.header.stamp
+    else:
+        capture_ts = frame.ts
+    if capture_ts.is_zero():
+        return ts
+    return capture_ts
+
+
+class LatencyStats(object):
+
+
+    def __init__(self,node,stages,window=LATENCY_WINDOW):
+
+        self.lock = Lock()
+        self.node = node # name of the node in the reports
+        self.stages = stages # stage names, in report order
+        self.samples = {} # most recent samples per stage (sec.)
+        self.counts = {} # total number of samples per stage
+        for stage in stages:
+            self.samples[stage] = deque(maxlen=window)
+            self.counts[stage] = 0
+
+
+    # add a sample to a stage (sec.)
+    def Add(self,stage,duration):
+
+        with self.lock:
+            self.samples[stage].append(duration)
+            self.counts[stage] += 1
+
+
+    # add the time from a timestamp until now to a stage
+    def AddSince(self,stage,ts):
+
+        self.Add(stage,(rospy.get_rostime() - ts).to_sec())
+
+
+    # fill out a LatencyReport message
+    def FillReport(self,msg):
+
+        msg.node = self.node
+        msg.stages = []
+        msg.counts = []
+        msg.p50 = []
+        msg.p95 = []
+        msg.p99 = []
+        msg.max = []
+
+        with self.lock:
+            windows = [(stage,self.counts[stage],list(self.samples[stage])) for stage in self.stages]
+
+        # sort outside the lock, so the stages are never held up by a report
+        for stage,count,samples in windows:
+            msg.stages.append(stage)
+            msg.counts.append(count)
+            if len(samples) == 0:
+                p50,p95,p99 = 0.0,0.0,0.0
+                longest = 0.0
+            else:
+                p50,p95,p99 = numpy.percentile(samples,PERCENTILES)
+                longest = max(samples)
+            msg.p50.append(p50)
+            msg.p95.append(p95)
+            msg.p99.append(p99)
+            msg.max.append(longest)
+
+
+    # append a LatencyReport to a CSV file, one line per stage (latencies in ms)
+    def Dump(self,msg,filename):
+
+        directory = os.path.dirname(filename)
+        if (directory != "") and not os.path.isdir(directory):
+            os.makedirs(directory)
+        new_file = not os.path.exists(filename)
+        with open(filename,"a") as output:
+            if new_file:
+                output.write("ts,node,stage,count,p50,p95,p99,max\n")
+            for i in range(0,len(msg.stages)):
+                output.write("{:.3f},{},{},{},{:.3f},{:.3f},{:.3f},{:.3f}\n".format(msg.ts.to_sec(),msg.node,msg.stages[i],msg.counts[i],1000.0 * msg.p50[i],1000.0 * msg.p95[i],1000.0 * msg.p99[i],1000.0 * msg.max[i]))
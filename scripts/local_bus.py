@@ -0,0 +1,331 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# LOCAL BUS: in-process stand-in for the parts of rospy, dynamic_reconfigure and tf that the vision chain uses
+#     publishers, subscribers, timers and parameters live in one LocalBus, no ROS master is needed
+#     published messages are queued by reference, and delivered to the subscribers of the same topic when the bus runs
+#     time is virtual: timers fire in order of their due times, and the clock jumps from one timer to the next,
+#     so a replay runs as fast as the nodes can process it
+#     every callback is timed (CPU time) per class and method, and every published message is counted per topic
+#     relative names resolve against the bus namespace, which is set to the namespace of each node before it's created
+#     Install() replaces rospy.Publisher, rospy.Subscriber, rospy.Timer, rospy.get_param, rospy.get_rostime,
+#     rospy.get_namespace, rospy.is_shutdown, rospy.on_shutdown, dynamic_reconfigure's Server and Client, and
+#     tf.TransformListener, so it must be called before the nodes are imported
+
+import time
+import heapq
+import functools
+import rospy
+import rospy.timer
+import dynamic_reconfigure.server
+import dynamic_reconfigure.client
+import tf
+from collections import deque
+
+
+# virtual time at which the bus starts
+START_TIME = 1500000000.0
+
+
+# name of a callback for the CPU time accounting
+def CallbackName(callback):
+
+    if hasattr(callback,"__self__"):
+        return callback.__self__.__class__.__name__ + "." + callback.__name__
+    return callback.__name__
+
+
+class LocalBus(object):
+
+
+    def __init__(self):
+
+        self.params = {} # parameters by absolute name
+        self.namespace = "/" # namespace to resolve relative names against
+        self.node = "" # node name to resolve private names against
+        self.now = START_TIME # virtual time (sec.)
+        self.subscribers = {} # subscriber callbacks by topic
+        self.queue = deque() # published messages waiting to be delivered, as (topic,msg)
+        self.timers = [] # heap of (due time,sequence,timer)
+        self.timer_seq = 0 # tie breaker, so timers that are due at the same time fire in creation order
+        self.transforms = {} # (translation,rotation) by (target frame,source frame)
+        self.shutdown_flag = False
+        self.shutdown_hooks = []
+
+        self.calls = {} # number of calls by callback name
+        self.cpu = {} # total CPU time by callback name (sec.)
+        self.published = {} # number of published messages by topic
+
+
+    # set the namespace (and node name) that relative (and private) names resolve against
+    def SetNamespace(self,namespace,node=""):
+
+        self.namespace = namespace
+        self.node = node
+
+
+    # resolve a topic or parameter name to an absolute name
+    def Resolve(self,name):
+
+        if name.startswith("/"):
+            return name
+        if name.startswith("~"):
+            return self.namespace + self.node + "/" + name[1:]
+        return self.namespace + name
+
+
+    # load a (nested) dict of parameters, for instance from a yaml file, under a namespace
+    def LoadParams(self,params,namespace="/"):
+
+        for name in params:
+            if isinstance(params[name],dict):
+                self.LoadParams(params[name],namespace + name + "/")
+            else:
+                self.params[namespace + name] = params[name]
+
+
+    # stand-in for rospy.get_param
+    def GetParam(self,name,default=KeyError):
+
+        name = self.Resolve(name)
+        if name in self.params:
+            return self.params[name]
+        if default is KeyError:
+            raise KeyError(name)
+        return default
+
+
+    # stand-in for rospy.get_rostime
+    def GetTime(self):
+
+        return rospy.Time.from_sec(self.now)
+
+
+    # stand-in for rospy.get_namespace
+    def GetNamespace(self):
+
+        return self.namespace
+
+
+    # stand-in for rospy.is_shutdown
+    def IsShutdown(self):
+
+        return self.shutdown_flag
+
+
+    # stand-in for rospy.on_shutdown
+    def OnShutdown(self,hook):
+
+        self.shutdown_hooks.append(hook)
+
+
+    # set a transform for the TF stand-in (rotation is a quaternion (x,y,z,w))
+    def SetTransform(self,target,source,translation,rotation):
+
+        self.transforms[(target,source)] = (translation,rotation)
+
+
+    # call a callback and account for its CPU time
+    def Call(self,callback,*args):
+
+        name = CallbackName(callback)
+        start = time.clock()
+        callback(*args)
+        self.cpu[name] = self.cpu.get(name,0.0) + time.clock() - start
+        self.calls[name] = self.calls.get(name,0) + 1
+
+
+    # queue a message for the subscribers of a topic
+    def Publish(self,topic,msg):
+
+        self.published[topic] = self.published.get(topic,0) + 1
+        if topic in self.subscribers:
+            self.queue.append((topic,msg))
+
+
+    # deliver all queued messages, including the ones that are published while delivering
+    def Deliver(self):
+
+        while len(self.queue) > 0:
+            topic,msg = self.queue.popleft()
+            for callback in list(self.subscribers.get(topic,[])):
+                self.Call(callback,msg)
+
+
+    # schedule a timer at its next due time
+    def Schedule(self,timer):
+
+        self.timer_seq += 1
+        heapq.heappush(self.timers,(timer.due,self.timer_seq,timer))
+
+
+    # fire all timers that are due until a time (sec.), and deliver what they publish
+    def RunUntil(self,end):
+
+        self.Deliver()
+        while (len(self.timers) > 0) and (self.timers[0][0] <= end) and not self.shutdown_flag:
+
+            due,seq,timer = heapq.heappop(self.timers)
+            if timer.stopped:
+                continue
+
+            self.now = due
+            event = rospy.timer.TimerEvent(timer.last_expected,timer.last_expected,rospy.Time.from_sec(due),rospy.Time.from_sec(due),None)
+            timer.last_expected = event.current_expected
+            if not timer.oneshot:
+                timer.due = due + timer.period
+                self.Schedule(timer)
+            self.Call(timer.callback,event)
+            self.Deliver()
+
+        self.now = end
+
+
+    # stop all timers and call the shutdown hooks
+    def Shutdown(self):
+
+        self.shutdown_flag = True
+        for hook in self.shutdown_hooks:
+            hook()
+
+
+class LocalPublisher(object):
+
+
+    def __init__(self,bus,name,data_class,**kwargs):
+
+        self.bus = bus
+        self.name = bus.Resolve(name)
+
+
+    def publish(self,msg):
+
+        self.bus.Publish(self.name,msg)
+
+
+    def get_num_connections(self):
+
+        return len(self.bus.subscribers.get(self.name,[]))
+
+
+    def unregister(self):
+
+        pass
+
+
+class LocalSubscriber(object):
+
+
+    def __init__(self,bus,name,data_class,callback,**kwargs):
+
+        self.bus = bus
+        self.name = bus.Resolve(name)
+        self.callback = callback
+        if self.name not in bus.subscribers:
+            bus.subscribers[self.name] = []
+        bus.subscribers[self.name].append(callback)
+
+
+    def unregister(self):
+
+        if self.callback in self.bus.subscribers.get(self.name,[]):
+            self.bus.subscribers[self.name].remove(self.callback)
+
+
+class LocalTimer(object):
+
+
+    def __init__(self,bus,period,callback,oneshot=False):
+
+        self.bus = bus
+        self.period = period.to_sec()
+        self.callback = callback
+        self.oneshot = oneshot
+        self.stopped = False
+        self.last_expected = None
+        self.due = bus.now + self.period
+        bus.Schedule(self)
+
+
+    def shutdown(self):
+
+        self.stopped = True
+
+
+# dynamic reconfigure configuration, read straight from the parameters of a namespace
+class LocalConfig(object):
+
+
+    def __init__(self,bus,namespace):
+
+        self.bus = bus
+        self.namespace = namespace
+
+
+    def __getattr__(self,name):
+
+        return self.bus.GetParam(self.namespace + name)
+
+
+# stand-in for dynamic_reconfigure.server.Server, reports the configuration once
+class LocalConfigServer(object):
+
+
+    def __init__(self,bus,type,callback):
+
+        self.config = LocalConfig(bus,bus.namespace)
+        callback(self.config,0xFFFFFFFF)
+
+
+# stand-in for dynamic_reconfigure.client.Client, reports the configuration of the server's namespace once
+class LocalConfigClient(object):
+
+
+    def __init__(self,bus,name,timeout=None,config_callback=None):
+
+        name = bus.Resolve(name)
+        self.config = LocalConfig(bus,name[0:name.rfind("/") + 1])
+        if config_callback is not None:
+            config_callback(self.config)
+
+
+    def get_configuration(self,timeout=None):
+
+        return self.config
+
+
+# stand-in for tf.TransformListener, with the fixed transforms of the bus
+class LocalTransformListener(object):
+
+
+    def __init__(self,bus,*args,**kwargs):
+
+        self.bus = bus
+
+
+    def canTransform(self,target,source,ts):
+
+        return (target,source) in self.bus.transforms
+
+
+    def lookupTransform(self,target,source,ts):
+
+        return self.bus.transforms[(target,source)]
+
+
+# replace rospy, dynamic_reconfigure and tf by the bus
+def Install(bus):
+
+    rospy.Publisher = functools.partial(LocalPublisher,bus)
+    rospy.Subscriber = functools.partial(LocalSubscriber,bus)
+    rospy.Timer = functools.partial(LocalTimer,bus)
+    rospy.get_param = bus.GetParam
+    rospy.get_rostime = bus.GetTime
+    rospy.get_namespace = bus.GetNamespace
+    rospy.is_shutdown = bus.IsShutdown
+    rospy.on_shutdown = bus.OnShutdown
+    dynamic_reconfigure.server.Server = functools.partial(LocalConfigServer,bus)
+    dynamic_reconfigure.client.Client = functools.partial(LocalConfigClient,bus)
+    tf.TransformListener = functools.partial(LocalTransformListener,bus)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# MARKER BATCH: RViz markers of one modality, published together as one MarkerArray per visualization tick
+#     each marker is copied once from a template and then reused, only its stamp, position (or arrow end) and text change
+#     a marker is only sent again when it moved further than a threshold or its text changed, or when it's halfway to
+#     its lifetime, so RViz never lets a visible candidate expire
+#     markers that were not updated for longer than their lifetime are forgotten (RViz removed them already)
+
+import copy
+import rospy
+from visualization_msgs.msg import Marker,MarkerArray
+from geometry_msgs.msg import Point
+
+
+# fraction of the lifetime after which an unchanged marker is sent again
+REFRESH_FRACTION = 0.5
+
+
+# make a marker template with all fields that never change
+def MakeTemplate(frame_id,ns,type,scale,color,lifetime):
+
+    marker = Marker()
+    marker.header.frame_id = frame_id
+    marker.ns = ns
+    marker.type = type
+    marker.action = Marker.MODIFY
+    marker.pose.orientation.x = 0.0
+    marker.pose.orientation.y = 0.0
+    marker.pose.orientation.z = 0.0
+    marker.pose.orientation.w = 1.0
+    marker.scale.x,marker.scale.y,marker.scale.z = scale
+    marker.color.r,marker.color.g,marker.color.b,marker.color.a = color
+    marker.lifetime = rospy.Duration.from_sec(lifetime)
+    marker.frame_locked = False
+    if type == Marker.ARROW:
+        marker.points = [Point(0.0,0.0,0.0),Point(0.0,0.0,0.0)]
+    return marker
+
+
+class MarkerBatch(object):
+
+
+    def __init__(self,pub):
+
+        self.pub = pub
+        self.markers = {} # reused markers, with the position, text and time they were last sent, by marker ID
+        self.array = MarkerArray() # markers to send at this tick
+        self.sent = 0 # total number of markers sent
+        self.skipped = 0 # total number of marker updates that didn't need to be sent
+
+
+    # update a marker, and add it to this tick's array if it changed enough or would expire (position is (x,y,z))
+    def Update(self,template,marker_id,ts,position,text,distance):
+
+        if marker_id not in self.markers:
+            marker = copy.deepcopy(template)
+            marker.id = marker_id
+            self.markers[marker_id] = [marker,None,None,None]
+        entry = self.markers[marker_id]
+        marker,sent_position,sent_text,sent_ts = entry
+
+        # skip if it's still fresh and didn't change
+        if (sent_position is not None) and (text == sent_text) and ((ts - sent_ts).to_sec() < REFRESH_FRACTION * marker.lifetime.to_sec()):
+            dx = position[0] - sent_position[0]
+            dy = position[1] - sent_position[1]
+            dz = position[2] - sent_position[2]
+            if dx * dx + dy * dy + dz * dz <= distance * distance:
+                self.skipped += 1
+                return
+
+        marker.header.stamp = ts
+        if marker.type == Marker.ARROW:
+            marker.points[1].x,marker.points[1].y,marker.points[1].z = position
+        else:
+            marker.pose.position.x,marker.pose.position.y,marker.pose.position.z = position
+        if text is not None:
+            marker.text = text
+        entry[1] = position
+        entry[2] = text
+        entry[3] = ts
+        self.array.markers.append(marker)
+
+
+    # change the lifetime of all markers, they are all sent again at the next update so RViz gets the new lifetime
+    def SetLifetime(self,lifetime):
+
+        for entry in self.markers.values():
+            entry[0].lifetime = rospy.Duration.from_sec(lifetime)
+            entry[1] = None
+
+
+    # send this tick's markers, and forget the ones that expired
+    def Publish(self,ts):
+
+        if len(self.array.markers) > 0:
+            self.pub.publish(self.array)
+            self.sent += len(self.array.markers)
+            self.array.markers = []
+
+        for marker_id in [marker_id for marker_id in self.markers if (ts - self.markers[marker_id][3]).to_sec() > self.markers[marker_id][0].lifetime.to_sec()]:
+            del self.markers[marker_id]
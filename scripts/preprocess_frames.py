@@ -0,0 +1,157 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# FRAME PREPROCESSING: convert, unrotate and rescale each camera frame once for all detectors
+#     the camera is a ROS USB camera node under 'camera' in the local namespace
+#     the unrotated work-size images are published to 'face_image', 'hand_image' and 'saliency_image' in the local namespace
+#     the pyramid of the saliency work image is published to 'saliency_pyramid_1', 'saliency_pyramid_2', ... in the local namespace
+#     images are only built for topics that have subscribers, and without subscribers or shared memory transport, frames are
+#     not even converted
+#     with shared memory transport, each frame is also copied into a memory-mapped ring and a descriptor is published to 'frame_slot' in the local namespace
+#     parameter updates are gathered from the 'vision_pipeline' parameter server
+
+# the node should be called 'preprocess_frames'
+
+from __future__ import with_statement
+import rospy
+import dynamic_reconfigure.client
+from sensor_msgs.msg import Image
+from r2_perception.msg import FrameSlot
+from frame_preprocessor import FramePreprocessor,opencv_bridge
+from frame_ring import FrameRing
+from threading import Lock
+
+
+class PreprocessFrames(object):
+
+
+    # constructor
+    def __init__(self):
+
+        # create lock
+        self.lock = Lock()
+
+        # get fixed parameters
+        self.shm_transport_flag = rospy.get_param("/shm_transport_flag",False)
+        self.shm_slots = rospy.get_param("/shm_slots",4)
+
+        # get dynamic parameters
+        self.rotate = rospy.get_param("rotate")
+
+        self.face_detect_work_width = rospy.get_param("face_detect_work_width")
+        self.face_detect_work_height = rospy.get_param("face_detect_work_height")
+        self.hand_detect_work_width = rospy.get_param("hand_detect_work_width")
+        self.hand_detect_work_height = rospy.get_param("hand_detect_work_height")
+        self.saliency_detect_work_width = rospy.get_param("saliency_detect_work_width")
+        self.saliency_detect_work_height = rospy.get_param("saliency_detect_work_height")
+
+        self.pyramid_levels = rospy.get_param("~pyramid_levels",3)
+
+        # create preprocessor
+        self.preprocessor = FramePreprocessor(self.rotate)
+
+        # create shared memory ring for this camera
+        if self.shm_transport_flag:
+            self.frame_ring = FrameRing(rospy.get_namespace())
+            rospy.on_shutdown(self.frame_ring.Remove)
+
+        # start dynamic reconfigure client from vision_pipeline
+        self.dynparam = dynamic_reconfigure.client.Client("vision_pipeline",timeout=30,config_callback=self.HandleConfig)
+
+        # start publishers and subscriber
+        self.face_image_pub = rospy.Publisher("face_image",Image,queue_size=1)
+        self.hand_image_pub = rospy.Publisher("hand_image",Image,queue_size=1)
+        self.saliency_image_pub = rospy.Publisher("saliency_image",Image,queue_size=1)
+        self.pyramid_pubs = []
+        for i in range(1,self.pyramid_levels):
+            self.pyramid_pubs.append(rospy.Publisher("saliency_pyramid_{}".format(i),Image,queue_size=1))
+        if self.shm_transport_flag:
+            self.frame_slot_pub = rospy.Publisher("frame_slot",FrameSlot,queue_size=1)
+
+        self.image_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleImage,queue_size=1)
+
+
+    # when a dynamic reconfigure update occurs
+    def HandleConfig(self,data):
+
+        with self.lock:
+
+            self.rotate = data.rotate
+            self.preprocessor.SetRotate(self.rotate)
+
+            self.face_detect_work_width = data.face_detect_work_width
+            self.face_detect_work_height = data.face_detect_work_height
+            self.hand_detect_work_width = data.hand_detect_work_width
+            self.hand_detect_work_height = data.hand_detect_work_height
+            self.saliency_detect_work_width = data.saliency_detect_work_width
+            self.saliency_detect_work_height = data.saliency_detect_work_height
+
+
+    # publish an OpenCV image with the header of the original camera frame
+    def PublishImage(self,pub,image,header):
+
+        msg = opencv_bridge.cv2_to_imgmsg(image,encoding="bgr8")
+        msg.header = header
+        pub.publish(msg)
+
+
+    # whether any of the work images or pyramid levels has subscribers
+    def IsNeeded(self):
+
+        pubs = [self.face_image_pub,self.hand_image_pub,self.saliency_image_pub] + self.pyramid_pubs
+        return any([pub.get_num_connections() > 0 for pub in pubs])
+
+
+    # when a new camera image arrives
+    def HandleImage(self,data):
+
+        with self.lock:
+
+            # without a shared memory ring or anyone listening, don't even convert the frame
+            if not self.shm_transport_flag and not self.IsNeeded():
+                return
+
+            # convert only once
+            self.preprocessor.SetFrame(data)
+
+            # copy the frame into the ring and only send the descriptor
+            if self.shm_transport_flag:
+                slot,seq = self.frame_ring.Write(self.preprocessor.image,self.shm_slots)
+                msg = FrameSlot()
+                msg.ring_id = self.frame_ring.ring_id
+                msg.slot = slot
+                msg.seq = seq
+                msg.ts = data.header.stamp
+                msg.width = self.preprocessor.image.shape[1]
+                msg.height = self.preprocessor.image.shape[0]
+                self.frame_slot_pub.publish(msg)
+
+            # rescale to each work size (identical sizes are rescaled only once) and send off
+            if self.face_image_pub.get_num_connections() > 0:
+                image = self.preprocessor.GetWorkImage(self.face_detect_work_width,self.face_detect_work_height)
+                self.PublishImage(self.face_image_pub,image,data.header)
+
+            if self.hand_image_pub.get_num_connections() > 0:
+                image = self.preprocessor.GetWorkImage(self.hand_detect_work_width,self.hand_detect_work_height)
+                self.PublishImage(self.hand_image_pub,image,data.header)
+
+            if self.saliency_image_pub.get_num_connections() > 0:
+                image = self.preprocessor.GetWorkImage(self.saliency_detect_work_width,self.saliency_detect_work_height)
+                self.PublishImage(self.saliency_image_pub,image,data.header)
+
+            # and the pyramid levels that are needed
+            needed = [pub.get_num_connections() > 0 for pub in self.pyramid_pubs]
+            if any(needed):
+                pyramid = self.preprocessor.GetPyramid(self.saliency_detect_work_width,self.saliency_detect_work_height,self.pyramid_levels)
+                for i in range(0,len(self.pyramid_pubs)):
+                    if needed[i]:
+                        self.PublishImage(self.pyramid_pubs[i],pyramid[i + 1],data.header)
+
+
+if __name__ == '__main__':
+
+    rospy.init_node('preprocess_frames')
+    node = PreprocessFrames()
+    rospy.spin()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# RATE GOVERNOR: adapt the rate of a detector to its measured cost and the activity in the scene
+#     after each detection, the detector reports how long it took and how active the scene is (0 = static, 1 = fully active)
+#     activity rises immediately and decays over the hold time, the rate follows it between the minimum and maximum rate
+#     the rate is further limited so the detector doesn't use more than a fraction (load) of one CPU
+#     small changes are ignored, so the detector's timer is not restarted all the time
+
+import math
+
+
+# smoothing of the measured cost per detection
+COST_SMOOTHING = 0.2
+
+# relative rate change below which the rate is left alone
+RATE_HYSTERESIS = 0.1
+
+# activity above which the scene counts as active
+ACTIVE_THRESHOLD = 0.5
+
+# lowest rate the governor ever decides on, the detectors' timers need a positive rate (Hz)
+LOWEST_RATE = 0.1
+
+
+class RateGovernor(object):
+
+
+    def __init__(self,min_rate,max_rate,load,hold_time):
+
+        self.min_rate = min_rate # lowest rate, for a static scene (Hz)
+        self.max_rate = max_rate # highest rate, for an active scene (Hz)
+        self.load = load # maximum fraction of one CPU the detector may use
+        self.hold_time = hold_time # time for the activity to decay (sec.)
+
+        self.cost = 0.0 # smoothed time per detection (sec.)
+        self.activity = 1.0 # current activity, start as active so the detector starts at full rate
+        self.activity_ts = None # time of the last activity update (sec.)
+
+        self.rate = self.Clamp(max_rate) # current rate (Hz)
+        self.reason = "start" # why the rate is what it is
+
+
+    # clamp a rate between the minimum and maximum rate, and keep it positive
+    def Clamp(self,rate):
+
+        if rate < self.min_rate:
+            rate = self.min_rate
+        if rate > self.max_rate:
+            rate = self.max_rate
+        if rate < LOWEST_RATE:
+            rate = LOWEST_RATE
+        return rate
+
+
+    # change the bounds (the current rate is kept inside them)
+    def SetBounds(self,min_rate,max_rate,load,hold_time):
+
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.load = load
+        self.hold_time = hold_time
+        self.rate = self.Clamp(self.rate)
+
+
+    # account for one detection, with its cost (sec.), the activity it found and the time of the frame (sec.)
+    def Measure(self,cost,activity,ts):
+
+        if self.cost == 0.0:
+            self.cost = cost
+        else:
+            self.cost += COST_SMOOTHING * (cost - self.cost)
+
+        # let the activity decay since the last detection
+        if (self.activity_ts is not None) and (ts > self.activity_ts):
+            if self.hold_time > 0.0:
+                self.activity *= math.exp((self.activity_ts - ts) / self.hold_time)
+            else:
+                self.activity = 0.0
+        self.activity_ts = ts
+
+        # and rise immediately
+        if activity > self.activity:
+            self.activity = min(activity,1.0)
+
+
+    # decide on the rate, returns True if the decision changed
+    def Update(self):
+
+        # follow the activity
+        rate = self.min_rate + self.activity * (self.max_rate - self.min_rate)
+        if self.activity >= ACTIVE_THRESHOLD:
+            reason = "active"
+        else:
+            reason = "static"
+
+        # but don't use more CPU than allowed
+        if (self.cost > 0.0) and (rate * self.cost > self.load):
+            rate = self.load / self.cost
+            reason = "cost"
+
+        rate = self.Clamp(rate)
+
+        # ignore small changes, except when reaching the bounds
+        if rate == self.rate:
+            return False
+        if (abs(rate - self.rate) < RATE_HYSTERESIS * self.rate) and (rate != self.min_rate) and (rate != self.max_rate):
+            return False
+
+        self.rate = rate
+        self.reason = reason
+        return True
+
+
+    # fill out the decision fields of a GovernorDecision message
+    def FillDecision(self,msg):
+
+        msg.rate = self.rate
+        msg.min_rate = self.min_rate
+        msg.max_rate = self.max_rate
+        msg.cost = self.cost
+        msg.activity = self.activity
+        msg.reason = self.reason
@@ -12,91 +12,88 @@ from dynamic_reconfigure.server import Server
 from r2_perception.cfg import vision_pipelineConfig as VisionConfig
 from math import sqrt
 from r2_perception.msg import Face,Hand,Saliency
+from candidate_table import CandidateTable,HISTORY_CAPACITY
+
+
+# number of saliency values that are kept and extrapolated, and where the direction and confidence are
+SALIENCY_VALUES = 4
+SALIENCY_DIRECTION = 0
+SALIENCY_CONFIDENCE = 3
+
+def SaliencyValues(saliency):
+    return (saliency.direction.x,saliency.direction.y,saliency.direction.z,saliency.confidence)
 
 
 class SaliencyPredictor(object):
 
 
-    def __init__(self):
+    # the candidate saliency is a row in a table of saliencies, a standalone predictor gets its own table
+    def __init__(self,table=None,key=None,capacity=HISTORY_CAPACITY):
 
-        self.saliencies = [] # list of detected Saliencies
+        if table is None:
+            table = CandidateTable(SALIENCY_VALUES,capacity,1)
+        self.table = table # table with the times, values and regression sums of the detected saliencies
+        self.row = table.Allocate(key) # row of this candidate saliency in the table, which knows its candidate ID
+        self.latest = None # latest detected Saliency
 
 
-    def Extrapolate(self,ts):
+    # give the row back to the table when the candidate saliency is removed
+    def Release(self):
+
+        self.table.Free(self.row)
 
-        n = len(self.saliencies)
-        if n < 2:
-            return self.saliencies[0]
 
-        # prepare for linear regression
-        sums = Saliency()
-        sumt = 0.0
-        sumtt = 0.0
-        sumst = Saliency()
+    # move the history to another table
+    def Move(self,table):
 
-        # iterate over last max_n saliencies only
-        for saliency in self.saliencies:
+        self.row = self.table.MoveRow(self.row,table)
+        self.table = table
 
-            # time delta
-            t = (ts - saliency.ts).to_sec()
 
-            # saliency
-            sums.position.x += saliency.position.x
-            sums.position.y += saliency.position.y
-            sums.confidence += saliency.confidence
+    # number of detected saliencies in the history
+    def Count(self):
 
-            # time
-            sumt += t
+        return int(self.table.Count(self.row))
 
-            # time * time
-            sumtt += t * t
 
-            # saliency * time
-            sumst.position.x += saliency.position.x * t
-            sumst.position.y += saliency.position.y * t
-            sumst.confidence += saliency.confidence * t
+    # latest detected saliency
+    def Latest(self):
 
-        # saliency slope
-        slps = Saliency()
-        den = float(n) * sumtt - sumt * sumt
-        if den == 0.0:
-            return self.saliencies[0]
+        return self.latest
 
-        slps.position.x = (n * sumst.position.x - sumt * sums.position.x) / den
-        slps.position.y = (n * sumst.position.y - sumt * sums.position.y) / den
-        slps.confidence = (n * sumst.confidence - sumt * sums.confidence) / den
+
+    def Extrapolate(self,ts):
+
+        # linear regression from the running sums
+        values,regressed = self.table.Predict([self.row],ts.to_sec(),True)
+        if not regressed[0]:
+            return self.latest
+        values = values[0]
 
         # result
         result = Saliency()
         result.ts = ts
         result.saliency_id = 0
-        result.position.x = (sums.position.x - slps.position.x * sumt) / float(n)
-        result.position.y = (sums.position.y - slps.position.y * sumt) / float(n)
-        result.confidence = (sums.confidence - slps.confidence * sumt) / float(n)
+        result.direction.x = values[0]
+        result.direction.y = values[1]
+        result.direction.z = values[2]
+        result.confidence = values[3]
 
         return result
 
 
     def PruneBefore(self,ts):
 
-        new_saliencies = [saliency for saliency in self.saliencies if saliency.ts.to_sec() >= ts.to_sec()]
-        self.saliencies = new_saliencies
+        self.table.PruneBefore([self.row],ts.to_sec())
 
 
     def Append(self,saliency):
 
-        self.saliencies.append(saliency)
+        self.latest = saliency
+        self.table.Append(self.row,saliency.ts.to_sec(),SaliencyValues(saliency))
 
 
     def CalculateConfidence(self,full_points):
 
-        # calculate confidence
-        n = len(self.saliencies)
-        if n > full_points:
-            n = full_points
-        total = 0.0
-        for saliency in self.saliencies[-n:]:
-            total += saliency.confidence
-        total /= float(full_points)
-
-        return total
+        # calculate confidence (only over the last full_points saliencies, so this doesn't depend on the history length)
+        return float(self.table.Confidence([self.row],SALIENCY_CONFIDENCE,full_points)[0])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# THUMB WRITER: store face thumbnails on disk in the background
+#     thumbnails are queued with their directory and filename, and worker threads convert, encode and write them
+#     the queue is bounded: when it's full, new thumbnails are dropped (and counted), or with blocking, the caller waits
+#     directories are created once, and remembered, so the disk is only asked about a directory the first time
+#     the write latency is the time from queueing a thumbnail until it's on disk
+
+from __future__ import with_statement
+import os
+import time
+import cv2
+import Queue
+from threading import Thread,Lock
+from cv_bridge import CvBridge
+
+
+opencv_bridge = CvBridge()
+
+
+class ThumbWriter(object):
+
+
+    def __init__(self,workers,queue_size,block_flag):
+
+        self.lock = Lock()
+        self.queue = Queue.Queue(queue_size) # thumbnails waiting to be written
+        self.block_flag = block_flag # wait for room in the queue instead of dropping thumbnails
+        self.directories = set() # directories that are known to exist
+
+        self.written = 0 # total number of thumbnails written
+        self.dropped = 0 # total number of thumbnails dropped because the queue was full
+        self.failed = 0 # total number of thumbnails that could not be written
+        self.latency_total = 0.0 # total write latency since last stats (sec.)
+        self.latency_max = 0.0 # longest write latency since last stats (sec.)
+        self.latency_count = 0 # number of thumbnails written since last stats
+
+        # start workers
+        self.workers = []
+        for i in range(0,workers):
+            worker = Thread(target=self.Run)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+
+    # queue a thumbnail (ROS Image) to be written to directory/filename, returns False if it was dropped
+    def Write(self,directory,filename,thumb):
+
+        item = (directory,filename,thumb,time.time())
+        if self.block_flag:
+            self.queue.put(item)
+            return True
+
+        try:
+            self.queue.put_nowait(item)
+        except Queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        return True
+
+
+    # make sure a directory exists, only asking the disk the first time
+    def MakeDirectory(self,directory):
+
+        with self.lock:
+            if directory in self.directories:
+                return
+
+        # another worker might create it at the same time
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+        with self.lock:
+            self.directories.add(directory)
+
+
+    # (worker) write thumbnails as they come in
+    def Run(self):
+
+        while True:
+
+            directory,filename,thumb,queued = self.queue.get()
+
+            try:
+                self.MakeDirectory(directory)
+                image = opencv_bridge.imgmsg_to_cv2(thumb)
+                ok = cv2.imwrite(os.path.join(directory,filename),image)
+            except Exception:
+                ok = False
+
+            latency = time.time() - queued
+            with self.lock:
+                if ok:
+                    self.written += 1
+                    self.latency_total += latency
+                    self.latency_count += 1
+                    if latency > self.latency_max:
+                        self.latency_max = latency
+                else:
+                    self.failed += 1
+
+            self.queue.task_done()
+
+
+    # fill out the thumbnail writer fields of a PipelineStats message and restart the latency measurements
+    def FillStats(self,msg):
+
+        with self.lock:
+
+            msg.thumb_queue_depth = self.queue.qsize()
+            msg.thumbs_written = self.written
+            msg.thumbs_dropped = self.dropped
+            msg.thumbs_failed = self.failed
+            msg.thumb_write_mean = 0.0
+            if self.latency_count > 0:
+                msg.thumb_write_mean = self.latency_total / float(self.latency_count)
+            msg.thumb_write_max = self.latency_max
+
+            self.latency_total = 0.0
+            self.latency_max = 0.0
+            self.latency_count = 0
@@ -12,23 +12,43 @@ import cv2
 import tf
 import math
 import geometry_msgs
-from face_predictor import FacePredictor
-from hand_predictor import HandPredictor
-from saliency_predictor import SaliencyPredictor
+from face_predictor import FacePredictor,FACE_VALUES,FACE_RECT,FACE_POSITION,FACE_CONFIDENCE,FACE_SMILE,FACE_FROWN
+from hand_predictor import HandPredictor,HAND_VALUES,HAND_POSITION,HAND_CONFIDENCE
+from saliency_predictor import SaliencyPredictor,SALIENCY_VALUES,SALIENCY_DIRECTION,SALIENCY_CONFIDENCE
+from candidate_table import CandidateTable
+from kalman_table import KalmanTable
+from thumb_writer import ThumbWriter
+from marker_batch import MarkerBatch,MakeTemplate
+from latency_stats import LatencyStats
+from candidate_index import GridIndex
+from assignment import SolveAssignment
 from dynamic_reconfigure.server import Server
 from r2_perception.cfg import vision_pipelineConfig as VisionConfig
 from sensor_msgs.msg import Image
 from cv_bridge import CvBridge
 from math import sqrt
-from r2_perception.msg import Face,Hand,Saliency,FaceRequest,FaceResponse,CandidateFace,CandidateHand,CandidateSaliency
-from visualization_msgs.msg import Marker
+from r2_perception.msg import Face,Hand,Saliency,FaceRequest,FaceResponse,CandidateFace,CandidateHand,CandidateSaliency,FaceRegions,FaceThumb,PipelineStats,Float32R,LatencyReport
+from visualization_msgs.msg import Marker,MarkerArray
 from threading import Lock
-from geometry_msgs.msg import Point,PointStamped
+from tf.transformations import translation_matrix,quaternion_matrix
 
 
 opencv_bridge = CvBridge()
 
 
+# shortest lifetime of a face or hand marker in RViz (sec.)
+CANDIDATE_MARKER_LIFETIME = 2.0
+
+# shortest lifetime of a saliency marker in RViz (sec.)
+SALIENCY_MARKER_LIFETIME = 0.1
+
+# latency stages of the vision pipeline (faces only)
+LATENCY_STAGES = ["receive","associate","transform","publish"]
+
+# receive buffer of the debug camera subscriber, large enough for a whole frame so stale frames are dropped, not queued
+DEBUG_VISION_BUFFER_SIZE = 1 << 24
+
+
 serial_number = 0
 
 def GenerateCandidateFaceID():
@@ -50,6 +70,39 @@ def GenerateCandidateSaliencyID():
     return result
 
 
+# create a table for the candidates of one modality, predicting by linear regression or by Kalman filter
+def CreateTable(columns,kalman_flag,process_noise,measurement_noise):
+    if kalman_flag:
+        table = KalmanTable(columns)
+        table.SetNoise(process_noise,measurement_noise)
+        return table
+    return CandidateTable(columns)
+
+
+# transform an array of points with a 4x4 matrix
+def TransformPoints(matrix,points):
+    return numpy.dot(points,matrix[0:3,0:3].T) + matrix[0:3,3]
+
+
+# debug window annotation of a candidate face, from the analysis results that are available
+def FaceLabel(cface):
+    label = ""
+    if cface.identity_confidence > 0.0:
+        label = cface.identity
+    if cface.age_confidence > 0.0:
+        if label != "":
+            label += ", "
+        label += str(int(cface.age)) + " y/o"
+    if cface.gender_confidence > 0.0:
+        if label != "":
+            label += ", "
+        if cface.gender == 2:
+            label += "female"
+        else:
+            label += "male"
+    return label
+
+
 class VisionPipeline(object):
 
 
@@ -67,6 +120,38 @@ class VisionPipeline(object):
         self.chands = {}
         self.csaliencies = {}
 
+        # create indices of the predicted candidate positions (and directions)
+        self.face_index = GridIndex()
+        self.hand_index = GridIndex()
+        self.saliency_index = GridIndex()
+
+        # clear raw faces of the current frame (in batch mode) and association measurements
+        self.face_batch = []
+        self.face_association_count = 0
+        self.face_association_total = 0.0
+        self.face_association_max = 0.0
+
+        # clear cached camera-to-world transform and transform measurements
+        self.world_ts = None
+        self.world_matrix = None
+        self.transform_ticks = 0
+        self.transform_points = 0
+        self.transform_lookups = 0
+        self.transform_total = 0.0
+        self.transform_max = 0.0
+
+        # clear debug window frame counts and snapshot measurements
+        self.last_debug_time = 0.0
+        self.debug_frames = 0
+        self.debug_frames_skipped = 0
+        self.debug_snapshot_count = 0
+        self.debug_snapshot_total = 0.0
+        self.debug_snapshot_max = 0.0
+
+        # clear raw faces waiting for their thumbnails, and thumbnails waiting for their raw faces
+        self.thumb_faces = {}
+        self.face_thumbs = {}
+
         # get pipeline name
         self.name = rospy.get_namespace().split('/')[-2]
         self.camera_id = hash(self.name) & 0xFFFFFFFF
@@ -80,23 +165,38 @@ class VisionPipeline(object):
         self.store_thumbs_flag = rospy.get_param("/store_thumbs_flag")
         if self.store_thumbs_flag:
             camera_dir = self.name + "_%08X" % (self.camera_id & 0xFFFFFFFF)
-            self.thumbs_output_dir = self.thumbs_dir + "/" + self.session_tag + "_%08X/" & (self.session_id & 0xFFFFFFFF) + camera_tag + "/"
-            if not os.path.exists(self.thumbs_output_dir):
-                os.makedirs(self.thumbs_output_dir)
+            self.thumbs_output_dir = self.thumbs_dir + "/" + self.session_tag + "_%08X/" % (self.session_id & 0xFFFFFFFF) + camera_dir + "/"
+
+            # write the thumbnails in the background, so the disk never holds up the pipeline
+            self.thumb_writer_workers = rospy.get_param("/thumb_writer_workers",1)
+            self.thumb_writer_queue_size = rospy.get_param("/thumb_writer_queue_size",50)
+            self.thumb_writer_block_flag = rospy.get_param("/thumb_writer_block_flag",False)
+            self.thumb_writer = ThumbWriter(self.thumb_writer_workers,self.thumb_writer_queue_size,self.thumb_writer_block_flag)
+            self.thumbs_to_write = [] # thumbnails collected under the lock, to be handed to the writer after it
 
         self.visualize_flag = rospy.get_param("/visualize_flag")
 
+        self.async_thumbs_flag = rospy.get_param("/async_thumbs_flag",False)
+
+        self.pipeline_stats_period = rospy.get_param("/pipeline_stats_period",1.0)
+
+        self.latency_report_period = rospy.get_param("/latency_report_period",1.0)
+        self.latency_window = rospy.get_param("/latency_window",1000)
+        self.latency_dump_flag = rospy.get_param("/latency_dump_flag",False)
+        self.latency_dump_dir = rospy.get_param("/latency_dump_dir","/tmp")
+        self.latency = LatencyStats("vision_pipeline",LATENCY_STAGES,self.latency_window)
+
         # get dynamic parameters
         self.debug_vision_flag = rospy.get_param("debug_vision_flag")
-        if self.debug_vision_flag:
-            cv2.namedWindow(self.name)
-            self.frame_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleFrame)
+        self.debug_vision_rate = rospy.get_param("debug_vision_rate")
+        self.debug_vision_scale = rospy.get_param("debug_vision_scale")
 
         self.visualize_candidates_flag = rospy.get_param("visualize_candidates_flag")
+        self.visualize_rate = rospy.get_param("visualize_rate")
+        self.visualize_change_distance = rospy.get_param("visualize_change_distance")
+        self.last_visualize_ts = rospy.Time(0)
         if self.visualize_flag and self.visualize_candidates_flag:
-            self.face_rviz_pub = rospy.Publisher("rviz_face",Marker,queue_size=5)
-            self.hand_rviz_pub = rospy.Publisher("rviz_hand",Marker,queue_size=5)
-            self.saliency_rviz_pub = rospy.Publisher("rviz_saliency",Marker,queue_size=5)
+            self.StartMarkers()
 
         self.fovy = rospy.get_param("fovy")
         self.aspect = rospy.get_param("aspect")
@@ -109,10 +209,27 @@ class VisionPipeline(object):
         self.hand_regression_flag = rospy.get_param("hand_regression_flag")
         self.saliency_regression_flag = rospy.get_param("saliency_regression_flag")
 
+        self.face_kalman_flag = rospy.get_param("face_kalman_flag")
+        self.hand_kalman_flag = rospy.get_param("hand_kalman_flag")
+        self.saliency_kalman_flag = rospy.get_param("saliency_kalman_flag")
+        self.face_process_noise = rospy.get_param("face_process_noise")
+        self.hand_process_noise = rospy.get_param("hand_process_noise")
+        self.saliency_process_noise = rospy.get_param("saliency_process_noise")
+        self.face_measurement_noise = rospy.get_param("face_measurement_noise")
+        self.hand_measurement_noise = rospy.get_param("hand_measurement_noise")
+        self.saliency_measurement_noise = rospy.get_param("saliency_measurement_noise")
+
+        # create tables with the histories of all candidates, so they can be scored, predicted and pruned all at once
+        self.face_table = CreateTable(FACE_VALUES,self.face_kalman_flag,self.face_process_noise,self.face_measurement_noise)
+        self.hand_table = CreateTable(HAND_VALUES,self.hand_kalman_flag,self.hand_process_noise,self.hand_measurement_noise)
+        self.saliency_table = CreateTable(SALIENCY_VALUES,self.saliency_kalman_flag,self.saliency_process_noise,self.saliency_measurement_noise)
+
         self.face_fuse_distance = rospy.get_param("face_fuse_distance")
         self.hand_fuse_distance = rospy.get_param("hand_fuse_distance")
         self.saliency_fuse_distance = rospy.get_param("saliency_fuse_distance")
 
+        self.face_batch_flag = rospy.get_param("face_batch_flag")
+
         self.min_face_confidence = rospy.get_param("min_face_confidence")
         self.min_hand_confidence = rospy.get_param("min_hand_confidence")
         self.min_saliency_confidence = rospy.get_param("min_saliency_confidence")
@@ -125,6 +242,9 @@ class VisionPipeline(object):
         self.full_hand_points = rospy.get_param("full_hand_points")
         self.full_saliency_points = rospy.get_param("full_saliency_points")
 
+        self.face_tracking_flag = rospy.get_param("face_tracking_flag")
+        self.governor_flag = rospy.get_param("governor_flag")
+
         # start dynamic reconfigure server
         self.config_server = Server(VisionConfig,self.HandleConfig)
 
@@ -136,12 +256,28 @@ class VisionPipeline(object):
         self.face_request_pub = rospy.Publisher("face_request",FaceRequest,queue_size=5)
 
         self.face_sub = rospy.Subscriber("raw_face",Face,self.HandleFace)
+        if self.async_thumbs_flag:
+            self.face_thumb_sub = rospy.Subscriber("raw_face_thumb",FaceThumb,self.HandleFaceThumb)
         self.hand_sub = rospy.Subscriber("raw_hand",Hand,self.HandleHand)
         self.saliency_sub = rospy.Subscriber("raw_saliency",Saliency,self.HandleSaliency)
 
-        self.cface_pub = rospy.Publisher("cface",Candidateface,queue_size=5)
+        self.cface_pub = rospy.Publisher("cface",CandidateFace,queue_size=5)
         self.chand_pub = rospy.Publisher("chand",CandidateHand,queue_size=5)
         self.csaliency_pub = rospy.Publisher("csaliency",CandidateSaliency,queue_size=5)
+
+        self.face_regions_pub = rospy.Publisher("face_regions",FaceRegions,queue_size=1)
+
+        # start possible debug window, now that there are candidates to show
+        if self.debug_vision_flag:
+            self.StartDebugVision()
+
+        # start publishing pipeline statistics
+        self.stats_pub = rospy.Publisher("pipeline_stats",PipelineStats,queue_size=5)
+        self.stats_timer = rospy.Timer(rospy.Duration(self.pipeline_stats_period),self.HandleStatsTimer)
+
+        # start publishing latency percentiles
+        self.latency_pub = rospy.Publisher("latency",LatencyReport,queue_size=5)
+        self.latency_timer = rospy.Timer(rospy.Duration(self.latency_report_period),self.HandleLatencyTimer)
  
 
     def HandleConfig(self,data,level):
@@ -150,24 +286,32 @@ class VisionPipeline(object):
         if new_debug_vision_flag != self.debug_vision_flag:
             self.debug_vision_flag = new_debug_vision_flag
             if self.debug_vision_flag:
-                cv2.namedWindow(self.name)
-                self.frame_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleFrame)
+                self.StartDebugVision()
             else:
                 cv2.destroyWindow(self.name)
                 self.frame_sub.unregister()
 
+        self.debug_vision_rate = data.debug_vision_rate
+        self.debug_vision_scale = data.debug_vision_scale
+
         new_visualize_candidates_flag = data.visualize_candidates_flag
         if new_visualize_candidates_flag != self.visualize_candidates_flag:
             self.visualize_candidates_flag = new_visualize_candidates_flag
-            if self.visualization_flag and self.visualize_candidates_flag:
-                self.face_rviz_pub = rospy.Publisher("rviz_face",Marker,queue_size=5)
-                self.hand_rviz_pub = rospy.Publisher("rviz_hand",Marker,queue_size=5)
-                self.saliency_rviz_pub = rospy.Publisher("rviz_saliency",Marker,queue_size=5)
+            if self.visualize_flag and self.visualize_candidates_flag:
+                self.StartMarkers()
             else:
                 self.face_rviz_pub.unregister()
                 self.hand_rviz_pub.unregister()
                 self.saliency_rviz_pub.unregister()
 
+        new_visualize_rate = data.visualize_rate
+        if new_visualize_rate != self.visualize_rate:
+            with self.lock:
+                self.visualize_rate = new_visualize_rate
+                if self.visualize_flag and self.visualize_candidates_flag:
+                    self.SetMarkerLifetimes()
+        self.visualize_change_distance = data.visualize_change_distance
+
         self.fovy = data.fovy
         self.aspect = data.aspect
         self.rotate = data.rotate
@@ -182,10 +326,52 @@ class VisionPipeline(object):
         self.hand_regression_flag = data.hand_regression_flag
         self.saliency_regression_flag = data.saliency_regression_flag
 
+        self.face_process_noise = data.face_process_noise
+        self.hand_process_noise = data.hand_process_noise
+        self.saliency_process_noise = data.saliency_process_noise
+        self.face_measurement_noise = data.face_measurement_noise
+        self.hand_measurement_noise = data.hand_measurement_noise
+        self.saliency_measurement_noise = data.saliency_measurement_noise
+
+        with self.lock:
+
+            # switch between regression and Kalman filter by moving all candidates to a new table
+            if data.face_kalman_flag != self.face_kalman_flag:
+                self.face_kalman_flag = data.face_kalman_flag
+                table = CreateTable(FACE_VALUES,self.face_kalman_flag,self.face_process_noise,self.face_measurement_noise)
+                for cface_id in self.cfaces:
+                    self.cfaces[cface_id].Move(table)
+                self.face_table = table
+                self.face_index.Invalidate()
+            elif self.face_kalman_flag:
+                self.face_table.SetNoise(self.face_process_noise,self.face_measurement_noise)
+
+            if data.hand_kalman_flag != self.hand_kalman_flag:
+                self.hand_kalman_flag = data.hand_kalman_flag
+                table = CreateTable(HAND_VALUES,self.hand_kalman_flag,self.hand_process_noise,self.hand_measurement_noise)
+                for chand_id in self.chands:
+                    self.chands[chand_id].Move(table)
+                self.hand_table = table
+                self.hand_index.Invalidate()
+            elif self.hand_kalman_flag:
+                self.hand_table.SetNoise(self.hand_process_noise,self.hand_measurement_noise)
+
+            if data.saliency_kalman_flag != self.saliency_kalman_flag:
+                self.saliency_kalman_flag = data.saliency_kalman_flag
+                table = CreateTable(SALIENCY_VALUES,self.saliency_kalman_flag,self.saliency_process_noise,self.saliency_measurement_noise)
+                for csaliency_id in self.csaliencies:
+                    self.csaliencies[csaliency_id].Move(table)
+                self.saliency_table = table
+                self.saliency_index.Invalidate()
+            elif self.saliency_kalman_flag:
+                self.saliency_table.SetNoise(self.saliency_process_noise,self.saliency_measurement_noise)
+
         self.face_fuse_distance = data.face_fuse_distance
         self.hand_fuse_distance = data.hand_fuse_distance
         self.saliency_fuse_distance = data.saliency_fuse_distance
 
+        self.face_batch_flag = data.face_batch_flag
+
         self.min_face_confidence = data.min_face_confidence
         self.min_hand_confidence = data.min_hand_confidence
         self.min_saliency_confidence = data.min_saliency_confidence
@@ -198,6 +384,9 @@ class VisionPipeline(object):
         self.full_hand_points = data.full_hand_points
         self.full_saliency_points = data.full_saliency_points
 
+        self.face_tracking_flag = data.face_tracking_flag
+        self.governor_flag = data.governor_flag
+
         return data
 
 
@@ -210,64 +399,210 @@ class VisionPipeline(object):
             if data.ts.secs == 0:
                 data.ts = rospy.get_rostime()
 
-            # find closest candidate face
-            closest_cface_id = 0
-            closest_dist = self.face_fuse_distance
-            for cface_id in self.cfaces:
+            # if capture time is missing, take the detection time
+            if data.capture_ts.is_zero():
+                data.capture_ts = data.ts
+            self.latency.AddSince("receive",data.capture_ts)
+
+            # in batch mode, collect the raw faces of one frame and associate them all at once
+            if self.face_batch_flag:
+                if (len(self.face_batch) > 0) and (self.face_batch[0].ts != data.ts):
+                    self.AssociateFaceBatch()
+                self.face_batch.append(data)
+            else:
+                self.AssociateFace(data)
+
+        # store the thumbnails of the new faces, outside the lock
+        self.WriteThumbs()
 
-                # find where the candidate face would be right now
-                if self.face_regression_flag:
-                    face = self.cfaces[cface_id].Extrapolate(data.ts)
-                else:
-                    face = self.cfaces[cface_id].faces[-1]
 
-                # calculate distance
-                dx = data.position.x - face.position.x
-                dy = data.position.y - face.position.y
-                dz = data.position.z - face.position.z
-                d = sqrt(dx * dx + dy * dy + dz * dz)
+    # associate one raw face with the candidate faces (lock is held)
+    def AssociateFace(self,data):
 
-                # update closest
-                if (closest_cface_id == 0) or (d < closest_dist):
-                    closest_cface_id = cface_id
-                    closest_dist = d
+        start = time.time()
 
-            # if close enough to existing face
-            if closest_dist < face_fuse_distance:
+        # index where the candidate faces would be at this time (once for all faces from the same frame)
+        if not self.face_index.IsBuiltFor(data.ts):
+            self.face_index.Clear(self.face_fuse_distance,data.ts)
+            cface_ids = list(self.cfaces.keys())
+            values,regressed = self.face_table.Predict([self.cfaces[cface_id].row for cface_id in cface_ids],data.ts.to_sec(),self.face_regression_flag)
+            for i in range(0,len(cface_ids)):
+                x,y,z = values[i,FACE_POSITION:FACE_POSITION + 3]
+                self.face_index.Insert(cface_ids[i],x,y,z)
 
-                # fuse with existing candidate face
-                self.cfaces[closest_cface_id].Append(data)
+        # find closest candidate face
+        closest_cface_id,closest_dist = self.face_index.FindNearest(data.position.x,data.position.y,data.position.z,self.face_fuse_distance)
 
+        # fuse with it if close enough, otherwise start a new candidate face
+        if closest_dist < self.face_fuse_distance:
+            self.FuseFace(data,closest_cface_id)
+        else:
+            self.FuseFace(data,None)
+
+        self.AccountAssociation(time.time() - start)
+
+
+    # associate the collected raw faces of one frame with the candidate faces as one assignment problem (lock is held)
+    def AssociateFaceBatch(self):
+
+        start = time.time()
+
+        faces = self.face_batch
+        self.face_batch = []
+        ts = faces[0].ts
+
+        # find where the candidate faces would be at this time, only once
+        cface_ids = list(self.cfaces.keys())
+        values,regressed = self.face_table.Predict([self.cfaces[cface_id].row for cface_id in cface_ids],ts.to_sec(),self.face_regression_flag)
+        predicted = values[:,FACE_POSITION:FACE_POSITION + 3]
+
+        # the cost of a pair is the distance between the raw face and the predicted candidate face
+        costs = []
+        for data in faces:
+            d = predicted - numpy.array([data.position.x,data.position.y,data.position.z])
+            costs.append(list(numpy.sqrt(numpy.sum(d * d,axis=1))))
+
+        # fuse the assigned raw faces, the others start new candidate faces
+        assigned = {}
+        for (i,j) in SolveAssignment(costs,self.face_fuse_distance):
+            assigned[i] = cface_ids[j]
+        for i in range(0,len(faces)):
+            if i in assigned:
+                self.FuseFace(faces[i],assigned[i])
             else:
+                self.FuseFace(faces[i],None)
 
-                # create new candidate face, starting with this face
-                closest_cface_id = GenerateCandidateFaceID()
-                cface = FacePredictor()
-                cface.Append(data)
+        # the candidates changed, so the index is outdated
+        self.face_index.Invalidate()
 
-                self.cfaces[closest_cface_id] = cface
+        self.AccountAssociation(time.time() - start)
 
-                # send face analysis request to face_analysis
-                msg = FaceRequest()
-                msg.session_id = self.session_id
-                msg.camera_id = self.camera_id
-                msg.cface_id = closest_cface_id
-                msg.face_id = data.face_id
-                msg.ts = data.ts
-                msg.thumb = data.thumb
-                self.face_request_pub.publish(msg)
 
-            # store thumbnail
-            if self.store_thumbs_flag:
+    # account for the time it took to associate a frame (or in single mode, one raw face) with the candidate faces (lock is held)
+    def AccountAssociation(self,duration):
+
+        self.face_association_count += 1
+        self.face_association_total += duration
+        if duration > self.face_association_max:
+            self.face_association_max = duration
+        self.latency.Add("associate",duration)
+
+
+    # account for the time the debug window held the lock to take a snapshot of the candidates (lock is held)
+    def AccountDebugSnapshot(self,duration):
+
+        self.debug_snapshot_count += 1
+        self.debug_snapshot_total += duration
+        if duration > self.debug_snapshot_max:
+            self.debug_snapshot_max = duration
+
 
-                cface_tag = "cface_%08X" % (closest_cface_id & 0xFFFFFFFF)
-                thumb_dir = self.thumbs_output_dir + cface_tag + "/"
-                if not os.path.exists(thumb_dir):
-                    os.makedirs(thumb_dir)
-                image = opencv_bridge.imgmsg_to_cv2(data.thumb)
-                face_tag = "face_%08X" % (data.face_id & 0xFFFFFFFF)
-                path = thumb_dir + "/" + face_tag + self.thumbs_ext
-                cv2.imwrite(path,image)
+    # account for the time it took to transform the candidates of one tick to world coordinates (lock is held)
+    def AccountTransform(self,duration,points):
+
+        self.transform_ticks += 1
+        self.transform_points += points
+        self.transform_total += duration
+        if duration > self.transform_max:
+            self.transform_max = duration
+        self.latency.Add("transform",duration)
+
+
+    # camera-to-world transform at a time as a 4x4 matrix, or None if it's not known (lock is held)
+    def WorldTransform(self,ts):
+
+        # look it up only once per timestamp
+        if ts != self.world_ts:
+            if not self.listener.canTransform("world",self.name,ts):
+                return None
+            translation,rotation = self.listener.lookupTransform("world",self.name,ts)
+            self.world_matrix = numpy.dot(translation_matrix(translation),quaternion_matrix(rotation))
+            self.world_ts = ts
+            self.transform_lookups += 1
+
+        return self.world_matrix
+
+
+    # fuse a raw face with a candidate face, or start a new candidate face if cface_id is None (lock is held)
+    def FuseFace(self,data,cface_id):
+
+        if cface_id is not None:
+
+            # fuse with existing candidate face
+            self.cfaces[cface_id].Append(data)
+            new_cface = False
+
+        else:
+
+            # create new candidate face, starting with this face
+            cface_id = GenerateCandidateFaceID()
+            cface = FacePredictor(self.face_table,cface_id)
+            cface.Append(data)
+
+            self.cfaces[cface_id] = cface
+            self.face_index.Insert(cface_id,data.position.x,data.position.y,data.position.z)
+            new_cface = True
+
+        # with asynchronous thumbnails, the thumbnail might not be here yet
+        if self.async_thumbs_flag:
+            if data.face_id in self.face_thumbs:
+                self.HandleThumb(cface_id,data.face_id,data.ts,self.face_thumbs.pop(data.face_id).thumb,new_cface)
+            else:
+                self.thumb_faces[data.face_id] = (cface_id,data.ts,new_cface)
+        else:
+            self.HandleThumb(cface_id,data.face_id,data.ts,data.thumb,new_cface)
+
+
+    # when the thumbnail of a raw face arrives (with asynchronous thumbnails)
+    def HandleFaceThumb(self,data):
+
+        with self.lock:
+
+            # the raw face might not be here yet
+            if data.face_id in self.thumb_faces:
+                cface_id,ts,new_cface = self.thumb_faces.pop(data.face_id)
+                self.HandleThumb(cface_id,data.face_id,ts,data.thumb,new_cface)
+            else:
+                self.face_thumbs[data.face_id] = data
+
+        # store the thumbnail, outside the lock
+        self.WriteThumbs()
+
+
+    # request face analysis for a new candidate face and collect the thumbnail to be stored (lock is held)
+    def HandleThumb(self,cface_id,face_id,ts,thumb,new_cface):
+
+        # send face analysis request to face_analysis
+        if new_cface:
+            msg = FaceRequest()
+            msg.session_id = self.session_id
+            msg.camera_id = self.camera_id
+            msg.cface_id = cface_id
+            msg.face_id = face_id
+            msg.ts = ts
+            msg.thumb = thumb
+            self.face_request_pub.publish(msg)
+
+        # store thumbnail (in the background)
+        if self.store_thumbs_flag:
+
+            cface_tag = "cface_%08X" % (cface_id & 0xFFFFFFFF)
+            face_tag = "face_%08X" % (face_id & 0xFFFFFFFF)
+            self.thumbs_to_write.append((self.thumbs_output_dir + cface_tag,face_tag + "." + self.thumbs_ext,thumb))
+
+
+    # hand the collected thumbnails to the thumbnail writer (lock is not held, with blocking the writer might wait)
+    def WriteThumbs(self):
+
+        if not self.store_thumbs_flag:
+            return
+
+        with self.lock:
+            thumbs = self.thumbs_to_write
+            self.thumbs_to_write = []
+
+        for directory,filename,thumb in thumbs:
+            self.thumb_writer.Write(directory,filename,thumb)
 
 
     # when a newly detected hand arrives
@@ -279,27 +614,17 @@ class VisionPipeline(object):
             if data.ts.secs == 0:
                 data.ts = rospy.get_rostime()
 
-            # find closest candidate face
-            closest_chand_id = 0
-            closest_dist = self.hand_fuse_distance
-            for chand_id in self.chands:
-
-                # find where the candidate face would be right now
-                if self.hand_regression_flag:
-                    hand = self.chands[chand_id].Extrapolate(data.ts)
-                else:
-                    hand = self.chands[chand_id].hands[-1]
+            # index where the candidate hands would be at this time (once for all hands from the same frame)
+            if not self.hand_index.IsBuiltFor(data.ts):
+                self.hand_index.Clear(self.hand_fuse_distance,data.ts)
+                chand_ids = list(self.chands.keys())
+                values,regressed = self.hand_table.Predict([self.chands[chand_id].row for chand_id in chand_ids],data.ts.to_sec(),self.hand_regression_flag)
+                for i in range(0,len(chand_ids)):
+                    x,y,z = values[i,HAND_POSITION:HAND_POSITION + 3]
+                    self.hand_index.Insert(chand_ids[i],x,y,z)
 
-                # calculate distance
-                dx = data.position.x - hand.position.x
-                dy = data.position.y - hand.position.y
-                dz = data.position.z - hand.position.z
-                d = sqrt(dx * dx + dy * dy + dz * dz)
-
-                # update closest                
-                if (closest_chand_id == 0) or (d < closest_dist):
-                    closest_chand_id = chand_id
-                    closest_dist = d
+            # find closest candidate hand
+            closest_chand_id,closest_dist = self.hand_index.FindNearest(data.position.x,data.position.y,data.position.z,self.hand_fuse_distance)
 
             # if close enough to existing hand
             if closest_dist < self.hand_fuse_distance:
@@ -311,10 +636,11 @@ class VisionPipeline(object):
 
                 # create new candidate hand
                 closest_chand_id = GenerateCandidateHandID()
-                chand = HandPredictor()
+                chand = HandPredictor(self.hand_table,closest_chand_id)
                 chand.Append(data)
 
                 self.chands[closest_chand_id] = chand
+                self.hand_index.Insert(closest_chand_id,data.position.x,data.position.y,data.position.z)
 
 
     # when a newly detected saliency vector arrives
@@ -326,27 +652,17 @@ class VisionPipeline(object):
             if data.ts.secs == 0:
                 data.ts = rospy.get_rostime()
 
+            # index where the candidate saliency vectors would point at this time (once for all vectors from the same frame)
+            if not self.saliency_index.IsBuiltFor(data.ts):
+                self.saliency_index.Clear(self.saliency_fuse_distance,data.ts)
+                csaliency_ids = list(self.csaliencies.keys())
+                values,regressed = self.saliency_table.Predict([self.csaliencies[csaliency_id].row for csaliency_id in csaliency_ids],data.ts.to_sec(),self.saliency_regression_flag)
+                for i in range(0,len(csaliency_ids)):
+                    x,y,z = values[i,SALIENCY_DIRECTION:SALIENCY_DIRECTION + 3]
+                    self.saliency_index.Insert(csaliency_ids[i],x,y,z)
+
             # find closest candidate saliency vector
-            closest_csaliency_id = 0
-            closest_dist = self.saliency_fuse_distance
-            for csaliency_id in self.csaliencies:
-
-                # find where the candidate face would be right now                
-                if self.saliency_regression_flag:
-                    saliency = self.csaliencies[csaliency_id].Extrapolate(data.ts)
-                else:
-                    saliency = self.csaliencies[csaliency_id].saliencies[-1]
-
-                # calculate distance
-                dx = data.direction.x - saliency.direction.x
-                dy = data.direction.y - saliency.direction.y
-                dz = data.direction.z - saliency.direction.z
-                d = sqrt(dx * dx + dy * dy + dz * dz)
-
-                # update closest
-                if (closest_csaliency_id == 0) or (d < closest_dist):
-                    closest_csaliency_id = csaliency_id
-                    closest_dist = d
+            closest_csaliency_id,closest_dist = self.saliency_index.FindNearest(data.direction.x,data.direction.y,data.direction.z,self.saliency_fuse_distance)
 
             # if close enough to existing saliency vector
             if closest_dist < self.saliency_fuse_distance:
@@ -358,10 +674,11 @@ class VisionPipeline(object):
 
                 # create new candidate saliency vector
                 closest_csaliency_id = GenerateCandidateSaliencyID()
-                csaliency = SaliencyPredictor()
+                csaliency = SaliencyPredictor(self.saliency_table,closest_csaliency_id)
                 csaliency.Append(data)
 
                 self.csaliencies[closest_csaliency_id] = csaliency
+                self.saliency_index.Insert(closest_csaliency_id,data.direction.x,data.direction.y,data.direction.z)
 
 
     # when a face was analyzed
@@ -382,238 +699,213 @@ class VisionPipeline(object):
             self.cfaces[data.cface_id].identity_confidence = data.identity_confidence
 
 
+    # open the debug window and start listening to the camera, keeping only the newest frame
+    def StartDebugVision(self):
+
+        cv2.namedWindow(self.name)
+        self.frame_sub = rospy.Subscriber("camera/image_raw",Image,self.HandleFrame,queue_size=1,buff_size=DEBUG_VISION_BUFFER_SIZE)
+
+
     # when a new camera image arrives
     def HandleFrame(self,data):
 
-        # calculate distance to camera plane
-        cpd = 1.0 / math.tan(self.fovy)
-
-        with self.lock:
+        # skip frames that arrive faster than the debug window rate
+        now = time.time()
+        if now - self.last_debug_time < 1.0 / self.debug_vision_rate:
+            self.debug_frames_skipped += 1
+            return
+        self.last_debug_time = now
+        self.debug_frames += 1
 
-            # convert image from ROS to OpenCV and unrotate
-            image = opencv_bridge.imgmsg_to_cv2(data,"bgr8")
-            width = image.shape[1]
-            height = image.shape[0]
-            if self.rotate == 90:
-                width = image.shape[0]
-                height = image.shape[1]
-                image = cv2.transpose(image)
-            elif self.rotate == -90:
-                width = image.shape[0]
-                height = image.shape[1]
-                image = cv2.transpose(image)
-                image = cv2.flip(image,1)
-            elif self.rotate == 180:
-                image = cv2.flip(image,-1)
-                image = cv2.flip(image,1)
-
-            # get current time
-            ts = rospy.get_rostime()
-
-            # display candidate faces as red circles
-            for cface_id in self.cfaces:
-
-                # the face
-                if self.face_regression_flag:
-                    face = self.cfaces[cface_id].Extrapolate(ts)
-                else:
-                    face = self.cfaces[cface_id].faces[-1]
-                x = int((0.5 + 0.5 * face.rect.origin.x) * float(width))
-                y = int((0.5 + 0.5 * face.rect.origin.y) * float(height))
-                cv2.circle(image,(x,y),10,(0,0,255),2)
-
-                # annotate with info if available
-                label = ""
-                if self.cfaces[cface_id].identity_confidence > 0.0:
-                    label = self.cfaces[cface_id].identity
-                if self.cfaces[cface_id].age_confidence > 0.0:
-                    if label != "":
-                        label += ", "
-                    label += str(int(self.cfaces[cface_id].age)) + " y/o"
-                if self.cfaces[cface_id].gender_confidence > 0.0:
-                    if label != "":
-                        label += ", "
-                    if self.cfaces[cface_id].gender == 2:
-                        label += "female"
-                    else:
-                        label += "male"
-                cv2.putText(image,label,(x - 20,y + 20),cv2.cv.CV_FONT_HERSHEY_PLAIN,1,(0,255,255))
+        # get current time
+        ts = rospy.get_rostime()
 
-            # TODO: display hands as green circles
+        # take a snapshot of the predicted candidates, this is all that needs the lock
+        with self.lock:
 
-            # display saliency vectors as blue circles
-            for csaliency_id in self.csaliencies:
+            start = time.time()
 
-                if self.saliency_regression_flag:
-                    saliency = self.csaliencies[csaliency_id].Extrapolate(ts)
-                else:
-                    saliency = self.csaliencies[csaliency_id].saliencies[-1]
+            cfaces = list(self.cfaces.values())
+            face_values,regressed = self.face_table.Predict([cface.row for cface in cfaces],ts.to_sec(),self.face_regression_flag)
+            face_labels = [FaceLabel(cface) for cface in cfaces]
 
-                # convert vector back to 2D camera position for visualization
-                fx = 1.0
-                fy = saliency.direction.y / saliency.direction.x
-                fz = saliency.direction.z / saliency.direction.x
-                px = int(0.5 * (1.0 - fy * cpd) * float(width))
-                py = int(0.5 * (1.0 - fz * cpd) * float(height))
-                cv2.circle(image,(px,py),10,(255,0,0),2)
+            csaliencies = list(self.csaliencies.values())
+            saliency_values,regressed = self.saliency_table.Predict([csaliency.row for csaliency in csaliencies],ts.to_sec(),self.saliency_regression_flag)
 
-            cv2.imshow(self.name,image)
+            self.AccountDebugSnapshot(time.time() - start)
 
+        # calculate distance to camera plane
+        cpd = 1.0 / math.tan(self.fovy)
 
-    # send markers to RViz for a face
-    def SendFaceMarkers(self,frame_id,ts,cface_id,ns,position):
+        # convert image from ROS to OpenCV, downscale and unrotate
+        image = opencv_bridge.imgmsg_to_cv2(data,"bgr8")
+        if self.debug_vision_scale < 1.0:
+            image = cv2.resize(image,(0,0),fx=self.debug_vision_scale,fy=self.debug_vision_scale,interpolation=cv2.INTER_NEAREST)
+        width = image.shape[1]
+        height = image.shape[0]
+        if self.rotate == 90:
+            width = image.shape[0]
+            height = image.shape[1]
+            image = cv2.transpose(image)
+        elif self.rotate == -90:
+            width = image.shape[0]
+            height = image.shape[1]
+            image = cv2.transpose(image)
+            image = cv2.flip(image,1)
+        elif self.rotate == 180:
+            image = cv2.flip(image,0)
+
+        # display candidate faces as red circles, annotated with info if available
+        for i in range(0,len(face_values)):
+            x = int((0.5 + 0.5 * face_values[i,FACE_RECT]) * float(width))
+            y = int((0.5 + 0.5 * face_values[i,FACE_RECT + 1]) * float(height))
+            cv2.circle(image,(x,y),10,(0,0,255),2)
+            cv2.putText(image,face_labels[i],(x - 20,y + 20),cv2.cv.CV_FONT_HERSHEY_PLAIN,1,(0,255,255))
+
+        # TODO: display hands as green circles
+
+        # display saliency vectors as blue circles
+        for i in range(0,len(saliency_values)):
+
+            # convert vector back to 2D camera position for visualization
+            dx,dy,dz = saliency_values[i,SALIENCY_DIRECTION:SALIENCY_DIRECTION + 3]
+            fy = dy / dx
+            fz = dz / dx
+            px = int(0.5 * (1.0 - fy * cpd) * float(width))
+            py = int(0.5 * (1.0 - fz * cpd) * float(height))
+            cv2.circle(image,(px,py),10,(255,0,0),2)
+
+        cv2.imshow(self.name,image)
+
+
+    # start publishing markers to RViz, one array per modality and visualization tick
+    def StartMarkers(self):
+
+        self.face_rviz_pub = rospy.Publisher("rviz_face",MarkerArray,queue_size=5)
+        self.hand_rviz_pub = rospy.Publisher("rviz_hand",MarkerArray,queue_size=5)
+        self.saliency_rviz_pub = rospy.Publisher("rviz_saliency",MarkerArray,queue_size=5)
+
+        self.face_markers = MarkerBatch(self.face_rviz_pub)
+        self.hand_markers = MarkerBatch(self.hand_rviz_pub)
+        self.saliency_markers = MarkerBatch(self.saliency_rviz_pub)
+
+        ns = "/robot/perception/{}".format(self.name)
+        candidate_lifetime = self.MarkerLifetime(CANDIDATE_MARKER_LIFETIME)
+        saliency_lifetime = self.MarkerLifetime(SALIENCY_MARKER_LIFETIME)
+        self.face_template = MakeTemplate(self.name,ns,Marker.SPHERE,(0.1,0.1,0.1),(1.0,0.0,0.0,0.5),candidate_lifetime)
+        self.face_label_template = MakeTemplate(self.name,ns,Marker.TEXT_VIEW_FACING,(0.05,0.05,0.05),(0.7,0.7,0.7,0.5),candidate_lifetime)
+        self.hand_template = MakeTemplate(self.name,ns,Marker.SPHERE,(0.1,0.1,0.1),(0.0,1.0,0.0,0.5),candidate_lifetime)
+        self.hand_label_template = MakeTemplate(self.name,ns,Marker.TEXT_VIEW_FACING,(0.05,0.05,0.05),(0.7,0.7,0.7,0.5),candidate_lifetime)
+        self.saliency_template = MakeTemplate(self.name,ns,Marker.ARROW,(0.01,0.03,0.08),(0.0,0.0,1.0,0.5),saliency_lifetime)
+
+
+    # lifetime of a marker, at least the shortest lifetime, and long enough to be refreshed at visualization rate
+    def MarkerLifetime(self,shortest):
+
+        return max(shortest,2.0 / self.visualize_rate)
+
+
+    # follow a change of the visualization rate in the lifetimes of the templates and the markers (lock is held)
+    def SetMarkerLifetimes(self):
+
+        candidate_lifetime = self.MarkerLifetime(CANDIDATE_MARKER_LIFETIME)
+        saliency_lifetime = self.MarkerLifetime(SALIENCY_MARKER_LIFETIME)
+        for template in [self.face_template,self.face_label_template,self.hand_template,self.hand_label_template]:
+            template.lifetime = rospy.Duration.from_sec(candidate_lifetime)
+        self.saliency_template.lifetime = rospy.Duration.from_sec(saliency_lifetime)
+        self.face_markers.SetLifetime(candidate_lifetime)
+        self.hand_markers.SetLifetime(candidate_lifetime)
+        self.saliency_markers.SetLifetime(saliency_lifetime)
+
+
+    # update the RViz markers for a face (lock is held)
+    def SendFaceMarkers(self,ts,cface_id,position):
 
         # the face
-        marker = Marker()
-        marker.header.frame_id = frame_id
-        marker.header.stamp = ts
-        marker.id = cface_id
-        marker.ns = ns
-        marker.type = Marker.SPHERE
-        marker.action = Marker.MODIFY
-        marker.pose.position.x = position.x
-        marker.pose.position.y = position.y
-        marker.pose.position.z = position.z
-        marker.pose.orientation.x = 0.0
-        marker.pose.orientation.y = 0.0
-        marker.pose.orientation.z = 0.0
-        marker.pose.orientation.w = 1.0
-        marker.scale.x = 0.1
-        marker.scale.y = 0.1
-        marker.scale.z = 0.1
-        marker.color.r = 1.0
-        marker.color.g = 0.0
-        marker.color.b = 0.0
-        marker.color.a = 0.5
-        marker.lifetime = rospy.Duration(2,0)
-        marker.frame_locked = False
-        self.face_rviz_pub.publish(marker)
+        self.face_markers.Update(self.face_template,cface_id,ts,position,None,self.visualize_change_distance)
 
         # label under the face
-        marker = Marker()
-        marker.header.frame_id = frame_id
-        marker.header.stamp = ts
-        marker.id = cface_id + 1
-        marker.ns = ns
-        marker.type = Marker.TEXT_VIEW_FACING
-        marker.action = Marker.MODIFY
-        marker.pose.position.x = position.x
-        marker.pose.position.y = position.y
-        marker.pose.position.z = position.z - 0.1
-        marker.pose.orientation.x = 0.0
-        marker.pose.orientation.y = 0.0
-        marker.pose.orientation.z = 0.0
-        marker.pose.orientation.w = 1.0
-        marker.scale.x = 0.05
-        marker.scale.y = 0.05
-        marker.scale.z = 0.05
-        marker.color.r = 0.7
-        marker.color.g = 0.7
-        marker.color.b = 0.7
-        marker.color.a = 0.5
         if self.cfaces[cface_id].gender == 2:
             gender = "female"
         else:
             gender = "male"
-        marker.text = self.name + " candidate {} ({} {})".format(cface_id,gender,int(self.cfaces[cface_id].age))
-        marker.lifetime = rospy.Duration(2,0)
-        marker.frame_locked = False
-        self.face_rviz_pub.publish(marker)
+        text = self.name + " candidate {} ({} {})".format(cface_id,gender,int(self.cfaces[cface_id].age))
+        self.face_markers.Update(self.face_label_template,cface_id + 1,ts,(position[0],position[1],position[2] - 0.1),text,self.visualize_change_distance)
 
 
-    # send markers to RViz for a hand
-    def SendHandMarkers(self,frame_id,ts,chand_id,ns,position,gestures):
+    # update the RViz markers for a hand (lock is held)
+    def SendHandMarkers(self,ts,chand_id,position,gestures):
 
         # the hand
-        marker = Marker()
-        marker.header.frame_id = frame_id
-        marker.header.stamp = ts
-        marker.id = chand_id
-        marker.ns = ns
-        marker.type = Marker.SPHERE
-        marker.action = Marker.MODIFY
-        marker.pose.position.x = position.x
-        marker.pose.position.y = position.y
-        marker.pose.position.z = position.z
-        marker.pose.orientation.x = 0.0
-        marker.pose.orientation.y = 0.0
-        marker.pose.orientation.z = 0.0
-        marker.pose.orientation.w = 1.0
-        marker.scale.x = 0.1
-        marker.scale.y = 0.1
-        marker.scale.z = 0.1
-        marker.color.r = 0.0
-        marker.color.g = 1.0
-        marker.color.b = 0.0
-        marker.color.a = 0.5
-        marker.lifetime = rospy.Duration(2,0)
-        marker.frame_locked = False
-        self.hand_rviz_pub.publish(marker)
+        self.hand_markers.Update(self.hand_template,chand_id,ts,position,None,self.visualize_change_distance)
 
         # label under the hand
-        marker = Marker()
-        marker.header.frame_id = frame_id
-        marker.header.stamp = ts
-        marker.id = chand_id + 1
-        marker.ns = ns
-        marker.type = Marker.TEXT_VIEW_FACING
-        marker.action = Marker.MODIFY
-        marker.pose.position.x = position.x
-        marker.pose.position.y = position.y
-        marker.pose.position.z = position.z - 0.1
-        marker.pose.orientation.x = 0.0
-        marker.pose.orientation.y = 0.0
-        marker.pose.orientation.z = 0.0
-        marker.pose.orientation.w = 1.0
-        marker.scale.x = 0.05
-        marker.scale.y = 0.05
-        marker.scale.z = 0.05
-        marker.color.r = 0.7
-        marker.color.g = 0.7
-        marker.color.b = 0.7
-        marker.color.a = 0.5
-        marker.text = self.name + " hand: "
+        text = self.name + " hand: "
         for gesture in gestures:
-            marker.text += " " + gesture
-        marker.lifetime = rospy.Duration(2,0)
-        marker.frame_locked = False
-        self.hand_rviz_pub.publish(marker)
-
-        
-    # send markers to RViz for a saliency vector
-    def SendSaliencyMarker(self,frame_id,ts,csaliency_id,ns,direction):
-
-        # the arrow
-        marker = Marker()
-        marker.header.frame_id = frame_id
-        marker.header.stamp = ts
-        marker.id = csaliency_id
-        marker.ns = ns
-        marker.type = Marker.ARROW
-        marker.action = Marker.MODIFY
-        marker.pose.position.x = 0
-        marker.pose.position.y = 0
-        marker.pose.position.z = 0
-        marker.pose.orientation.x = 0.0
-        marker.pose.orientation.y = 0.0
-        marker.pose.orientation.z = 0.0
-        marker.pose.orientation.w = 1.0
-        marker.scale.x = 0.01
-        marker.scale.y = 0.03
-        marker.scale.z = 0.08
-        marker.color.r = 0.0
-        marker.color.g = 0.0
-        marker.color.b = 1.0
-        marker.color.a = 0.5
-        points = []
-        points.append(Point(0.0,0.0,0.0))
-        points.append(Point(direction.x,direction.y,direction.z))
-        marker.points = points
-        marker.lifetime = rospy.Duration.from_sec(0.1)
-        marker.frame_locked = False
-        self.saliency_rviz_pub.publish(marker)
-
-        
+            text += " " + gesture
+        self.hand_markers.Update(self.hand_label_template,chand_id + 1,ts,(position[0],position[1],position[2] - 0.1),text,self.visualize_change_distance)
+
+
+    # update the RViz marker for a saliency vector (lock is held)
+    def SendSaliencyMarker(self,ts,csaliency_id,direction):
+
+        self.saliency_markers.Update(self.saliency_template,csaliency_id,ts,direction,None,self.visualize_change_distance)
+
+
+    # at pipeline statistics rate
+    def HandleStatsTimer(self,event):
+
+        with self.lock:
+
+            msg = PipelineStats()
+            msg.ts = rospy.get_rostime()
+            msg.face_associations = self.face_association_count
+            msg.face_association_mean = 0.0
+            if self.face_association_count > 0:
+                msg.face_association_mean = self.face_association_total / float(self.face_association_count)
+            msg.face_association_max = self.face_association_max
+            msg.transform_ticks = self.transform_ticks
+            msg.transform_points = self.transform_points
+            msg.transform_lookups = self.transform_lookups
+            msg.transform_mean = 0.0
+            if self.transform_ticks > 0:
+                msg.transform_mean = self.transform_total / float(self.transform_ticks)
+            msg.transform_max = self.transform_max
+            if self.store_thumbs_flag:
+                self.thumb_writer.FillStats(msg)
+            msg.debug_frames = self.debug_frames
+            msg.debug_frames_skipped = self.debug_frames_skipped
+            msg.debug_snapshot_mean = 0.0
+            if self.debug_snapshot_count > 0:
+                msg.debug_snapshot_mean = self.debug_snapshot_total / float(self.debug_snapshot_count)
+            msg.debug_snapshot_max = self.debug_snapshot_max
+
+            self.face_association_count = 0
+            self.face_association_total = 0.0
+            self.face_association_max = 0.0
+            self.transform_ticks = 0
+            self.transform_points = 0
+            self.transform_lookups = 0
+            self.transform_total = 0.0
+            self.transform_max = 0.0
+            self.debug_snapshot_count = 0
+            self.debug_snapshot_total = 0.0
+            self.debug_snapshot_max = 0.0
+
+        self.stats_pub.publish(msg)
+
+
+    # at latency report rate
+    def HandleLatencyTimer(self,event):
+
+        msg = LatencyReport()
+        msg.ts = rospy.get_rostime()
+        self.latency.FillReport(msg)
+        self.latency_pub.publish(msg)
+        if self.latency_dump_flag:
+            self.latency.Dump(msg,self.latency_dump_dir + "/" + self.name + "_vision_pipeline.csv")
+
+
     # at vision rate
     def HandleTimer(self,data):
 
@@ -622,153 +914,201 @@ class VisionPipeline(object):
 
         with self.lock:
 
-            # mine the current candidate faces for confident ones and send them off
-            for cface_id in self.cfaces:
-                conf = self.cfaces[cface_id].CalculateConfidence(self.full_face_points)
-                if conf >= self.min_face_confidence:
-
-                    # get best candidate face
-                    if self.face_regression_flag:
-                        cface = self.cfaces[cface_id].Extrapolate(ts)
-                    else:
-                        cface = self.cfaces[cface_id].faces[-1]
-
-                    if self.listener.canTransform("world",self.name,ts):
-
-                        # make a PointStamped structure to satisfy TF
-                        ps = PointStamped()
-                        ps.header.seq = 0
-                        ps.header.stamp = ts
-                        ps.header.frame_id = self.name
-                        ps.point.x = cface.position.x
-                        ps.point.y = cface.position.y
-                        ps.point.z = cface.position.z
-
-                        # transform to world coordinates
-                        pst = self.listener.transformPoint("world",ps)
-
-                        # setup candidate face message
-                        msg = Candidateface()
-                        msg.session_id = self.session_id
-                        msg.camera_id = self.camera_id
-                        msg.cface_id = cface_id
-                        msg.ts = ts
-                        msg.position.x = pst.point.x
-                        msg.position.y = pst.point.y
-                        msg.position.z = pst.point.z
-                        msg.confidence = cface.confidence
-                        msg.smile = cface.smile
-                        msg.frown = cface.frown
-                        msg.expressions = cface.expressions
-                        msg.age = self.cfaces[cface_id].age
-                        msg.age_confidence = self.cfaces[cface_id].age_confidence
-                        msg.gender = self.cfaces[cface_id].gender
-                        msg.gender_confidence = self.cfaces[cface_id].gender_confidence
-                        msg.identity = self.cfaces[cface_id].identity
-                        msg.identity_confidence = self.cfaces[cface_id].identity_confidence
-                        self.cface_pub.publish(msg)
-
-                    # output markers to rviz
-                    if self.visualize_flag and self.visualize_candidates_flag:
-                        self.SendFaceMarkers(self.name,ts,cface_id,"/robot/perception/{}".format(self.name),cface.position)
-
-            # prune the candidate faces and remove them if they disappeared
-            to_be_removed = []
+            # in batch mode, associate the last collected frame of raw faces
+            if len(self.face_batch) > 0:
+                self.AssociateFaceBatch()
+
+            # send markers to RViz at most at visualization rate
+            visualize = False
+            if self.visualize_flag and self.visualize_candidates_flag and ((ts - self.last_visualize_ts).to_sec() >= 1.0 / self.visualize_rate):
+                visualize = True
+                self.last_visualize_ts = ts
+
+            # look up the camera-to-world transform once for all candidates
+            start = time.time()
+            world = self.WorldTransform(ts)
+            transform_time = time.time() - start
+            transform_points = 0
+
+            # score and predict all candidate faces at once
+            cface_ids = list(self.cfaces.keys())
+            rows = [self.cfaces[cface_id].row for cface_id in cface_ids]
+            confidences = self.face_table.Confidence(rows,FACE_CONFIDENCE,self.full_face_points)
+            values,regressed = self.face_table.Predict(rows,ts.to_sec(),self.face_regression_flag)
+
+            # transform the confident ones to world coordinates all at once
+            confident = numpy.flatnonzero(confidences >= self.min_face_confidence)
+            if world is not None:
+                start = time.time()
+                world_positions = TransformPoints(world,values[confident,FACE_POSITION:FACE_POSITION + 3])
+                transform_time += time.time() - start
+                transform_points += len(confident)
+
+            # and send them off
+            for j in range(0,len(confident)):
+
+                i = confident[j]
+                cface_id = cface_ids[i]
+                x,y,z = values[i,FACE_POSITION:FACE_POSITION + 3]
+
+                if world is not None:
+
+                    # setup candidate face message (expressions cannot be extrapolated)
+                    msg = CandidateFace()
+                    msg.session_id = self.session_id
+                    msg.camera_id = self.camera_id
+                    msg.cface_id = cface_id
+                    msg.ts = ts
+                    msg.capture_ts = self.cfaces[cface_id].Latest().capture_ts
+                    msg.position.x,msg.position.y,msg.position.z = world_positions[j]
+                    msg.confidence = values[i,FACE_CONFIDENCE]
+                    msg.smile = values[i,FACE_SMILE]
+                    msg.frown = values[i,FACE_FROWN]
+                    msg.expressions = []
+                    if not regressed[i]:
+                        msg.expressions = self.cfaces[cface_id].Latest().expressions
+                    msg.age = self.cfaces[cface_id].age
+                    msg.age_confidence = self.cfaces[cface_id].age_confidence
+                    msg.gender = self.cfaces[cface_id].gender
+                    msg.gender_confidence = self.cfaces[cface_id].gender_confidence
+                    msg.identity = self.cfaces[cface_id].identity
+                    msg.identity_confidence = self.cfaces[cface_id].identity_confidence
+                    self.cface_pub.publish(msg)
+                    self.latency.AddSince("publish",msg.capture_ts)
+
+                # output markers to rviz
+                if visualize:
+                    self.SendFaceMarkers(ts,cface_id,(x,y,z))
+
+            if visualize:
+                self.face_markers.Publish(ts)
+
+            # prune only the candidate faces with expired faces, and remove the ones that disappeared
             prune_before_time = ts - rospy.Duration.from_sec(self.face_keep_time)
-            for cface_id in self.cfaces:
-                self.cfaces[cface_id].PruneBefore(prune_before_time)
-                if len(self.cfaces[cface_id].faces) == 0:
-                    to_be_removed.append(cface_id)
-            for key in to_be_removed:
-                del self.cfaces[key]
-
-
-            # mine the current candidate hands for confident ones and send them off
-            for chand_id in self.chands:
-                conf = self.chands[chand_id].CalculateConfidence(self.full_hand_points)
-                if conf >= self.min_hand_confidence:
-
-                    # get best candidate hand
-                    if self.hand_regression_flag:
-                        chand = self.chands[chand_id].Extrapolate(ts)
-                    else:
-                        chand = self.chands[chand_id].hands[-1]
-
-                    if self.listener.canTransform("world",self.name,ts):
-
-                        # make a PointStamped structure to satisfy TF
-                        ps = PointStamped()
-                        ps.header.seq = 0
-                        ps.header.stamp = ts
-                        ps.header.frame_id = self.name
-                        ps.point.x = chand.position.x
-                        ps.point.y = chand.position.y
-                        ps.point.z = chand.position.z
-
-                        # transform to world coordinates
-                        pst = self.listener.transformPoint("world",ps)
-
-                        # setup candidate hand message
-                        msg = CandidateHand()
-                        msg.session_id = self.session_id
-                        msg.camera_id = self.camera_id
-                        msg.chand_id = chand_id
-                        msg.ts = ts
-                        msg.position.x = pst.point.x
-                        msg.position.y = pst.point.y
-                        msg.position.z = pst.point.z
-                        msg.confidence = chand.confidence
-                        self.chand_pub.publish(msg)
-
-                    # output markers to rviz
-                    if self.visualize_flag and self.visualize_candidates_flag:
-                        self.SendHandMarkers(self.name,ts,chand_id,"/robot/perception/{}".format(self.name),chand.position,chand.gestures)
-
-            # prune the candidate hands and remove them if they disappeared
-            to_be_removed = []
-            prune_before_time = ts - rospy.Duration.from_sec(self.hand_keep_time)
-            for chand_id in self.chands:
-                self.chands[chand_id].PruneBefore(prune_before_time)
-                if len(self.chands[chand_id].hands) == 0:
-                    to_be_removed.append(chand_id)
-            for key in to_be_removed:
-                del self.chands[key]
-
-
-            # mine the current candidate saliencies for confident ones and send them off
-            for csaliency_id in self.csaliencies:
-                conf = self.csaliencies[csaliency_id].CalculateConfidence(self.full_saliency_points)
-                if conf >= self.min_saliency_confidence:
-
-                    # get best candidate saliency
-                    if self.saliency_regression_flag:
-                        csaliency = self.csaliencies[csaliency_id].Extrapolate(ts)
-                    else:
-                        csaliency = self.csaliencies[csaliency_id].saliencies[-1]
-
-                    msg = CandidateSaliency()
+            expired_rows,removed = self.face_table.Expire(prune_before_time.to_sec())
+            for row in expired_rows:
+                if self.face_table.Count(row) == 0:
+                    self.cfaces.pop(self.face_table.keys[row]).Release()
+            if len(expired_rows) > 0:
+                self.face_index.Invalidate()
+
+            # forget raw faces and thumbnails that never found each other
+            for face_id in [face_id for face_id in self.thumb_faces if self.thumb_faces[face_id][1] < prune_before_time]:
+                del self.thumb_faces[face_id]
+            for face_id in [face_id for face_id in self.face_thumbs if self.face_thumbs[face_id].ts < prune_before_time]:
+                del self.face_thumbs[face_id]
+
+            # send predicted regions of all remaining candidate faces to face detection for tracking and rate governing
+            if self.face_tracking_flag or self.governor_flag:
+                msg = FaceRegions()
+                msg.ts = ts
+                msg.rects = []
+                values,regressed = self.face_table.Predict([cface.row for cface in self.cfaces.values()],ts.to_sec(),self.face_regression_flag)
+                for i in range(0,len(values)):
+                    rect = Float32R()
+                    rect.origin.x,rect.origin.y,rect.size.x,rect.size.y = values[i,FACE_RECT:FACE_RECT + 4]
+                    msg.rects.append(rect)
+                self.face_regions_pub.publish(msg)
+
+
+            # score and predict all candidate hands at once
+            chand_ids = list(self.chands.keys())
+            rows = [self.chands[chand_id].row for chand_id in chand_ids]
+            confidences = self.hand_table.Confidence(rows,HAND_CONFIDENCE,self.full_hand_points)
+            values,regressed = self.hand_table.Predict(rows,ts.to_sec(),self.hand_regression_flag)
+
+            # transform the confident ones to world coordinates all at once
+            confident = numpy.flatnonzero(confidences >= self.min_hand_confidence)
+            if world is not None:
+                start = time.time()
+                world_positions = TransformPoints(world,values[confident,HAND_POSITION:HAND_POSITION + 3])
+                transform_time += time.time() - start
+                transform_points += len(confident)
+            self.AccountTransform(transform_time,transform_points)
+
+            # and send them off
+            for j in range(0,len(confident)):
+
+                i = confident[j]
+                chand_id = chand_ids[i]
+                x,y,z = values[i,HAND_POSITION:HAND_POSITION + 3]
+
+                if world is not None:
+
+                    # setup candidate hand message
+                    msg = CandidateHand()
                     msg.session_id = self.session_id
                     msg.camera_id = self.camera_id
-                    msg.csaliency_id = csaliency_id
+                    msg.chand_id = chand_id
                     msg.ts = ts
-                    msg.direction = csaliency.direction
-                    msg.confidence = csaliency.confidence
-                    self.csaliency_pub.publish(msg)
+                    msg.position.x,msg.position.y,msg.position.z = world_positions[j]
+                    msg.confidence = values[i,HAND_CONFIDENCE]
+                    self.chand_pub.publish(msg)
+
+                # output markers to rviz (a regressed hand shows all gestures of its history)
+                if visualize:
+                    if regressed[i]:
+                        gestures = self.chands[chand_id].gestures
+                    else:
+                        gestures = self.chands[chand_id].Latest().gestures
+                    self.SendHandMarkers(ts,chand_id,(x,y,z),gestures)
 
-                    # output markers to rviz
-                    if self.visualize_flag and self.visualize_candidates_flag:
-                        self.SendSaliencyMarker(self.name,ts,csaliency_id,"/robot/perception/{}".format(self.name),csaliency.direction)
+            if visualize:
+                self.hand_markers.Publish(ts)
 
-            # prune the candidate saliencies and remove them if they disappeared
-            to_be_removed = []
-            prune_before_time = ts - rospy.Duration.from_sec(self.saliency_keep_time)
-            for csaliency_id in self.csaliencies:
-                self.csaliencies[csaliency_id].PruneBefore(prune_before_time)
-                if len(self.csaliencies[csaliency_id].saliencies) == 0:
-                    to_be_removed.append(csaliency_id)
-            for key in to_be_removed:
-                del self.csaliencies[key]
+            # prune only the candidate hands with expired hands, and remove the ones that disappeared
+            prune_before_time = ts - rospy.Duration.from_sec(self.hand_keep_time)
+            expired_rows,removed = self.hand_table.Expire(prune_before_time.to_sec())
+            for i in range(0,len(expired_rows)):
+                chand_id = self.hand_table.keys[expired_rows[i]]
+                self.chands[chand_id].ForgetGestures(removed[i])
+                if self.hand_table.Count(expired_rows[i]) == 0:
+                    self.chands.pop(chand_id).Release()
+            if len(expired_rows) > 0:
+                self.hand_index.Invalidate()
+
+
+            # score and predict all candidate saliencies at once
+            csaliency_ids = list(self.csaliencies.keys())
+            rows = [self.csaliencies[csaliency_id].row for csaliency_id in csaliency_ids]
+            confidences = self.saliency_table.Confidence(rows,SALIENCY_CONFIDENCE,self.full_saliency_points)
+            values,regressed = self.saliency_table.Predict(rows,ts.to_sec(),self.saliency_regression_flag)
+
+            # send off the confident ones
+            for i in numpy.flatnonzero(confidences >= self.min_saliency_confidence):
 
+                csaliency_id = csaliency_ids[i]
+                x,y,z = values[i,SALIENCY_DIRECTION:SALIENCY_DIRECTION + 3]
+
+                msg = CandidateSaliency()
+                msg.session_id = self.session_id
+                msg.camera_id = self.camera_id
+                msg.csaliency_id = csaliency_id
+                msg.ts = ts
+                msg.direction.x = x
+                msg.direction.y = y
+                msg.direction.z = z
+                msg.confidence = values[i,SALIENCY_CONFIDENCE]
+                self.csaliency_pub.publish(msg)
+
+                # output markers to rviz
+                if visualize:
+                    self.SendSaliencyMarker(ts,csaliency_id,(x,y,z))
+
+            if visualize:
+                self.saliency_markers.Publish(ts)
+
+            # prune only the candidate saliencies with expired saliencies, and remove the ones that disappeared
+            prune_before_time = ts - rospy.Duration.from_sec(self.saliency_keep_time)
+            expired_rows,removed = self.saliency_table.Expire(prune_before_time.to_sec())
+            for row in expired_rows:
+                if self.saliency_table.Count(row) == 0:
+                    self.csaliencies.pop(self.saliency_table.keys[row]).Release()
+            if len(expired_rows) > 0:
+                self.saliency_index.Invalidate()
+
+        # store the thumbnails of the faces associated in batch mode, outside the lock
+        self.WriteThumbs()
 
 if __name__ == '__main__':
 
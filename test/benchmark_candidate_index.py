@@ -0,0 +1,139 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time to fuse one frame of raw faces with 1 to 500 candidate faces
+#     linear: every raw face scans all candidates and extrapolates each of them (as HandleFace did)
+#     index: the candidates are extrapolated once per frame into a GridIndex, and each raw face looks up only the nearby cells
+#     both must find the same candidates
+
+# usage: benchmark_candidate_index.py [history faces_per_frame frames]
+
+import os
+import sys
+import time
+import random
+import math
+import rospy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from face_predictor import FacePredictor
+from candidate_index import GridIndex
+
+
+FUSE_DISTANCE = 0.2
+CANDIDATES = [1,10,50,100,200,500]
+
+
+def MakeFace(ts,x,y,z):
+
+    face = Face()
+    face.ts = ts
+    face.position.x = x
+    face.position.y = y
+    face.position.z = z
+    face.confidence = 1.0
+    return face
+
+
+# candidates spread out in a room in front of the camera, each with a short, slightly moving history
+def MakeCandidates(count,history,ts):
+
+    cfaces = {}
+    for i in range(0,count):
+        x = random.uniform(0.5,8.0)
+        y = random.uniform(-4.0,4.0)
+        z = random.uniform(-0.5,0.5)
+        cface = FacePredictor()
+        for k in range(0,history):
+            t = ts - rospy.Duration.from_sec(0.1 * float(history - k))
+            cface.Append(MakeFace(t,x + 0.01 * k,y,z))
+        cfaces[i] = cface
+    return cfaces
+
+
+def Linear(cfaces,faces):
+
+    result = []
+    for data in faces:
+        closest_cface_id = None
+        closest_dist = FUSE_DISTANCE
+        for cface_id in cfaces:
+            face = cfaces[cface_id].Extrapolate(data.ts)
+            dx = data.position.x - face.position.x
+            dy = data.position.y - face.position.y
+            dz = data.position.z - face.position.z
+            d = math.sqrt(dx * dx + dy * dy + dz * dz)
+            if d < closest_dist:
+                closest_cface_id = cface_id
+                closest_dist = d
+        result.append(closest_cface_id)
+    return result
+
+
+def Indexed(cfaces,faces,index):
+
+    result = []
+    for data in faces:
+        if not index.IsBuiltFor(data.ts):
+            index.Clear(FUSE_DISTANCE,data.ts)
+            for cface_id in cfaces:
+                face = cfaces[cface_id].Extrapolate(data.ts)
+                index.Insert(cface_id,face.position.x,face.position.y,face.position.z)
+        closest_cface_id,closest_dist = index.FindNearest(data.position.x,data.position.y,data.position.z,FUSE_DISTANCE)
+        result.append(closest_cface_id)
+    return result
+
+
+if __name__ == '__main__':
+
+    history = 10
+    faces_per_frame = 5
+    frames = 20
+    if len(sys.argv) > 3:
+        history = int(sys.argv[1])
+        faces_per_frame = int(sys.argv[2])
+        frames = int(sys.argv[3])
+
+    random.seed(0)
+    ts = rospy.Time(1000,0)
+
+    print "history {}, {} raw faces per frame, {} frames".format(history,faces_per_frame,frames)
+    print "candidates  linear (ms/frame)  index (ms/frame)  speedup"
+    for count in CANDIDATES:
+
+        cfaces = MakeCandidates(count,history,ts)
+
+        # one frame of raw faces: some near existing candidates, some new
+        batches = []
+        for f in range(0,frames):
+            frame_ts = ts + rospy.Duration.from_sec(0.01 * f)
+            faces = []
+            for i in range(0,faces_per_frame):
+                if (i % 2 == 0) and (count > 0):
+                    cface = cfaces[random.randrange(0,count)].Latest()
+                    faces.append(MakeFace(frame_ts,cface.position.x + random.uniform(-0.05,0.05),cface.position.y,cface.position.z))
+                else:
+                    faces.append(MakeFace(frame_ts,random.uniform(0.5,8.0),random.uniform(-4.0,4.0),random.uniform(-0.5,0.5)))
+            batches.append(faces)
+
+        start = time.clock()
+        linear_results = [Linear(cfaces,faces) for faces in batches]
+        linear = (time.clock() - start) * 1000.0 / float(frames)
+
+        index = GridIndex()
+        start = time.clock()
+        indexed_results = [Indexed(cfaces,faces,index) for faces in batches]
+        indexed = (time.clock() - start) * 1000.0 / float(frames)
+
+        if linear_results != indexed_results:
+            print "{:10}  MISMATCH between linear scan and index".format(count)
+            continue
+
+        speedup = 0.0
+        if indexed > 0.0:
+            speedup = linear / indexed
+        print "{:10}  {:17.3f}  {:16.3f}  {:6.1f}x".format(count,linear,indexed,speedup)
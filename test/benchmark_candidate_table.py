@@ -0,0 +1,127 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time of one vision tick (score, extrapolate and prune all candidate faces) against the number of candidates
+#     per candidate: every candidate is scored, extrapolated and pruned on its own (as HandleTimer did)
+#     table: all candidates are rows of one CandidateTable, and the tick is a few array operations over all rows
+#     both must find the same confidences and positions
+
+# usage: benchmark_candidate_table.py [history ticks]
+
+import os
+import sys
+import time
+import random
+import numpy
+import rospy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from face_predictor import FacePredictor,FACE_VALUES,FACE_POSITION,FACE_CONFIDENCE
+from candidate_table import CandidateTable
+
+
+TICK_TIME = 0.1
+FULL_POINTS = 10
+CANDIDATES = [1,10,50,100,200,500]
+
+
+def MakeFace(ts,x,y,z):
+
+    face = Face()
+    face.ts = ts
+    face.position.x = x
+    face.position.y = y
+    face.position.z = z
+    face.confidence = 1.0
+    return face
+
+
+# the old tick, one candidate at a time
+def PerCandidate(cfaces,ts,keep_time):
+
+    confidences = []
+    positions = []
+    for cface_id in cfaces:
+        confidences.append(cfaces[cface_id].CalculateConfidence(FULL_POINTS))
+        face = cfaces[cface_id].Extrapolate(ts)
+        positions.append((face.position.x,face.position.y,face.position.z))
+    prune_before_time = ts - rospy.Duration.from_sec(keep_time)
+    for cface_id in cfaces:
+        cfaces[cface_id].PruneBefore(prune_before_time)
+    return numpy.array(confidences),numpy.array(positions)
+
+
+# the new tick, all candidates at once
+def Table(table,cfaces,ts,keep_time):
+
+    rows = [cfaces[cface_id].row for cface_id in cfaces]
+    confidences = table.Confidence(rows,FACE_CONFIDENCE,FULL_POINTS)
+    values,regressed = table.Predict(rows,ts.to_sec(),True)
+    table.Expire((ts - rospy.Duration.from_sec(keep_time)).to_sec())
+    return confidences,values[:,FACE_POSITION:FACE_POSITION + 3]
+
+
+if __name__ == '__main__':
+
+    history = 20
+    ticks = 100
+    if len(sys.argv) > 2:
+        history = int(sys.argv[1])
+        ticks = int(sys.argv[2])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+    keep_time = TICK_TIME * float(history)
+
+    print "history {}, {} ticks".format(history,ticks)
+    print "candidates  per candidate (ms/tick)  table (ms/tick)  speedup  max difference"
+    for count in CANDIDATES:
+
+        # the same moving candidates, once as standalone predictors and once as rows of one table
+        table = CandidateTable(FACE_VALUES)
+        old_cfaces = {}
+        new_cfaces = {}
+        motions = {}
+        for i in range(0,count):
+            old_cfaces[i] = FacePredictor()
+            new_cfaces[i] = FacePredictor(table)
+            motions[i] = (random.uniform(0.5,8.0),random.uniform(-4.0,4.0),random.uniform(-0.5,0.5),random.uniform(-0.5,0.5))
+
+        before = 0.0
+        after = 0.0
+        difference = 0.0
+        for k in range(0,history + ticks):
+
+            # a new raw face for each candidate
+            ts = start_ts + rospy.Duration.from_sec(TICK_TIME * k)
+            for i in range(0,count):
+                x,y,z,vy = motions[i]
+                face = MakeFace(ts,x,y + vy * TICK_TIME * k + random.gauss(0.0,0.01),z)
+                old_cfaces[i].Append(face)
+                new_cfaces[i].Append(face)
+
+            # tick halfway to the next frame
+            tick_ts = ts + rospy.Duration.from_sec(0.5 * TICK_TIME)
+
+            start = time.clock()
+            old_confidences,old_positions = PerCandidate(old_cfaces,tick_ts,keep_time)
+            if k >= history:
+                before += time.clock() - start
+
+            start = time.clock()
+            new_confidences,new_positions = Table(table,new_cfaces,tick_ts,keep_time)
+            if k >= history:
+                after += time.clock() - start
+
+            difference = max(difference,numpy.max(numpy.abs(old_confidences - new_confidences)),numpy.max(numpy.abs(old_positions - new_positions)))
+
+        before *= 1000.0 / float(ticks)
+        after *= 1000.0 / float(ticks)
+        speedup = 0.0
+        if after > 0.0:
+            speedup = before / after
+        print "{:10}  {:24.3f}  {:15.3f}  {:6.1f}x  {:14.3g}".format(count,before,after,speedup,difference)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU use and latency of the running perception launch, to compare the separate and composed vision chains
+#     before: every camera runs detect_faces, detect_hands, detect_saliency, face_analysis and vision_pipeline as
+#     separate processes (test/perception.launch as is)
+#     after: every camera runs composed_vision.py as its vision_pipeline node (the alternative in test/perception.launch)
+#     run this once against each launch, with the same camera scene
+#     CPU is summed over all perception processes from /proc, latency is the last report of each node on the
+#     'latency' topics of the cameras and fusion
+
+# usage: benchmark_composed.py [seconds]
+
+import os
+import sys
+import time
+import rospy
+from r2_perception.msg import LatencyReport
+
+
+NAMESPACE = "/robot/perception/"
+CAMERAS = ["lefteye","righteye","realsense","wideangle"]
+SCRIPTS = ["preprocess_frames.py","detect_faces_haar.py","detect_hands.py","detect_saliency_ittikoch.py","face_analysis_openbr.py","vision_pipeline.py","composed_vision.py","detector_host.py","fusion.py"]
+
+
+# CPU time (sec.) of all perception processes by pid
+def GetProcessTimes():
+
+    ticks = float(os.sysconf("SC_CLK_TCK"))
+    result = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open("/proc/" + pid + "/cmdline") as cmdline:
+                args = cmdline.read().split("\0")
+            if not any([os.path.basename(arg) in SCRIPTS for arg in args]):
+                continue
+            with open("/proc/" + pid + "/stat") as stat:
+                fields = stat.read().rsplit(")",1)[1].split()
+            result[pid] = (" ".join([os.path.basename(arg) for arg in args if os.path.basename(arg) in SCRIPTS]),(float(fields[11]) + float(fields[12])) / ticks)
+        except IOError:
+            continue
+    return result
+
+
+class LatencyCollector(object):
+
+
+    def __init__(self):
+
+        self.reports = {}
+        self.subs = []
+        for camera in CAMERAS:
+            self.subs.append(rospy.Subscriber(NAMESPACE + camera + "/latency",LatencyReport,self.HandleReport,callback_args=camera))
+        self.subs.append(rospy.Subscriber(NAMESPACE + "latency",LatencyReport,self.HandleReport,callback_args=""))
+
+
+    def HandleReport(self,data,camera):
+
+        self.reports[(camera,data.node)] = data
+
+
+if __name__ == '__main__':
+
+    seconds = 30.0
+    if len(sys.argv) > 1:
+        seconds = float(sys.argv[1])
+
+    rospy.init_node("benchmark_composed",anonymous=True)
+    collector = LatencyCollector()
+
+    start_times = GetProcessTimes()
+    start = time.time()
+    rospy.sleep(seconds)
+    wall = time.time() - start
+    end_times = GetProcessTimes()
+
+    print "{:.1f} s".format(wall)
+    print "process                              pid     CPU (%)"
+    total = 0.0
+    for pid in sorted(end_times):
+        if pid in start_times:
+            name,cpu = end_times[pid]
+            cpu -= start_times[pid][1]
+            total += cpu
+            print "{:35}  {:6}  {:7.1f}".format(name,pid,100.0 * cpu / wall)
+    print "{:35}  {:6}  {:7.1f}".format("total","",100.0 * total / wall)
+
+    print
+    print "camera      node             stage          count   p50 (ms)   p95 (ms)   p99 (ms)"
+    for camera,node in sorted(collector.reports):
+        msg = collector.reports[(camera,node)]
+        for i in range(0,len(msg.stages)):
+            print "{:10}  {:15}  {:12}  {:7}  {:9.3f}  {:9.3f}  {:9.3f}".format(camera,node,msg.stages[i],msg.counts[i],1000.0 * msg.p50[i],1000.0 * msg.p95[i],1000.0 * msg.p99[i])
@@ -0,0 +1,116 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: time the vision pipeline lock is held for the debug window, against the number of candidate faces
+#     before: every camera frame is converted, unrotated, annotated with extrapolated candidates with the lock held (as HandleFrame did)
+#     after: at debug rate, only a snapshot of the predicted candidates is taken with the lock held, drawing happens outside
+#     reported per frame and per second of camera time, where the lock is what HandleFace and HandleTimer wait for
+
+# usage: benchmark_debug_vision.py [frames camera_rate debug_rate]
+
+import os
+import sys
+import time
+import random
+import numpy
+import rospy
+import cv2
+from cv_bridge import CvBridge
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from candidate_table import CandidateTable
+from face_predictor import FacePredictor,FACE_VALUES
+
+
+WIDTH = 640
+HEIGHT = 480
+HISTORY = 10
+CANDIDATES = [1,5,10,20,50]
+
+opencv_bridge = CvBridge()
+
+
+# the old HandleFrame, faces only and without showing the window
+def Before(data,cfaces,ts):
+
+    image = opencv_bridge.imgmsg_to_cv2(data,"bgr8")
+    width = image.shape[0]
+    height = image.shape[1]
+    image = cv2.transpose(image)
+    image = cv2.flip(image,1)
+    for cface_id in cfaces:
+        face = cfaces[cface_id].Extrapolate(ts)
+        x = int((0.5 + 0.5 * face.rect.origin.x) * float(width))
+        y = int((0.5 + 0.5 * face.rect.origin.y) * float(height))
+        cv2.circle(image,(x,y),10,(0,0,255),2)
+        cv2.putText(image,"male",(x - 20,y + 20),cv2.cv.CV_FONT_HERSHEY_PLAIN,1,(0,255,255))
+    return image
+
+
+# the snapshot of the new HandleFrame
+def After(table,cfaces,ts):
+
+    rows = [cface.row for cface in cfaces.values()]
+    values,regressed = table.Predict(rows,ts.to_sec(),True)
+    labels = ["male" for cface in cfaces.values()]
+    return values,labels
+
+
+def MakeFace(ts,x,y):
+
+    face = Face()
+    face.ts = ts
+    face.rect.origin.x = x + random.uniform(-0.01,0.01)
+    face.rect.origin.y = y + random.uniform(-0.01,0.01)
+    face.rect.size.x = 0.2
+    face.rect.size.y = 0.25
+    face.position.x = 1.5
+    face.confidence = 1.0
+    return face
+
+
+if __name__ == '__main__':
+
+    frames = 200
+    camera_rate = 30.0
+    debug_rate = 5.0
+    if len(sys.argv) > 3:
+        frames = int(sys.argv[1])
+        camera_rate = float(sys.argv[2])
+        debug_rate = float(sys.argv[3])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+    data = opencv_bridge.cv2_to_imgmsg(numpy.random.randint(0,256,(HEIGHT,WIDTH,3)).astype(numpy.uint8),"bgr8")
+
+    print "{} frames of {}x{} at {} Hz, debug window at {} Hz".format(frames,WIDTH,HEIGHT,camera_rate,debug_rate)
+    print "candidates  before (ms/frame)  before (ms/s)  after (ms/frame)  after (ms/s)"
+    for count in CANDIDATES:
+
+        # candidate faces with some history at 10 Hz
+        table = CandidateTable(FACE_VALUES)
+        cfaces = {}
+        for i in range(0,count):
+            cface = FacePredictor(table,10 * i)
+            x = random.uniform(-0.8,0.8)
+            y = random.uniform(-0.8,0.8)
+            for k in range(0,HISTORY):
+                cface.Append(MakeFace(start_ts + rospy.Duration.from_sec(0.1 * k),x,y))
+            cfaces[10 * i] = cface
+        ts = start_ts + rospy.Duration.from_sec(0.1 * HISTORY)
+
+        start = time.clock()
+        for k in range(0,frames):
+            Before(data,cfaces,ts)
+        before = (time.clock() - start) * 1000.0 / float(frames)
+
+        start = time.clock()
+        for k in range(0,frames):
+            After(table,cfaces,ts)
+        after = (time.clock() - start) * 1000.0 / float(frames)
+
+        print "{:10}  {:16.3f}  {:13.1f}  {:16.3f}  {:12.1f}".format(count,before,before * camera_rate,after,after * min(camera_rate,debug_rate))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: memory and CPU scaling of face detection from 1 to 4 cameras
+#     nodes: one process per camera, each with its own Haar cascade and OpenCV runtime (like separate detect_faces nodes)
+#     host: one process for all cameras, with a thread pool and one Haar cascade per worker (like detector_host)
+#     each camera runs Haar detection on synthetic frames at the face detection rate for a fixed time
+
+# usage: benchmark_detector_host.py [rate seconds workers work_width work_height]
+
+import os
+import sys
+import time
+import resource
+import numpy
+import cv2
+from multiprocessing import Process,Queue
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from detect_faces_haar import GetWorkerCascade
+
+
+CASCADE = os.path.join(os.path.dirname(os.path.abspath(__file__)),"haarcascade_frontalface_alt.xml")
+
+
+# resident memory of this process (kB)
+def ResidentMemory():
+
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+# CPU time of this process (sec.)
+def CPUTime():
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def Detect(image):
+
+    GetWorkerCascade(CASCADE).detectMultiScale(image,scaleFactor=1.1,minSize=(30,30),flags=cv2.cv.CV_HAAR_SCALE_IMAGE)
+
+
+# one separate detector process
+def Node(frames,rate,seconds,results):
+
+    cascade = cv2.CascadeClassifier(CASCADE)
+    start = time.time()
+    ticks = 0
+    while time.time() - start < seconds:
+        cascade.detectMultiScale(frames[ticks % len(frames)],scaleFactor=1.1,minSize=(30,30),flags=cv2.cv.CV_HAAR_SCALE_IMAGE)
+        ticks += 1
+        delay = start + float(ticks) / rate - time.time()
+        if delay > 0.0:
+            time.sleep(delay)
+    results.put((ResidentMemory(),CPUTime(),ticks))
+
+
+def RunNodes(cameras,frames,rate,seconds):
+
+    results = Queue()
+    processes = [Process(target=Node,args=(frames,rate,seconds,results)) for i in range(0,cameras)]
+    for process in processes:
+        process.start()
+    memory = 0
+    cpu = 0.0
+    ticks = 0
+    for process in processes:
+        m,c,t = results.get()
+        memory += m
+        cpu += c
+        ticks += t
+    for process in processes:
+        process.join()
+    return memory,cpu,ticks
+
+
+# the detector host, in its own process as well
+def Host(cameras,workers,frames,rate,seconds,results):
+
+    pool = ThreadPool(workers)
+    pending = [None] * cameras
+    start = time.time()
+    ticks = 0
+    tick = 0
+    while time.time() - start < seconds:
+        for camera in range(0,cameras):
+            if (pending[camera] is not None) and not pending[camera].ready():
+                continue
+            pending[camera] = pool.apply_async(Detect,(frames[tick % len(frames)],))
+            ticks += 1
+        tick += 1
+        delay = start + float(tick) / rate - time.time()
+        if delay > 0.0:
+            time.sleep(delay)
+    pool.close()
+    pool.join()
+    results.put((ResidentMemory(),CPUTime(),ticks))
+
+
+def RunHost(cameras,workers,frames,rate,seconds):
+
+    results = Queue()
+    process = Process(target=Host,args=(cameras,workers,frames,rate,seconds,results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+if __name__ == '__main__':
+
+    rate = 10.0
+    seconds = 10.0
+    workers = 2
+    work_width = 320
+    work_height = 240
+    if len(sys.argv) > 5:
+        rate = float(sys.argv[1])
+        seconds = float(sys.argv[2])
+        workers = int(sys.argv[3])
+        work_width = int(sys.argv[4])
+        work_height = int(sys.argv[5])
+
+    frames = [numpy.random.randint(0,256,(work_height,work_width,3)).astype(numpy.uint8) for i in range(0,4)]
+
+    print "face detection at {} Hz for {} s, {}x{}, host with {} workers".format(rate,seconds,work_width,work_height,workers)
+    print "cameras  nodes: memory (MB)  CPU (%)  detections  host: memory (MB)  CPU (%)  detections"
+    for cameras in range(1,5):
+        nodes = RunNodes(cameras,frames,rate,seconds)
+        host = RunHost(cameras,workers,frames,rate,seconds)
+        print "{:7}  {:18.1f}  {:7.1f}  {:10}  {:17.1f}  {:7.1f}  {:10}".format(cameras,nodes[0] / 1024.0,100.0 * nodes[1] / seconds,nodes[2],host[0] / 1024.0,100.0 * host[1] / seconds,host[2])
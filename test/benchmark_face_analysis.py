@@ -0,0 +1,73 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: time per face request to estimate age and gender, against the batch size
+#     before: every request is analyzed on its own, starting the estimator models for every face (as HandleFaceRequest did)
+#     after: the requests are analyzed in batches, starting the models once per batch
+#     both must find the same estimates
+#     with 'dummy', the stand-in estimator is measured, which only shows the overhead of batching
+
+# usage: benchmark_face_analysis.py [requests [openbr|dummy]]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from face_estimators import OpenBREstimator,DummyEstimator
+
+
+THUMB_SIZE = 64
+BATCH_SIZES = [1,2,4,8,16]
+
+
+if __name__ == '__main__':
+
+    requests = 32
+    estimator_name = "openbr"
+    if len(sys.argv) > 1:
+        requests = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        estimator_name = sys.argv[2]
+
+    random = numpy.random.RandomState(0)
+    thumbs = [random.randint(0,256,(THUMB_SIZE,THUMB_SIZE,3)).astype(numpy.uint8) for i in range(0,requests)]
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+
+        if estimator_name == "dummy":
+            estimator = DummyEstimator()
+        else:
+            estimator = OpenBREstimator(temp_dir,"png")
+
+        # one request at a time
+        start = time.time()
+        before_results = []
+        for thumb in thumbs:
+            before_results += estimator.Estimate([thumb])
+        before = (time.time() - start) * 1000.0 / float(requests)
+
+        print "{} requests of {}x{}, {} estimator".format(requests,THUMB_SIZE,THUMB_SIZE,estimator_name)
+        print "batch size  before (ms/request)  after (ms/request)  speedup  same estimates"
+        for batch_size in BATCH_SIZES:
+
+            start = time.time()
+            after_results = []
+            for i in range(0,requests,batch_size):
+                after_results += estimator.Estimate(thumbs[i:i + batch_size])
+            after = (time.time() - start) * 1000.0 / float(requests)
+
+            speedup = 0.0
+            if after > 0.0:
+                speedup = before / after
+            print "{:10}  {:19.2f}  {:18.2f}  {:6.1f}x  {}".format(batch_size,before,after,speedup,before_results == after_results)
+
+    finally:
+        shutil.rmtree(temp_dir)
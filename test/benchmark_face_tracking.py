@@ -0,0 +1,107 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: hit rate and CPU time of Haar face tracking against full image face detection on recorded footage
+#     full: every frame is searched completely, these faces count as the ground truth
+#     tracking: only the regions around the faces found in the previous frame are searched, and every
+#     <discovery_interval> frames the whole image (the previous faces stand in for the predictions of vision_pipeline)
+
+# usage: benchmark_face_tracking.py frames_dir [discovery_interval padding work_width work_height]
+
+import os
+import sys
+import time
+import cv2
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from detect_faces_haar import DetectFacesInRects
+
+
+SCALE_FACTOR = 1.1
+MIN_SIZE = (30,30)
+
+
+# intersection over union of two pixel rectangles
+def Overlap(a,b):
+
+    x0 = max(a[0],b[0])
+    y0 = max(a[1],b[1])
+    x1 = min(a[0] + a[2],b[0] + b[2])
+    y1 = min(a[1] + a[3],b[1] + b[3])
+    if (x1 <= x0) or (y1 <= y0):
+        return 0.0
+    intersection = float((x1 - x0) * (y1 - y0))
+    return intersection / float(a[2] * a[3] + b[2] * b[3] - intersection)
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2:
+        print "usage: benchmark_face_tracking.py frames_dir [discovery_interval padding work_width work_height]"
+        sys.exit(1)
+
+    frames_dir = sys.argv[1]
+    discovery_interval = 5
+    padding = 0.5
+    work_width = 320
+    work_height = 240
+    if len(sys.argv) > 2:
+        discovery_interval = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        padding = float(sys.argv[3])
+    if len(sys.argv) > 5:
+        work_width = int(sys.argv[4])
+        work_height = int(sys.argv[5])
+
+    cascade = cv2.CascadeClassifier(os.path.join(os.path.dirname(os.path.abspath(__file__)),"haarcascade_frontalface_alt.xml"))
+
+    # load all frames at work size
+    images = []
+    for filename in sorted(os.listdir(frames_dir)):
+        image = cv2.imread(os.path.join(frames_dir,filename))
+        if image is not None:
+            images.append(cv2.resize(image,(work_width,work_height),interpolation=cv2.INTER_LINEAR))
+    if len(images) == 0:
+        print "no frames found in {}".format(frames_dir)
+        sys.exit(1)
+
+    # full image detection
+    full_faces = []
+    start = time.clock()
+    for image in images:
+        full_faces.append(list(cascade.detectMultiScale(image,scaleFactor=SCALE_FACTOR,minSize=MIN_SIZE,flags=cv2.cv.CV_HAAR_SCALE_IMAGE)))
+    full_time = time.clock() - start
+
+    # tracking
+    track_faces = []
+    previous = []
+    start = time.clock()
+    for i in range(0,len(images)):
+        if i % discovery_interval == 0:
+            faces = list(cascade.detectMultiScale(images[i],scaleFactor=SCALE_FACTOR,minSize=MIN_SIZE,flags=cv2.cv.CV_HAAR_SCALE_IMAGE))
+        else:
+            faces = DetectFacesInRects(cascade,images[i],previous,padding,SCALE_FACTOR,MIN_SIZE)
+        track_faces.append(faces)
+        previous = faces
+    track_time = time.clock() - start
+
+    # hit rate against full image detection
+    total = 0
+    hits = 0
+    for i in range(0,len(images)):
+        for face in full_faces[i]:
+            total += 1
+            for found in track_faces[i]:
+                if Overlap(face,found) > 0.3:
+                    hits += 1
+                    break
+
+    n = float(len(images))
+    print "{} frames at {}x{}, discovery every {} frames, padding {}".format(len(images),work_width,work_height,discovery_interval,padding)
+    print "full:     {:.3f} ms CPU per frame, {} faces".format(full_time * 1000.0 / n,total)
+    print "tracking: {:.3f} ms CPU per frame, {} of {} faces found".format(track_time * 1000.0 / n,hits,total)
+    if total > 0:
+        print "hit rate: {:.1f}%".format(100.0 * float(hits) / float(total))
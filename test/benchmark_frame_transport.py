@@ -0,0 +1,100 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: bytes copied and latency per camera frame for the frame transports
+#     TCPROS: the full sensor_msgs/Image is serialized and deserialized for each detector
+#     shared memory: the frame is copied into the ring once, each detector gets a FrameSlot descriptor and maps the frame
+#     (socket copies in the kernel are not counted, so the TCPROS numbers are on the low side)
+
+# usage: benchmark_frame_transport.py [width height frames]
+
+import os
+import sys
+import time
+import numpy
+from StringIO import StringIO
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from sensor_msgs.msg import Image
+from r2_perception.msg import FrameSlot
+from frame_preprocessor import opencv_bridge
+from frame_ring import FrameRing
+
+
+DETECTORS = 3
+
+
+# send a message from one process to another, returns the received message and the number of bytes copied
+def Transfer(msg,msg_type):
+
+    buff = StringIO()
+    msg.serialize(buff)
+    data = buff.getvalue()
+    result = msg_type()
+    result.deserialize(data)
+    return result,2 * len(data)
+
+
+def TCPROS(frame,seq):
+
+    msg = opencv_bridge.cv2_to_imgmsg(frame,encoding="bgr8")
+    copied = 0
+    for i in range(0,DETECTORS):
+        received,n = Transfer(msg,Image)
+        image = opencv_bridge.imgmsg_to_cv2(received,"bgr8")
+        copied += n
+    return copied
+
+
+def SharedMemory(frame,seq,ring,reader):
+
+    slot,seq = ring.Write(frame,4)
+    copied = frame.nbytes
+    msg = FrameSlot()
+    msg.ring_id = ring.ring_id
+    msg.slot = slot
+    msg.seq = seq
+    msg.width = frame.shape[1]
+    msg.height = frame.shape[0]
+    for i in range(0,DETECTORS):
+        received,n = Transfer(msg,FrameSlot)
+        image = reader.View(received)
+        copied += n
+    return copied
+
+
+def Measure(function,args,frames,source):
+
+    copied = 0
+    start = time.time()
+    for i in range(0,frames):
+        copied += function(source[i % len(source)],i,*args)
+    latency = (time.time() - start) * 1000.0 / float(frames)
+    return copied / frames,latency
+
+
+if __name__ == '__main__':
+
+    width = 640
+    height = 480
+    frames = 500
+    if len(sys.argv) > 3:
+        width = int(sys.argv[1])
+        height = int(sys.argv[2])
+        frames = int(sys.argv[3])
+
+    source = [numpy.random.randint(0,256,(height,width,3)).astype(numpy.uint8) for i in range(0,8)]
+
+    ring = FrameRing("benchmark_frame_transport")
+    reader = FrameRing("benchmark_frame_transport")
+
+    tcpros_copied,tcpros_latency = Measure(TCPROS,(),frames,source)
+    shm_copied,shm_latency = Measure(SharedMemory,(ring,reader),frames,source)
+    ring.Remove()
+
+    print "frame {}x{}, {} detectors, {} frames".format(width,height,DETECTORS,frames)
+    print "TCPROS:        {} bytes copied, {:.3f} ms per frame".format(tcpros_copied,tcpros_latency)
+    print "shared memory: {} bytes copied, {:.3f} ms per frame".format(shm_copied,shm_latency)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: fusion of candidate faces from two cameras, offline on a LocalBus in virtual time
+#     both cameras see the same face (a little apart, within the fuse distance), so fusion groups them into one
+#     established face; the left eye also sees a second face that leaves halfway, which must be pruned after the keep time
+#     reports the established faces per tick (grouped and single), the CPU time per fusion tick, and the latency stages
+
+# usage: benchmark_fusion.py [seconds]
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+# the bus has to be installed before the nodes are imported
+import rospy
+from local_bus import LocalBus,Install,START_TIME
+
+bus = LocalBus()
+Install(bus)
+
+from std_msgs.msg import String
+from r2_perception.msg import CandidateFace,EstablishedFace,LatencyReport
+from fusion import Fusion
+
+
+NAMESPACE = "/robot/perception/"
+VISION_RATE = 20.0
+FUSION_RATE = 20.0
+FACE_FUSE_DISTANCE = 0.2
+FACE_KEEP_TIME = 1.0
+PIPELINE_LATENCY = 0.05
+
+
+class Camera(object):
+
+
+    def __init__(self,name,camera_id,faces,leave_time):
+
+        self.camera_id = camera_id
+        self.faces = faces # cface_id: position
+        self.leave_time = leave_time # time after which the last face is gone (sec.)
+        self.pub = rospy.Publisher(NAMESPACE + name + "/cface",CandidateFace,queue_size=5)
+        self.timer = rospy.Timer(rospy.Duration(1.0 / VISION_RATE),self.HandleTimer)
+
+
+    # send the candidate faces of one vision pipeline tick
+    def HandleTimer(self,event):
+
+        ts = event.current_expected
+        cface_ids = sorted(self.faces)
+        if (ts.to_sec() - START_TIME) > self.leave_time:
+            cface_ids = cface_ids[0:1]
+        for cface_id in cface_ids:
+            x,y,z = self.faces[cface_id]
+            msg = CandidateFace()
+            msg.camera_id = self.camera_id
+            msg.cface_id = cface_id
+            msg.ts = ts
+            msg.capture_ts = ts - rospy.Duration.from_sec(PIPELINE_LATENCY)
+            msg.position.x = x + random.uniform(-0.01,0.01)
+            msg.position.y = y + random.uniform(-0.01,0.01)
+            msg.position.z = z + random.uniform(-0.01,0.01)
+            msg.confidence = 1.0
+            msg.expressions = [String("neutral")]
+            self.pub.publish(msg)
+
+
+class Collector(object):
+
+
+    def __init__(self):
+
+        self.grouped = 0
+        self.single = 0
+        self.sub = rospy.Subscriber(NAMESPACE + "face",EstablishedFace,self.HandleFace)
+
+
+    # a grouped face has the expressions of both cameras
+    def HandleFace(self,data):
+
+        if len(data.expressions) > 1:
+            self.grouped += 1
+        else:
+            self.single += 1
+
+
+if __name__ == '__main__':
+
+    seconds = 10.0
+    if len(sys.argv) > 1:
+        seconds = float(sys.argv[1])
+
+    random.seed(0)
+    bus.LoadParams({"session_tag": "benchmark","store_thumbs_flag": False})
+    bus.LoadParams({"fusion_rate": FUSION_RATE,"face_fuse_distance": FACE_FUSE_DISTANCE,"face_keep_time": FACE_KEEP_TIME},NAMESPACE)
+
+    bus.SetNamespace(NAMESPACE,"fusion")
+    fusion = Fusion()
+    collector = Collector()
+    left = Camera("lefteye",1,{1: (1.5,0.0,0.1),2: (2.0,0.8,0.1)},seconds / 2.0)
+    right = Camera("righteye",2,{1: (1.55,0.02,0.1)},seconds)
+
+    start = time.time()
+    bus.RunUntil(START_TIME + seconds)
+    wall = time.time() - start
+    bus.Shutdown()
+
+    ticks = int(seconds * FUSION_RATE)
+    print "{} s, two cameras at {} Hz, fusion at {} Hz, second face leaves after {} s".format(seconds,VISION_RATE,FUSION_RATE,seconds / 2.0)
+    print "established faces: {} grouped, {} single, {:.2f} per tick".format(collector.grouped,collector.single,float(collector.grouped + collector.single) / float(ticks))
+    print "single faces expected: about {}".format(int((seconds / 2.0 + FACE_KEEP_TIME) * FUSION_RATE))
+    name = "Fusion.HandleTimer"
+    if name in bus.calls:
+        print "fusion tick: {:.3f} ms CPU".format(1000.0 * bus.cpu[name] / bus.calls[name])
+    print "{:.2f} s wall".format(wall)
+
+    print
+    print "stage          count   p50 (ms)   p95 (ms)   p99 (ms)   max (ms)"
+    msg = LatencyReport()
+    fusion.latency.FillReport(msg)
+    for i in range(0,len(msg.stages)):
+        print "{:12}  {:7}  {:9.3f}  {:9.3f}  {:9.3f}  {:9.3f}".format(msg.stages[i],msg.counts[i],1000.0 * msg.p50[i],1000.0 * msg.p95[i],1000.0 * msg.p99[i],1000.0 * msg.max[i])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: resident memory of the candidate face histories in a soak test with 20 people in view
+#     before: each candidate keeps every raw Face message, thumbnail included, for the whole keep time
+#     after: each candidate keeps the numeric fields in a row of a CandidateTable, and only the latest Face message
+#     each variant runs in its own process, which feeds raw faces at the face detection rate and prunes at the pipeline rate
+
+# usage: benchmark_history_memory.py [people seconds keep_time rate]
+
+import os
+import sys
+import numpy
+import rospy
+from multiprocessing import Process,Queue
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from face_predictor import FacePredictor
+from frame_preprocessor import opencv_bridge
+
+
+THUMB_SIZE = 64
+
+
+# the old history, a list of Face messages
+class Before(object):
+
+
+    def __init__(self):
+
+        self.faces = []
+
+
+    def PruneBefore(self,ts):
+
+        self.faces = [face for face in self.faces if face.ts.to_sec() >= ts.to_sec()]
+
+
+    def Append(self,face):
+
+        self.faces.append(face)
+
+
+# memory of this process (kB), current and peak
+def Memory():
+
+    current = 0
+    peak = 0
+    with open("/proc/self/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                current = int(line.split()[1])
+            if line.startswith("VmHWM:"):
+                peak = int(line.split()[1])
+    return current,peak
+
+
+def Soak(variant,people,seconds,keep_time,rate,results):
+
+    base,base_peak = Memory()
+
+    candidates = {}
+    for i in range(0,people):
+        if variant == "before":
+            candidates[i] = Before()
+        else:
+            candidates[i] = FacePredictor()
+
+    start_ts = rospy.Time(1500000000,0)
+    ticks = int(seconds * rate)
+    for tick in range(0,ticks):
+
+        ts = start_ts + rospy.Duration.from_sec(float(tick) / rate)
+
+        # one raw face per person, each with its own thumbnail
+        for i in range(0,people):
+            face = Face()
+            face.face_id = tick * people + i
+            face.ts = ts
+            face.position.x = 1.0 + 0.1 * i
+            face.confidence = 1.0
+            face.thumb = opencv_bridge.cv2_to_imgmsg(numpy.random.randint(0,256,(THUMB_SIZE,THUMB_SIZE,3)).astype(numpy.uint8),encoding="8UC3")
+            candidates[i].Append(face)
+
+        # prune like the vision pipeline (which runs at least as fast as face detection)
+        prune_ts = ts - rospy.Duration.from_sec(keep_time)
+        for i in range(0,people):
+            candidates[i].PruneBefore(prune_ts)
+
+    current,peak = Memory()
+    results.put((current - base,peak - base))
+
+
+def Run(variant,people,seconds,keep_time,rate):
+
+    results = Queue()
+    process = Process(target=Soak,args=(variant,people,seconds,keep_time,rate,results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+if __name__ == '__main__':
+
+    people = 20
+    seconds = 300.0
+    keep_time = 1.0
+    rate = 10.0
+    if len(sys.argv) > 4:
+        people = int(sys.argv[1])
+        seconds = float(sys.argv[2])
+        keep_time = float(sys.argv[3])
+        rate = float(sys.argv[4])
+
+    print "{} people, {} s at {} Hz, keep time {} s".format(people,seconds,rate,keep_time)
+    print "variant  resident growth (MB)  peak growth (MB)"
+    for variant in ["before","after"]:
+        current,peak = Run(variant,people,seconds,keep_time,rate)
+        print "{:7}  {:20.2f}  {:16.2f}".format(variant,current / 1024.0,peak / 1024.0)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: accuracy and CPU time of the regression and Kalman filter predictors on synthetic face trajectories
+#     each candidate is observed with noise at the face detection rate, pruned to the keep time, and predicted halfway to
+#     the next observation (as the vision ticks do)
+#     the error is the RMS distance between the predicted and the true position
+#     regression: CandidateTable, linear regression over the observations within the keep time
+#     kalman: KalmanTable, constant-velocity Kalman filter
+
+# usage: benchmark_kalman.py [candidates seconds keep_time noise]
+
+import os
+import sys
+import time
+import math
+import random
+import numpy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from face_predictor import FACE_VALUES,FACE_POSITION
+from candidate_table import CandidateTable
+from kalman_table import KalmanTable
+
+
+DETECT_RATE = 10.0
+PROCESS_NOISE = 1.0
+TRAJECTORIES = ["standing","walking","turning","swaying"]
+
+
+# true position of a candidate at a time
+def Position(trajectory,phase,t):
+
+    if trajectory == "standing":
+        return (2.0,0.5 * phase,0.0)
+    if trajectory == "walking":
+        return (2.0,-2.0 + 0.8 * ((t + phase) % 5.0),0.0)
+    if trajectory == "turning":
+        angle = 0.5 * (t + phase)
+        return (2.0 + math.cos(angle),math.sin(angle),0.0)
+    return (2.0,0.3 * math.sin(2.0 * (t + phase)),0.05 * math.sin(5.0 * (t + phase)))
+
+
+def Run(table,trajectory,phases,seconds,keep_time,noise,regress):
+
+    rows = [table.Allocate(i) for i in range(0,len(phases))]
+    steps = int(seconds * DETECT_RATE)
+    total = 0.0
+    count = 0
+    cpu = 0.0
+    random.seed(1)
+
+    for k in range(0,steps):
+
+        t = float(k) / DETECT_RATE
+        observations = []
+        for i in range(0,len(phases)):
+            x,y,z = Position(trajectory,phases[i],t)
+            values = [0.0] * FACE_VALUES
+            values[FACE_POSITION:FACE_POSITION + 3] = [x + random.gauss(0.0,noise),y + random.gauss(0.0,noise),z + random.gauss(0.0,noise)]
+            observations.append(values)
+
+        start = time.clock()
+        for i in range(0,len(phases)):
+            table.Append(rows[i],t,observations[i])
+        table.Expire(t - keep_time)
+        predict_t = t + 0.5 / DETECT_RATE
+        values,regressed = table.Predict(rows,predict_t,regress)
+        cpu += time.clock() - start
+
+        # skip the warmup
+        if t < keep_time:
+            continue
+        for i in range(0,len(phases)):
+            x,y,z = Position(trajectory,phases[i],predict_t)
+            d = values[i,FACE_POSITION:FACE_POSITION + 3] - numpy.array([x,y,z])
+            total += numpy.dot(d,d)
+            count += 1
+
+    return math.sqrt(total / float(count)),1000000.0 * cpu / float(steps * len(phases))
+
+
+if __name__ == '__main__':
+
+    candidates = 20
+    seconds = 30.0
+    keep_time = 1.0
+    noise = 0.03
+    if len(sys.argv) > 4:
+        candidates = int(sys.argv[1])
+        seconds = float(sys.argv[2])
+        keep_time = float(sys.argv[3])
+        noise = float(sys.argv[4])
+
+    random.seed(0)
+    phases = [random.uniform(0.0,10.0) for i in range(0,candidates)]
+
+    print "{} candidates, {} s at {} Hz, keep time {} s, noise {} m".format(candidates,seconds,DETECT_RATE,keep_time,noise)
+    print "trajectory  latest (m RMS)  regression (m RMS)  kalman (m RMS)  regression (us/obs)  kalman (us/obs)"
+    for trajectory in TRAJECTORIES:
+
+        latest_error,latest_cpu = Run(CandidateTable(FACE_VALUES),trajectory,phases,seconds,keep_time,noise,False)
+        regression_error,regression_cpu = Run(CandidateTable(FACE_VALUES),trajectory,phases,seconds,keep_time,noise,True)
+        table = KalmanTable(FACE_VALUES)
+        table.SetNoise(PROCESS_NOISE,noise * noise)
+        kalman_error,kalman_cpu = Run(table,trajectory,phases,seconds,keep_time,noise,True)
+
+        print "{:10}  {:14.4f}  {:18.4f}  {:14.4f}  {:19.2f}  {:15.2f}".format(trajectory,latest_error,regression_error,kalman_error,regression_cpu,kalman_cpu)
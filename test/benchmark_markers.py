@@ -0,0 +1,145 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: RViz marker traffic and CPU time of one vision pipeline, against the number of candidate faces
+#     before: two Marker messages per candidate per vision tick, each rebuilt field by field (as SendFaceMarkers did)
+#     after: one MarkerArray per visualization tick, with reused markers that are only sent when they moved or would expire
+#     the candidates are people standing in view, moving a few millimeters between ticks, and sometimes walking
+
+# usage: benchmark_markers.py [seconds pipeline_rate visualize_rate]
+
+import os
+import sys
+import time
+import random
+import rospy
+from StringIO import StringIO
+from visualization_msgs.msg import Marker
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from marker_batch import MarkerBatch,MakeTemplate
+
+
+CAMERA = "lefteye"
+NS = "/robot/perception/lefteye"
+CHANGE_DISTANCE = 0.01
+CANDIDATES = [1,5,10,20,50]
+
+
+# counts the messages and bytes that would go out
+class CountingPublisher(object):
+
+
+    def __init__(self):
+
+        self.messages = 0
+        self.bytes = 0
+
+
+    def publish(self,msg):
+
+        buffer = StringIO()
+        msg.serialize(buffer)
+        self.messages += 1
+        self.bytes += len(buffer.getvalue())
+
+
+# the old face markers
+def Before(pub,ts,cface_id,position):
+
+    for k in range(0,2):
+        marker = Marker()
+        marker.header.frame_id = CAMERA
+        marker.header.stamp = ts
+        marker.id = cface_id + k
+        marker.ns = NS
+        marker.action = Marker.MODIFY
+        marker.pose.position.x = position[0]
+        marker.pose.position.y = position[1]
+        marker.pose.position.z = position[2] - 0.1 * k
+        marker.pose.orientation.x = 0.0
+        marker.pose.orientation.y = 0.0
+        marker.pose.orientation.z = 0.0
+        marker.pose.orientation.w = 1.0
+        if k == 0:
+            marker.type = Marker.SPHERE
+            marker.scale.x = 0.1
+            marker.scale.y = 0.1
+            marker.scale.z = 0.1
+            marker.color.r = 1.0
+            marker.color.g = 0.0
+            marker.color.b = 0.0
+        else:
+            marker.type = Marker.TEXT_VIEW_FACING
+            marker.scale.x = 0.05
+            marker.scale.y = 0.05
+            marker.scale.z = 0.05
+            marker.color.r = 0.7
+            marker.color.g = 0.7
+            marker.color.b = 0.7
+            marker.text = CAMERA + " candidate {} ({} {})".format(cface_id,"male",30)
+        marker.color.a = 0.5
+        marker.lifetime = rospy.Duration(2,0)
+        marker.frame_locked = False
+        pub.publish(marker)
+
+
+if __name__ == '__main__':
+
+    seconds = 20.0
+    pipeline_rate = 20.0
+    visualize_rate = 10.0
+    if len(sys.argv) > 3:
+        seconds = float(sys.argv[1])
+        pipeline_rate = float(sys.argv[2])
+        visualize_rate = float(sys.argv[3])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+    ticks = int(seconds * pipeline_rate)
+
+    face_template = MakeTemplate(CAMERA,NS,Marker.SPHERE,(0.1,0.1,0.1),(1.0,0.0,0.0,0.5),2.0)
+    label_template = MakeTemplate(CAMERA,NS,Marker.TEXT_VIEW_FACING,(0.05,0.05,0.05),(0.7,0.7,0.7,0.5),2.0)
+
+    print "{} s, pipeline at {} Hz, visualization at {} Hz".format(seconds,pipeline_rate,visualize_rate)
+    print "candidates  before (msg/s)  before (kB/s)  before (ms/s)  after (msg/s)  after (kB/s)  after (ms/s)"
+    for count in CANDIDATES:
+
+        positions = [[random.uniform(0.5,4.0),random.uniform(-2.0,2.0),random.uniform(-0.3,0.3)] for i in range(0,count)]
+        before_pub = CountingPublisher()
+        after_pub = CountingPublisher()
+        batch = MarkerBatch(after_pub)
+        last_visualize_ts = rospy.Time(0)
+        before = 0.0
+        after = 0.0
+
+        for k in range(0,ticks):
+
+            ts = start_ts + rospy.Duration.from_sec(float(k) / pipeline_rate)
+
+            # jitter, and every now and then someone walks
+            for position in positions:
+                position[0] += random.gauss(0.0,0.002)
+                position[1] += random.gauss(0.0,0.002)
+                if random.random() < 0.01:
+                    position[1] += 0.05
+
+            start = time.clock()
+            for i in range(0,count):
+                Before(before_pub,ts,10 * i,positions[i])
+            before += time.clock() - start
+
+            start = time.clock()
+            if (ts - last_visualize_ts).to_sec() >= 1.0 / visualize_rate:
+                last_visualize_ts = ts
+                for i in range(0,count):
+                    x,y,z = positions[i]
+                    batch.Update(face_template,10 * i,ts,(x,y,z),None,CHANGE_DISTANCE)
+                    batch.Update(label_template,10 * i + 1,ts,(x,y,z - 0.1),CAMERA + " candidate {} ({} {})".format(10 * i,"male",30),CHANGE_DISTANCE)
+                batch.Publish(ts)
+            after += time.clock() - start
+
+        print "{:10}  {:14.1f}  {:13.1f}  {:13.2f}  {:13.1f}  {:12.1f}  {:12.2f}".format(count,before_pub.messages / seconds,before_pub.bytes / seconds / 1000.0,1000.0 * before / seconds,after_pub.messages / seconds,after_pub.bytes / seconds / 1000.0,1000.0 * after / seconds)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time per FacePredictor.Extrapolate call against history length
+#     before: the regression sums are recomputed over the whole history on every call (as Extrapolate did)
+#     after: the sums are kept up to date on Append and PruneBefore, and Extrapolate only evaluates them
+#     both must extrapolate the same faces
+
+# usage: benchmark_predictors.py [calls]
+
+import os
+import sys
+import time
+import random
+import rospy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from face_predictor import FacePredictor,FaceValues
+
+
+HISTORIES = [2,10,50,200,1000]
+
+
+# the old Extrapolate, for the face values only
+def Before(faces,ts):
+
+    n = len(faces)
+    sumf = [0.0] * 10
+    sumt = 0.0
+    sumtt = 0.0
+    sumft = [0.0] * 10
+    for face in faces:
+        t = (ts - face.ts).to_sec()
+        values = FaceValues(face)
+        for k in range(0,10):
+            sumf[k] += values[k]
+            sumft[k] += values[k] * t
+        sumt += t
+        sumtt += t * t
+    den = float(n) * sumtt - sumt * sumt
+    if den == 0.0:
+        return FaceValues(faces[0])
+    result = []
+    for k in range(0,10):
+        slope = (n * sumft[k] - sumt * sumf[k]) / den
+        result.append((sumf[k] - slope * sumt) / float(n))
+    return result
+
+
+def After(cface,ts):
+
+    return FaceValues(cface.Extrapolate(ts))
+
+
+def MakeFace(ts,k):
+
+    face = Face()
+    face.ts = ts
+    face.rect.origin.x = 0.1 + 0.001 * k + random.uniform(-0.01,0.01)
+    face.rect.origin.y = -0.2 + random.uniform(-0.01,0.01)
+    face.rect.size.x = 0.2
+    face.rect.size.y = 0.25
+    face.position.x = 1.5 + random.uniform(-0.05,0.05)
+    face.position.y = 0.002 * k
+    face.position.z = 0.1
+    face.confidence = 1.0
+    return face
+
+
+if __name__ == '__main__':
+
+    calls = 1000
+    if len(sys.argv) > 1:
+        calls = int(sys.argv[1])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+
+    print "{} calls per history length".format(calls)
+    print "history  before (us/call)  after (us/call)  max difference"
+    for history in HISTORIES:
+
+        # build a candidate face at 10 Hz, and prune part of it like the vision pipeline does
+        cface = FacePredictor()
+        faces = []
+        for k in range(0,history + history / 2):
+            face = MakeFace(start_ts + rospy.Duration.from_sec(0.1 * k),k)
+            cface.Append(face)
+            faces.append(face)
+        prune_ts = start_ts + rospy.Duration.from_sec(0.1 * (history / 2))
+        cface.PruneBefore(prune_ts)
+        faces = [face for face in faces if face.ts.to_sec() >= prune_ts.to_sec()]
+        ts = cface.Latest().ts + rospy.Duration.from_sec(0.05)
+
+        start = time.clock()
+        for i in range(0,calls):
+            before_values = Before(faces,ts)
+        before = (time.clock() - start) * 1000000.0 / float(calls)
+
+        start = time.clock()
+        for i in range(0,calls):
+            after_values = After(cface,ts)
+        after = (time.clock() - start) * 1000000.0 / float(calls)
+
+        difference = max([abs(a - b) for a,b in zip(before_values,after_values)])
+        print "{:7}  {:16.2f}  {:15.2f}  {:14.3g}".format(cface.Count(),before,after,difference)
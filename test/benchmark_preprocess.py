@@ -0,0 +1,82 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time per camera frame spent on converting, rescaling and unrotating
+#     before: face, hand and saliency detection each convert, rescale and unrotate the full camera frame
+#     after: preprocess_frames does this once and each detector only converts the shared work image
+
+# usage: benchmark_preprocess.py [width height rotate frames]
+
+import os
+import sys
+import time
+import numpy
+import cv2
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from frame_preprocessor import FramePreprocessor,UnrotateImage,opencv_bridge
+
+
+DETECTORS = 3
+
+
+# the old per-detector path, as it was in each HandleTimer
+def Before(msg,work_width,work_height,rotate):
+
+    for i in range(0,DETECTORS):
+        image = cv2.resize(opencv_bridge.imgmsg_to_cv2(msg,"bgr8"),(work_width,work_height),interpolation=cv2.INTER_LINEAR)
+        image = UnrotateImage(image,rotate)
+
+
+# the shared path: preprocess_frames, then each detector receives the work image
+def After(preprocessor,msg,work_width,work_height):
+
+    preprocessor.SetFrame(msg)
+    work_msg = None
+    for i in range(0,DETECTORS):
+        # all detectors use the same work size, so this is rescaled and unrotated only once
+        image = preprocessor.GetWorkImage(work_width,work_height)
+        work_msg = opencv_bridge.cv2_to_imgmsg(image,encoding="bgr8")
+    for i in range(0,DETECTORS):
+        image = opencv_bridge.imgmsg_to_cv2(work_msg,"bgr8")
+
+
+def Measure(function,args,frames):
+
+    start = time.clock()
+    for i in range(0,frames):
+        function(*args)
+    return (time.clock() - start) * 1000.0 / float(frames)
+
+
+if __name__ == '__main__':
+
+    width = 640
+    height = 480
+    rotate = -90
+    frames = 500
+    if len(sys.argv) > 4:
+        width = int(sys.argv[1])
+        height = int(sys.argv[2])
+        rotate = int(sys.argv[3])
+        frames = int(sys.argv[4])
+
+    # work size as configured for the eye cameras in perception.yaml
+    work_width = 240
+    work_height = 320
+
+    frame = numpy.random.randint(0,256,(height,width,3)).astype(numpy.uint8)
+    msg = opencv_bridge.cv2_to_imgmsg(frame,encoding="bgr8")
+    preprocessor = FramePreprocessor(rotate)
+
+    before = Measure(Before,(msg,work_width,work_height,rotate),frames)
+    after = Measure(After,(preprocessor,msg,work_width,work_height),frames)
+
+    print "frame {}x{}, rotate {}, {} detectors, {} frames".format(width,height,rotate,DETECTORS,frames)
+    print "before: {:.3f} ms CPU per frame".format(before)
+    print "after:  {:.3f} ms CPU per frame".format(after)
+    if after > 0.0:
+        print "speedup: {:.2f}x".format(before / after)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time to prune the candidate faces once per vision tick, against the number of candidates
+#     list: every candidate rebuilds its list of Face messages, and a second pass finds the empty ones (as HandleTimer did)
+#     sweep: every row of the CandidateTable is pruned with a binary search on its times
+#     heap: the expiry heap of the CandidateTable says which rows have expired faces, and only those are pruned
+#     each candidate is detected at 10 Hz, the vision ticks run at 30 Hz, so most ticks have nothing to prune for most candidates
+#     all must keep the same faces
+
+# usage: benchmark_prune.py [ticks keep_time]
+
+import os
+import sys
+import time
+import random
+import rospy
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Face
+from face_predictor import FACE_VALUES,FaceValues
+from candidate_table import CandidateTable
+
+
+TICK_RATE = 30.0
+DETECT_PERIOD = 3
+CANDIDATES = [10,50,100,200,500]
+
+
+# the old history, a list of Face messages
+class Before(object):
+
+
+    def __init__(self):
+
+        self.faces = []
+
+
+    def PruneBefore(self,ts):
+
+        self.faces = [face for face in self.faces if face.ts.to_sec() >= ts.to_sec()]
+
+
+    def Append(self,face):
+
+        self.faces.append(face)
+
+
+def List(cfaces,prune_before_time):
+
+    to_be_removed = []
+    for cface_id in cfaces:
+        cfaces[cface_id].PruneBefore(prune_before_time)
+        if len(cfaces[cface_id].faces) == 0:
+            to_be_removed.append(cface_id)
+    for key in to_be_removed:
+        del cfaces[key]
+
+
+def Sweep(table,rows,prune_before_time):
+
+    table.PruneBefore(rows,prune_before_time.to_sec())
+
+
+def Heap(table,prune_before_time):
+
+    table.Expire(prune_before_time.to_sec())
+
+
+if __name__ == '__main__':
+
+    ticks = 300
+    keep_time = 1.0
+    if len(sys.argv) > 2:
+        ticks = int(sys.argv[1])
+        keep_time = float(sys.argv[2])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+
+    print "{} ticks at {} Hz, keep time {} s".format(ticks,TICK_RATE,keep_time)
+    print "candidates  list (us/tick)  sweep (us/tick)  heap (us/tick)  same faces"
+    for count in CANDIDATES:
+
+        # the same candidates, detected at different phases
+        lists = {}
+        sweep_table = CandidateTable(FACE_VALUES)
+        heap_table = CandidateTable(FACE_VALUES)
+        sweep_rows = []
+        heap_rows = []
+        phases = []
+        for i in range(0,count):
+            lists[i] = Before()
+            sweep_rows.append(sweep_table.Allocate(i))
+            heap_rows.append(heap_table.Allocate(i))
+            phases.append(random.randrange(0,DETECT_PERIOD))
+
+        times = [0.0,0.0,0.0]
+        for k in range(0,ticks):
+
+            ts = start_ts + rospy.Duration.from_sec(float(k) / TICK_RATE)
+            for i in range(0,count):
+                if k % DETECT_PERIOD == phases[i]:
+                    face = Face()
+                    face.ts = ts
+                    face.position.x = 1.0 + 0.1 * i
+                    face.confidence = 1.0
+                    lists[i].Append(face)
+                    sweep_table.Append(sweep_rows[i],ts.to_sec(),FaceValues(face))
+                    heap_table.Append(heap_rows[i],ts.to_sec(),FaceValues(face))
+
+            prune_before_time = ts - rospy.Duration.from_sec(keep_time)
+
+            start = time.clock()
+            List(lists,prune_before_time)
+            times[0] += time.clock() - start
+
+            start = time.clock()
+            Sweep(sweep_table,sweep_rows,prune_before_time)
+            times[1] += time.clock() - start
+
+            start = time.clock()
+            Heap(heap_table,prune_before_time)
+            times[2] += time.clock() - start
+
+        same = True
+        for i in range(0,count):
+            n = len(lists[i].faces)
+            if (sweep_table.Count(sweep_rows[i]) != n) or (heap_table.Count(heap_rows[i]) != n):
+                same = False
+
+        times = [1000000.0 * t / float(ticks) for t in times]
+        print "{:10}  {:14.1f}  {:15.1f}  {:14.1f}  {}".format(count,times[0],times[1],times[2],same)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: Itti & Koch brightest point search
+#     compares FindBrightestPoints against the original per-pixel loop on random feature maps
+#     first checks that both find exactly the same points (including flat maps and ties), then times them
+
+# usage: benchmark_saliency_peaks.py [width height num_points iterations]
+
+import os
+import sys
+import time
+import numpy
+import cv2
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from r2_perception.msg import Float32XYZ
+from detect_saliency_ittikoch import FindBrightestPoints
+
+
+# the original brightest point search from DetectSaliencyIttiKoch.HandleTimer
+def FindBrightestPointsLoop(reduced,num_points,eraser_radius):
+
+    rheight = reduced.shape[0]
+    rwidth = reduced.shape[1]
+    scratch = reduced.copy()
+    points = []
+    for i in range(0,num_points):
+        point = Float32XYZ()
+        for y in range(0,rheight):
+            for x in range(0,rwidth):
+                if scratch[y,x] > point.z:
+                    point.x = float(x) / float(rwidth)
+                    point.y = float(y) / float(rheight)
+                    point.z = scratch[y,x]
+        points.append(point)
+        cv2.circle(scratch,(int(point.x * float(rwidth)),int(point.y * float(rheight))),eraser_radius,0,-1)
+    return points
+
+
+def Check(reduced,num_points,eraser_radius):
+
+    expected = FindBrightestPointsLoop(reduced,num_points,eraser_radius)
+    found = FindBrightestPoints(reduced,num_points,eraser_radius)
+    for a,b in zip(expected,found):
+        if (a.x != b.x) or (a.y != b.y) or (a.z != b.z):
+            print "MISMATCH: loop ({},{},{}) vs vectorized ({},{},{})".format(a.x,a.y,a.z,b.x,b.y,b.z)
+            return False
+    return len(expected) == len(found)
+
+
+def Measure(function,maps,num_points,eraser_radius):
+
+    start = time.clock()
+    for reduced in maps:
+        function(reduced,num_points,eraser_radius)
+    return (time.clock() - start) * 1000.0 / float(len(maps))
+
+
+if __name__ == '__main__':
+
+    width = 80
+    height = 60
+    num_points = 5
+    iterations = 50
+    if len(sys.argv) > 4:
+        width = int(sys.argv[1])
+        height = int(sys.argv[2])
+        num_points = int(sys.argv[3])
+        iterations = int(sys.argv[4])
+
+    eraser_radius = 10
+
+    # equivalence on random, blurred (smooth peaks), quantized (many ties) and empty maps
+    maps = []
+    for i in range(0,iterations):
+        maps.append(numpy.random.rand(height,width).astype(numpy.float32))
+    for i in range(0,iterations):
+        maps.append(cv2.GaussianBlur(numpy.random.rand(height,width).astype(numpy.float32),(13,13),0))
+    for i in range(0,iterations):
+        maps.append((numpy.random.randint(0,4,(height,width)) * 0.25).astype(numpy.float32))
+    maps.append(numpy.zeros((height,width),numpy.float32))
+    for reduced in maps:
+        for n in (1,num_points,num_points * 4):
+            if not Check(reduced,n,eraser_radius):
+                sys.exit(1)
+    print "equivalence: {} maps OK".format(len(maps))
+
+    # timing
+    for n in (num_points,num_points * 4):
+        loop = Measure(FindBrightestPointsLoop,maps[:iterations],n,eraser_radius)
+        vectorized = Measure(FindBrightestPoints,maps[:iterations],n,eraser_radius)
+        print "{}x{}, {} points: loop {:.3f} ms, vectorized {:.3f} ms, speedup {:.1f}x".format(width,height,n,loop,vectorized,loop / vectorized)
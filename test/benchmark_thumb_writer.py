@@ -0,0 +1,84 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: time the vision pipeline holds its lock to store one face thumbnail
+#     before: check and create the directory, convert and write the PNG for every thumbnail (as HandleThumb did)
+#     after: queue the thumbnail for the ThumbWriter, which converts and writes it on worker threads
+#     also reports the write latency and the number of dropped thumbnails of the writer
+
+# usage: benchmark_thumb_writer.py [thumbs workers queue_size rate]
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy
+import cv2
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+from thumb_writer import ThumbWriter,opencv_bridge
+from r2_perception.msg import PipelineStats
+
+
+THUMB_SIZE = 64
+CFACES = 10
+
+
+def Before(directory,filename,thumb):
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    image = opencv_bridge.imgmsg_to_cv2(thumb)
+    cv2.imwrite(os.path.join(directory,filename),image)
+
+
+if __name__ == '__main__':
+
+    count = 1000
+    workers = 1
+    queue_size = 50
+    rate = 200.0
+    if len(sys.argv) > 4:
+        count = int(sys.argv[1])
+        workers = int(sys.argv[2])
+        queue_size = int(sys.argv[3])
+        rate = float(sys.argv[4])
+
+    thumbs = []
+    for i in range(0,count):
+        thumbs.append(opencv_bridge.cv2_to_imgmsg(numpy.random.randint(0,256,(THUMB_SIZE,THUMB_SIZE,3)).astype(numpy.uint8),encoding="8UC3"))
+
+    base = tempfile.mkdtemp()
+    try:
+
+        # synchronous
+        start = time.time()
+        for i in range(0,count):
+            Before(os.path.join(base,"before","cface_%08X" % (i % CFACES)),"face_%08X.png" % i,thumbs[i])
+        before = (time.time() - start) * 1000000.0 / float(count)
+
+        # asynchronous, thumbnails arriving at a fixed rate
+        writer = ThumbWriter(workers,queue_size,False)
+        held = 0.0
+        for i in range(0,count):
+            start = time.time()
+            writer.Write(os.path.join(base,"after","cface_%08X" % (i % CFACES)),"face_%08X.png" % i,thumbs[i])
+            held += time.time() - start
+            time.sleep(1.0 / rate)
+        writer.queue.join()
+        after = held * 1000000.0 / float(count)
+
+        msg = PipelineStats()
+        writer.FillStats(msg)
+
+        print "{} thumbnails of {}x{}, {} workers, queue size {}, {} thumbnails/s".format(count,THUMB_SIZE,THUMB_SIZE,workers,queue_size,rate)
+        print "before: {:.1f} us with the lock held per thumbnail".format(before)
+        print "after:  {:.1f} us with the lock held per thumbnail".format(after)
+        print "written {}, dropped {}, failed {}, write latency mean {:.2f} ms, max {:.2f} ms".format(msg.thumbs_written,msg.thumbs_dropped,msg.thumbs_failed,1000.0 * msg.thumb_write_mean,1000.0 * msg.thumb_write_max)
+
+    finally:
+        shutil.rmtree(base)
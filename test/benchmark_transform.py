@@ -0,0 +1,106 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# BENCHMARK: CPU time per vision tick to transform the confident candidates to world coordinates, against their number
+#     before: canTransform and transformPoint on a new PointStamped for every candidate (as HandleTimer did)
+#     after: one lookupTransform per tick, and one matrix multiply for all candidates
+#     both must find the same world positions
+
+# usage: benchmark_transform.py [ticks]
+
+import os
+import sys
+import time
+import random
+import numpy
+import rospy
+import tf
+from geometry_msgs.msg import PointStamped,TransformStamped
+from tf.transformations import translation_matrix,quaternion_matrix,quaternion_from_euler
+
+
+CAMERA = "lefteye"
+CANDIDATES = [1,10,50,100,200,500]
+
+
+def Before(listener,ts,points):
+
+    result = []
+    for point in points:
+        if listener.canTransform("world",CAMERA,ts):
+            ps = PointStamped()
+            ps.header.seq = 0
+            ps.header.stamp = ts
+            ps.header.frame_id = CAMERA
+            ps.point.x = point[0]
+            ps.point.y = point[1]
+            ps.point.z = point[2]
+            pst = listener.transformPoint("world",ps)
+            result.append((pst.point.x,pst.point.y,pst.point.z))
+    return numpy.array(result)
+
+
+def After(listener,ts,points):
+
+    if not listener.canTransform("world",CAMERA,ts):
+        return numpy.zeros((0,3))
+    translation,rotation = listener.lookupTransform("world",CAMERA,ts)
+    matrix = numpy.dot(translation_matrix(translation),quaternion_matrix(rotation))
+    return numpy.dot(points,matrix[0:3,0:3].T) + matrix[0:3,3]
+
+
+if __name__ == '__main__':
+
+    ticks = 100
+    if len(sys.argv) > 1:
+        ticks = int(sys.argv[1])
+
+    random.seed(0)
+    start_ts = rospy.Time(1500000000,0)
+
+    # a camera in the robot's head, turning slowly
+    listener = tf.TransformerROS(True,rospy.Duration(10.0))
+    for k in range(0,ticks + 1):
+        transform = TransformStamped()
+        transform.header.stamp = start_ts + rospy.Duration.from_sec(0.05 * k)
+        transform.header.frame_id = "world"
+        transform.child_frame_id = CAMERA
+        transform.transform.translation.x = 0.1
+        transform.transform.translation.y = 0.03
+        transform.transform.translation.z = 1.6
+        q = quaternion_from_euler(0.0,0.1,0.01 * k)
+        transform.transform.rotation.x,transform.transform.rotation.y,transform.transform.rotation.z,transform.transform.rotation.w = q
+        listener.setTransform(transform)
+
+    print "{} ticks".format(ticks)
+    print "candidates  before (ms/tick)  after (ms/tick)  speedup  max difference"
+    for count in CANDIDATES:
+
+        points = numpy.array([(random.uniform(0.5,8.0),random.uniform(-4.0,4.0),random.uniform(-0.5,0.5)) for i in range(0,count)])
+
+        before = 0.0
+        after = 0.0
+        difference = 0.0
+        for k in range(0,ticks):
+
+            # halfway between two transforms, so TF interpolates
+            ts = start_ts + rospy.Duration.from_sec(0.05 * k + 0.025)
+
+            start = time.clock()
+            before_positions = Before(listener,ts,points)
+            before += time.clock() - start
+
+            start = time.clock()
+            after_positions = After(listener,ts,points)
+            after += time.clock() - start
+
+            difference = max(difference,numpy.max(numpy.abs(before_positions - after_positions)))
+
+        before *= 1000.0 / float(ticks)
+        after *= 1000.0 / float(ticks)
+        speedup = 0.0
+        if after > 0.0:
+            speedup = before / after
+        print "{:10}  {:15.3f}  {:15.3f}  {:6.1f}x  {:14.3g}".format(count,before,after,speedup,difference)
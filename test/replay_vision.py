@@ -0,0 +1,184 @@
+#!/usr/bin/env python2.7
+
+# R2 Perception - Hanson Robotics Unified Perception System, v1.0
+# by Desmond Germans
+
+# REPLAY: run camera frames through the vision chain of one camera offline, without a ROS master
+#     DetectFacesHaar, DetectSaliencyIttiKoch, VisionPipeline and Fusion run on a LocalBus, in virtual time, with the
+#     parameters of test/perception.yaml and a fixed camera-to-world transform
+#     the frames are the images in a directory (in name order, repeated as needed), or a synthetic sequence of moving
+#     bright blobs on a noisy background
+#     reports frames per second (and how much faster than real time that is), CPU time per callback, the number of
+#     messages per topic, and the latency stages of the nodes (receive and publish are in virtual time)
+
+# usage: replay_vision.py [seconds frame_rate [frames_dir]]
+
+import os
+import sys
+import time
+import yaml
+import numpy
+import cv2
+
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scripts"))
+
+# the bus has to be installed before the nodes are imported
+import rospy
+from local_bus import LocalBus,Install,START_TIME
+
+bus = LocalBus()
+Install(bus)
+
+from sensor_msgs.msg import Image
+from cv_bridge import CvBridge
+from r2_perception.msg import LatencyReport
+from detect_faces_haar import DetectFacesHaar
+from detect_saliency_ittikoch import DetectSaliencyIttiKoch
+from vision_pipeline import VisionPipeline
+from fusion import Fusion
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+CAMERA = "lefteye"
+NAMESPACE = "/robot/perception/"
+WIDTH = 640
+HEIGHT = 480
+SYNTHETIC_FRAMES = 100
+BLOBS = 3
+
+# fixed parameters, as in test/perception.launch
+GLOBAL_PARAMS = {
+    "session_tag": "replay",
+    "store_thumbs_flag": False,
+    "thumbs_dir": TEST_DIR,
+    "thumbs_ext": "png",
+    "haar_cascade_filename": os.path.join(TEST_DIR,"haarcascade_frontalface_alt.xml"),
+    "visualize_flag": False,
+    "thumb_width": 64,
+    "thumb_height": 64
+}
+
+opencv_bridge = CvBridge()
+
+
+# load all images of a directory
+def LoadFrames(directory):
+
+    frames = []
+    for filename in sorted(os.listdir(directory)):
+        image = cv2.imread(os.path.join(directory,filename))
+        if image is not None:
+            frames.append(image)
+    return frames
+
+
+# bright blobs moving over a noisy background
+def MakeFrames(count):
+
+    random = numpy.random.RandomState(0)
+    background = random.randint(0,64,(HEIGHT,WIDTH,3)).astype(numpy.uint8)
+    positions = random.uniform(0.0,1.0,(BLOBS,2)) * [WIDTH,HEIGHT]
+    velocities = random.uniform(-8.0,8.0,(BLOBS,2))
+    frames = []
+    for k in range(0,count):
+        image = background.copy()
+        for i in range(0,BLOBS):
+            x,y = (positions[i] + k * velocities[i]) % [WIDTH,HEIGHT]
+            cv2.circle(image,(int(x),int(y)),20,(255,255,255),-1)
+        frames.append(image)
+    return frames
+
+
+class Camera(object):
+
+
+    def __init__(self,frames,frame_rate):
+
+        self.frames = [opencv_bridge.cv2_to_imgmsg(frame,"bgr8") for frame in frames]
+        self.sent = 0
+        self.pub = rospy.Publisher(NAMESPACE + CAMERA + "/camera/image_raw",Image,queue_size=1)
+        self.timer = rospy.Timer(rospy.Duration(1.0 / frame_rate),self.HandleTimer)
+
+
+    # send the next frame, stamped with the capture time
+    def HandleTimer(self,event):
+
+        frame = self.frames[self.sent % len(self.frames)]
+        msg = Image()
+        msg.header.seq = self.sent
+        msg.header.stamp = event.current_expected
+        msg.header.frame_id = CAMERA
+        msg.height = frame.height
+        msg.width = frame.width
+        msg.encoding = frame.encoding
+        msg.is_bigendian = frame.is_bigendian
+        msg.step = frame.step
+        msg.data = frame.data
+        self.pub.publish(msg)
+        self.sent += 1
+
+
+if __name__ == '__main__':
+
+    seconds = 30.0
+    frame_rate = 30.0
+    frames_dir = None
+    if len(sys.argv) > 2:
+        seconds = float(sys.argv[1])
+        frame_rate = float(sys.argv[2])
+    if len(sys.argv) > 3:
+        frames_dir = sys.argv[3]
+
+    # parameters and camera position
+    with open(os.path.join(TEST_DIR,"perception.yaml")) as params:
+        bus.LoadParams(yaml.safe_load(params),NAMESPACE)
+    bus.LoadParams(GLOBAL_PARAMS)
+    bus.LoadParams({"fusion_rate": 20.0,"face_fuse_distance": 0.2,"face_keep_time": 1.0},NAMESPACE)
+    bus.SetTransform("world",CAMERA,(0.1,0.03,1.6),(0.0,0.0,0.0,1.0))
+
+    # the vision chain of one camera
+    bus.SetNamespace(NAMESPACE + CAMERA + "/")
+    nodes = []
+    nodes.append(DetectFacesHaar(NAMESPACE + CAMERA + "/"))
+    nodes.append(DetectSaliencyIttiKoch(NAMESPACE + CAMERA + "/"))
+    bus.SetNamespace(NAMESPACE + CAMERA + "/","vision_pipeline")
+    nodes.append(VisionPipeline())
+    bus.SetNamespace(NAMESPACE,"fusion")
+    nodes.append(Fusion())
+
+    # the frames
+    if frames_dir is not None:
+        frames = LoadFrames(frames_dir)
+        source = "{} frames from {}".format(len(frames),frames_dir)
+    else:
+        frames = MakeFrames(SYNTHETIC_FRAMES)
+        source = "{} synthetic frames".format(len(frames))
+    camera = Camera(frames,frame_rate)
+
+    # replay
+    start = time.time()
+    bus.RunUntil(START_TIME + seconds)
+    wall = time.time() - start
+    bus.Shutdown()
+
+    print "{}, {} s at {} Hz".format(source,seconds,frame_rate)
+    print "{} frames in {:.2f} s: {:.1f} frames/s, {:.1f}x real time".format(camera.sent,wall,camera.sent / wall,seconds / wall)
+
+    print
+    print "callback                                       calls   CPU (ms)  per call (ms)  of wall"
+    for name in sorted(bus.cpu,key=lambda name: -bus.cpu[name]):
+        print "{:45}  {:6}  {:9.1f}  {:13.3f}  {:6.1f}%".format(name,bus.calls[name],1000.0 * bus.cpu[name],1000.0 * bus.cpu[name] / bus.calls[name],100.0 * bus.cpu[name] / wall)
+
+    print
+    print "topic                                                    messages"
+    for topic in sorted(bus.published):
+        print "{:55}  {:9}".format(topic,bus.published[topic])
+
+    print
+    print "node             stage          count   p50 (ms)   p95 (ms)   p99 (ms)   max (ms)"
+    for node in nodes:
+        if hasattr(node,"latency"):
+            msg = LatencyReport()
+            node.latency.FillReport(msg)
+            for i in range(0,len(msg.stages)):
+                print "{:15}  {:12}  {:7}  {:9.3f}  {:9.3f}  {:9.3f}  {:9.3f}".format(msg.node,msg.stages[i],msg.counts[i],1000.0 * msg.p50[i],1000.0 * msg.p95[i],1000.0 * msg.p99[i],1000.0 * msg.max[i])